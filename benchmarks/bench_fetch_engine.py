@@ -0,0 +1,96 @@
+"""
+Benchmark: sequential requests.Session vs. fetch_engine.AsyncFetcher.
+
+Starts a few local HTTP stub servers (one per simulated news host) that answer
+every request after a fixed delay, then fetches the same URL list both ways.
+
+    python benchmarks/bench_fetch_engine.py --hosts 9 --pages 5 --delay 0.3
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "news_ai"))
+from fetch_engine import AsyncFetcher, DEFAULT_HEADERS  # noqa: E402
+
+
+def make_handler(delay):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            body = f"<html><body><a href='{self.path}'>{self.path}</a></body></html>".encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+def start_servers(count, delay):
+    servers = []
+    for _ in range(count):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(delay))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def fetch_sequential(urls):
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    results = {}
+    for url in urls:
+        response = session.get(url, timeout=30)
+        response.raise_for_status()
+        results[url] = response.text
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--hosts", type=int, default=9)
+    arg_parser.add_argument("--pages", type=int, default=5, help="paginated URLs per host")
+    arg_parser.add_argument("--delay", type=float, default=0.3, help="server latency in seconds")
+    arg_parser.add_argument("--max-concurrency", type=int, default=8)
+    arg_parser.add_argument("--per-host", type=int, default=2)
+    args = arg_parser.parse_args()
+
+    servers = start_servers(args.hosts, args.delay)
+    urls = [
+        f"http://127.0.0.1:{server.server_address[1]}/page/{page}"
+        for server in servers
+        for page in range(args.pages)
+    ]
+
+    started = time.perf_counter()
+    sequential = fetch_sequential(urls)
+    sequential_time = time.perf_counter() - started
+
+    fetcher = AsyncFetcher(max_concurrency=args.max_concurrency, per_host=args.per_host)
+    started = time.perf_counter()
+    responses = fetcher.run(urls)
+    concurrent_time = time.perf_counter() - started
+    concurrent = {url: response.text for url, response in responses.items()}
+
+    assert concurrent == sequential, "concurrent fetch returned different pages"
+    print(f"URLs fetched:           {len(urls)} ({args.hosts} hosts x {args.pages} pages, {args.delay}s latency)")
+    print(f"Sequential requests:    {sequential_time:.2f}s")
+    print(f"AsyncFetcher ({args.max_concurrency}/{args.per_host}):     {concurrent_time:.2f}s")
+    print(f"Speedup:                {sequential_time / concurrent_time:.1f}x")
+
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark: the previous BeautifulSoup clean_html vs. html_cleaner.clean_html (lxml, single pass).
+
+Runs both cleaners over saved listing pages and reports time and peak memory per page,
+plus the output size and whether both versions keep the same visible text and links.
+
+    python benchmarks/bench_html_cleaner.py pages/                 # *.html files in a directory
+    python benchmarks/bench_html_cleaner.py --fetch pages/ https://venturebeat.com/category/ai/ ...
+"""
+import argparse
+import glob
+import hashlib
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+import lxml.html
+import requests
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "news_ai"))
+from fetch_engine import DEFAULT_HEADERS  # noqa: E402
+from html_cleaner import clean_html  # noqa: E402
+
+
+def legacy_clean_html(raw_html):
+    """The BeautifulSoup cleaner previously nested in NewsScrapperGeneral.get_and_clean_html."""
+    soup = BeautifulSoup(raw_html, "html.parser")
+    for tag in soup(["script", "style", "noscript", "iframe", "svg", "path", "object",
+                   "embed", "picture", "video", "audio", "source", "input",
+                   "ins", "del", "form", "button"]):
+        tag.decompose()
+    for tag in soup.find_all():
+        if not tag.get_text(strip=True):
+            tag.decompose()
+    for tag in soup.find_all(True):
+        attrs_to_remove = ["class", "id", "role", "data-*", "aria-*", "onclick", "onload", "style"]
+        for attr in list(tag.attrs):
+            if tag.name == "a" and attr == "href":
+                continue
+            if any(re.match(pattern.replace("*", ".*"), attr) for pattern in attrs_to_remove):
+                del tag[attr]
+    cleaned_html = str(soup)
+    cleaned_html = re.sub(r">\s+<", "><", cleaned_html)
+    cleaned_html = re.sub(r"\n+", "", cleaned_html)
+    cleaned_html = re.sub(r"\s{2,}", " ", cleaned_html)
+    return cleaned_html
+
+
+def fetch_pages(directory, urls):
+    os.makedirs(directory, exist_ok=True)
+    for url in urls:
+        try:
+            response = requests.get(url, headers=DEFAULT_HEADERS, timeout=30)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"failed to fetch {url}: {e}")
+            continue
+        name = hashlib.sha256(url.encode()).hexdigest()[:12] + ".html"
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+            f.write(response.text)
+        print(f"saved {url} -> {name}")
+
+
+CLEANERS = {"bs4": legacy_clean_html, "lxml": clean_html}
+
+
+def measure(cleaner, raw_html):
+    started = time.perf_counter()
+    output = cleaner(raw_html)
+    return output, time.perf_counter() - started
+
+
+def _status_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def peak_memory(cleaner_name, path):
+    """
+    Peak RSS growth (bytes) while cleaning one page (Linux only). Runs in a fresh interpreter so that
+    pages do not reuse each other's freed memory; this also counts libxml2's C allocations, which
+    tracemalloc cannot see.
+    """
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        raw_html = f.read()
+    # Reset the high-water mark inherited from the parent process
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    baseline = _status_kb("VmRSS")
+    CLEANERS[cleaner_name](raw_html)
+    return (_status_kb("VmHWM") - baseline) * 1024
+
+
+def fingerprint(cleaned_html):
+    """Visible text and links, for comparing the two outputs independent of serialization details."""
+    if not cleaned_html:
+        return "", []
+    root = lxml.html.document_fromstring(cleaned_html)
+    text = " ".join(root.text_content().split())
+    return text, [a.get("href") for a in root.iter("a") if a.get("href")]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("pages", help="directory of saved .html pages")
+    arg_parser.add_argument("urls", nargs="*", help="listing pages to download into the directory first (with --fetch)")
+    arg_parser.add_argument("--fetch", action="store_true")
+    args = arg_parser.parse_args()
+
+    if args.fetch:
+        fetch_pages(args.pages, args.urls)
+
+    paths = sorted(glob.glob(os.path.join(args.pages, "*.html")))
+    if not paths:
+        sys.exit(f"No .html files in {args.pages}")
+
+    print(f"{'page':<20}{'raw KB':>8}{'bs4 ms':>9}{'lxml ms':>9}{'bs4 MB':>8}{'lxml MB':>9}{'out KB':>8}  same text/links")
+    totals = [0.0, 0.0, 0, 0]
+    spawn = multiprocessing.get_context("spawn")
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            raw_html = f.read()
+        old, old_time = measure(legacy_clean_html, raw_html)
+        new, new_time = measure(clean_html, raw_html)
+        with spawn.Pool(1, maxtasksperchild=1) as pool:
+            old_peak = pool.apply(peak_memory, ("bs4", path))
+        with spawn.Pool(1, maxtasksperchild=1) as pool:
+            new_peak = pool.apply(peak_memory, ("lxml", path))
+        old_text, old_links = fingerprint(old)
+        new_text, new_links = fingerprint(new)
+        same = "yes" if (old_text == new_text and old_links == new_links) else "no"
+        print(f"{os.path.basename(path)[:19]:<20}{len(raw_html) / 1024:>8.0f}{old_time * 1000:>9.1f}{new_time * 1000:>9.1f}"
+              f"{old_peak / 2**20:>8.1f}{new_peak / 2**20:>9.1f}{len(new) / 1024:>8.0f}  {same}")
+        totals[0] += old_time
+        totals[1] += new_time
+        totals[2] = max(totals[2], old_peak)
+        totals[3] = max(totals[3], new_peak)
+
+    count = len(paths)
+    print(f"\nmean time per page:  bs4 {totals[0] / count * 1000:.1f} ms, lxml {totals[1] / count * 1000:.1f} ms "
+          f"({totals[0] / totals[1]:.1f}x faster)")
+    print(f"max peak RSS growth: bs4 {totals[2] / 2**20:.1f} MB, lxml {totals[3] / 2**20:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark: one SMTP connection per message (the old SendNewsletter.send_email) vs. smtp_pool.SMTPPool.
+
+Starts a local aiosmtpd sink that accepts and counts every message. The handshake delay is added to
+every EHLO, standing in for the STARTTLS and LOGIN round trips to a remote server; the data delay is
+added to every accepted message. Some messages can be answered with 421 first, to exercise reconnects.
+
+    pip install aiosmtpd
+    python benchmarks/bench_smtp_pool.py --messages 500 --pool-size 4 --handshake-delay 0.05 --data-delay 0.005
+"""
+import argparse
+import asyncio
+import os
+import smtplib
+import socket
+import sys
+import time
+from email.mime.text import MIMEText
+
+from aiosmtpd.controller import Controller
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "news_ai"))
+from smtp_pool import SMTPPool  # noqa: E402
+
+SENDER = "newsletter@example.com"
+
+
+class SinkHandler:
+    def __init__(self, handshake_delay, data_delay, fail_every):
+        self.handshake_delay = handshake_delay
+        self.data_delay = data_delay
+        self.fail_every = fail_every
+        self.received = 0
+        self.seen = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        await asyncio.sleep(self.handshake_delay)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.data_delay)
+        self.seen += 1
+        if self.fail_every and self.seen % self.fail_every == 0:
+            return "421 Service not available, closing transmission channel"
+        self.received += 1
+        return "250 Message accepted for delivery"
+
+
+def build_messages(count, size):
+    body = "<html><body>" + "<p>newsletter</p>\n" * (size // 18) + "</body></html>"
+    messages = []
+    for index in range(count):
+        recipient = f"reader{index}@example.com"
+        msg = MIMEText(body, "html")
+        msg["Subject"] = "Benchmark edition"
+        msg["From"] = SENDER
+        msg["To"] = recipient
+        messages.append((SENDER, recipient, msg.as_string()))
+    return messages
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def send_per_connection(port, messages):
+    for sender, recipient, message in messages:
+        server = smtplib.SMTP("127.0.0.1", port)
+        server.ehlo()
+        server.sendmail(sender, recipient, message)
+        server.quit()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--messages", type=int, default=500)
+    arg_parser.add_argument("--size", type=int, default=40000, help="approximate HTML bytes per message")
+    arg_parser.add_argument("--pool-size", type=int, default=4)
+    arg_parser.add_argument("--handshake-delay", type=float, default=0.05, help="seconds added to every EHLO")
+    arg_parser.add_argument("--data-delay", type=float, default=0.005, help="seconds added to every message")
+    arg_parser.add_argument("--fail-every", type=int, default=0, help="answer every Nth pooled message with 421")
+    args = arg_parser.parse_args()
+
+    messages = build_messages(args.messages, args.size)
+
+    handler = SinkHandler(args.handshake_delay, args.data_delay, 0)
+    port = free_port()
+    controller = Controller(handler, hostname="127.0.0.1", port=port, data_size_limit=None)
+    controller.start()
+    try:
+        started = time.perf_counter()
+        send_per_connection(port, messages)
+        per_connection_time = time.perf_counter() - started
+        per_connection_received = handler.received
+
+        runs = []
+        for pool_size in sorted({1, args.pool_size}):
+            handler.received, handler.seen, handler.fail_every = 0, 0, args.fail_every
+            pool = SMTPPool("127.0.0.1", port, size=pool_size, starttls=False, base_delay=0.01)
+            started = time.perf_counter()
+            results = pool.send_all(messages)
+            elapsed = time.perf_counter() - started
+            pool.close()
+            runs.append((pool_size, elapsed, handler.received, results.count(None), pool.connections, pool.retries))
+    finally:
+        controller.stop()
+
+    print(f"{len(messages)} messages of ~{args.size // 1000} kB, handshake {args.handshake_delay * 1000:.0f} ms, "
+          f"data {args.data_delay * 1000:.0f} ms")
+    print(f"{'mode':<28}{'seconds':>9}{'msg/s':>9}{'received':>10}{'connections':>13}{'retries':>9}")
+    print(f"{'connection per message':<28}{per_connection_time:>9.2f}{len(messages) / per_connection_time:>9.1f}"
+          f"{per_connection_received:>10}{len(messages):>13}{0:>9}")
+    for pool_size, elapsed, received, delivered, connections, retries in runs:
+        print(f"{f'SMTPPool(size={pool_size})':<28}{elapsed:>9.2f}{len(messages) / elapsed:>9.1f}"
+              f"{received:>10}{connections:>13}{retries:>9}")
+        if delivered != len(messages):
+            sys.exit(f"SMTPPool(size={pool_size}) failed to deliver {len(messages) - delivered} messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Coverage check: the previous html_content[:100000] truncation vs. html_chunker.chunk_html.
+
+For each fixture page, counts how many of the expected article links actually reach the LLM,
+i.e. appear in the truncated payload or in at least one chunk, and how many chunks (API calls)
+the page needs. No API calls are made.
+
+A fixture is a saved listing page <name>.html, optionally with <name>.links.json holding the
+list of expected article links (absolute URLs). Without it, every link on the cleaned page counts.
+
+    python benchmarks/chunk_coverage.py fixtures/ --page-url https://venturebeat.com/category/ai/
+    python benchmarks/chunk_coverage.py fixtures/ --chunk-tokens 4000
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "news_ai"))
+from html_chunker import DEFAULT_CHUNK_TOKENS, chunk_html, estimate_tokens  # noqa: E402
+from html_cleaner import clean_html  # noqa: E402
+from link_diff import extract_links  # noqa: E402
+
+LEGACY_LIMIT = 100000
+
+
+def covered(expected, payloads, page_url):
+    seen = set()
+    for payload in payloads:
+        seen.update(extract_links(payload, page_url))
+    return len(set(expected) & seen)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("fixtures", help="directory of <name>.html pages and optional <name>.links.json files")
+    arg_parser.add_argument("--page-url", default="https://example.com/", help="base URL for resolving relative links")
+    arg_parser.add_argument("--chunk-tokens", type=int, default=DEFAULT_CHUNK_TOKENS)
+    args = arg_parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.fixtures, "*.html")))
+    if not paths:
+        sys.exit(f"No .html files in {args.fixtures}")
+
+    print(f"{'page':<24}{'clean KB':>9}{'links':>7}{'truncated':>11}{'chunked':>9}{'chunks':>8}{'max tok':>9}")
+    totals = [0, 0, 0, 0]
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            cleaned = clean_html(f.read())
+        links_path = path[:-len(".html")] + ".links.json"
+        if os.path.exists(links_path):
+            with open(links_path, encoding="utf-8") as f:
+                expected = json.load(f)
+        else:
+            expected = extract_links(cleaned, args.page_url)
+        if not expected:
+            continue
+
+        chunks = chunk_html(cleaned, max_tokens=args.chunk_tokens)
+        truncated_hits = covered(expected, [cleaned[:LEGACY_LIMIT]], args.page_url)
+        chunked_hits = covered(expected, chunks, args.page_url)
+        print(f"{os.path.basename(path)[:23]:<24}{len(cleaned) / 1024:>9.0f}{len(expected):>7}"
+              f"{truncated_hits / len(expected):>11.1%}{chunked_hits / len(expected):>9.1%}"
+              f"{len(chunks):>8}{max(estimate_tokens(chunk) for chunk in chunks):>9}")
+        totals[0] += len(expected)
+        totals[1] += truncated_hits
+        totals[2] += chunked_hits
+        totals[3] += len(chunks)
+
+    if not totals[0]:
+        sys.exit("No expected links found in the fixtures")
+    print(f"\nlink coverage: truncated {totals[1] / totals[0]:.1%}, chunked {totals[2] / totals[0]:.1%} "
+          f"({totals[3]} LLM calls for {len(paths)} pages)")
+
+
+if __name__ == "__main__":
+    main()
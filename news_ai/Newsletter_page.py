@@ -1,7 +1,8 @@
 import psycopg2
-from flask import Flask, render_template, request, jsonify, send_file, Blueprint
+from flask import Flask, render_template, request, jsonify, send_file, Blueprint, url_for
 from datetime import datetime
 from Welcome_send import send_welcome_email_to_user 
+from newsletter_images import cid_to_url
 import os
 from dotenv import load_dotenv
 from urllib.parse import urlparse
@@ -87,8 +88,11 @@ def index():
 def modify_html_for_web(html):
     """
     Modify the newsletter HTML for web viewing.
-    Specifically, replace the email-specific subscription text with web-appropriate text.
+    Specifically, replace the email-specific subscription text with web-appropriate text,
+    and load images attached by Content-ID from this app's static folder.
     """
+    html = cid_to_url(html, url_for('static', filename=''))
+    
     # Pattern to match the subscription container div with the email-specific text
     pattern = r'<div class="subscribe-container">\s*Update your email preferences or unsubscribe\s*<a href="[^"]*" target="_blank" rel="noopener nofollow">here</a>\.\s*</div>'
     
@@ -1,11 +1,16 @@
-import smtplib
+import argparse
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 import psycopg2
 import psycopg2.extras
 from urllib.parse import urlparse, quote
 import os
+import time
 from dotenv import load_dotenv
+from smtp_pool import DEFAULT_POOL_SIZE, SMTPPool
+from delivery_queue import MAX_RETRY_WAIT, DeliveryQueue
+from segments import segment_key
+from newsletter_images import attach_images, cid_keys
 
 # Define the base directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -20,56 +25,127 @@ class SendNewsletter:
             cursor_factory=psycopg2.extras.RealDictCursor,
         )
 
-    def get_subscribers(self):
-        conn = self.conn      
-        cursor = conn.cursor()
-        cursor.execute("SELECT email FROM subscriber")
-        rows = cursor.fetchall()
-        return [row.get('email') for row in rows]
+    def latest_newsletter(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT newsletter_id, html FROM newsletter order by creation desc limit 1")
+        return cursor.fetchone()
 
-    def send_email(self, recipient, subject):
-        conn = self.conn
-        cursor = conn.cursor()
-        cursor.execute("SELECT html FROM newsletter order by creation desc limit 1")
-        html_row = cursor.fetchone()
-        html_content = html_row['html']
-        
+    def newsletter(self, newsletter_id):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT newsletter_id, html FROM newsletter WHERE newsletter_id = %s", (newsletter_id,))
+        return cursor.fetchone()
+
+    def segment_variants(self, newsletter_id):
+        """
+        The edition's pre-rendered variants by preference segment key (see generate_newsletter.py's
+        render_segment_variants); subscribers of other segments get the edition itself.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT to_regclass('newsletter_variant') AS known")
+        if cursor.fetchone()['known'] is None:
+            return {}
+        cursor.execute("SELECT segment_key, html FROM newsletter_variant WHERE newsletter_id = %s", (newsletter_id,))
+        return {row['segment_key']: row['html'] for row in cursor.fetchall()}
+
+    def build_email(self, html_content, sender, recipient, subject):
         # Only replace the email placeholder
         replaced_html = html_content.replace("{EMAIL}", quote(recipient))
 
-        # Email configuration from environment variables
-        sender = os.environ.get("EMAIL_SENDER", "newsletter@homesmartify.lu")
-        password = os.environ.get("EMAIL_PASSWORD")
-        smtp_server = os.environ.get("SMTP_SERVER", "smtp.openxchange.eu")
-        smtp_port = int(os.environ.get("SMTP_PORT", 587))
-
         # Create message container
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = sender
-        msg['To'] = recipient
+        body = MIMEMultipart('alternative')
 
         # Plain-text fallback
         text_part = MIMEText("Plain text fallback here", 'plain')
-        msg.attach(text_part)
+        body.attach(text_part)
         
         # HTML part
         html_part = MIMEText(replaced_html, 'html')
-        msg.attach(html_part)
+        body.attach(html_part)
 
-        # Connect to SMTP server and send email
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender, password)
-        server.sendmail(sender, recipient, msg.as_string())
-        server.quit()
+        # Images the HTML references by Content-ID go once each into a multipart/related wrapper
+        if cid_keys(replaced_html):
+            msg = MIMEMultipart('related')
+            msg.attach(body)
+            attach_images(msg, replaced_html)
+        else:
+            msg = body
+        msg['Subject'] = subject
+        msg['From'] = sender
+        msg['To'] = recipient
+        return msg.as_string()
 
-    def send_newsletter(self):
-        subscribers = self.get_subscribers()
+    def send_newsletter(self, retry_failed=False):
+        """
+        Send the latest edition through its delivery queue (see delivery_queue.py): only subscribers it has
+        not been delivered to yet are sent to, so an interrupted run is resumed by running it again, and
+        several processes can send the same edition in parallel. Deliveries that failed transiently are
+        retried once their backoff is over, waiting at most MAX_RETRY_WAIT for the next one; the pending
+        deliveries of earlier editions, left by earlier runs, are sent too. retry_failed also resends the
+        deliveries of the latest edition that failed permanently.
+        """
         subject = "DeepTech Digest: Your AI News Update"
-        for email in subscribers:  
-            self.send_email(email, subject)
-            print(f"Newsletter to {email} has been sent.")
+        newsletter_id = self.latest_newsletter()['newsletter_id']
+
+        deliveries = DeliveryQueue(self.conn, "newsletter_delivery", "newsletter", "subscriber")
+        message_bytes = message_count = 0
+        if retry_failed:
+            print(f"🔁 {deliveries.retry_failed(newsletter_id)} failed deliveries queued again")
+        print(f"📋 {deliveries.enqueue(newsletter_id)} new subscribers queued for edition {newsletter_id}")
+
+        # Each edition with pending deliveries is loaded once for all its recipients, the oldest first
+        editions = {}
+        for edition_id in dict.fromkeys(deliveries.pending_editions() + [newsletter_id]):
+            editions[edition_id] = (self.newsletter(edition_id)['html'], self.segment_variants(edition_id))
+            print(f"🧩 Edition {edition_id}: {len(editions[edition_id][1])} preference segment variants")
+
+        # Email configuration from environment variables
+        sender = os.environ.get("EMAIL_SENDER", "newsletter@homesmartify.lu")
+        password = os.environ.get("EMAIL_PASSWORD")
+        smtp_server = os.environ.get("SMTP_SERVER", "smtp.openxchange.eu")
+        smtp_port = int(os.environ.get("SMTP_PORT", 587))
+
+        # A few authenticated sessions, reused for all messages and sending concurrently
+        with SMTPPool(smtp_server, smtp_port, sender, password,
+                      size=int(os.environ.get("SMTP_POOL_SIZE", DEFAULT_POOL_SIZE))) as pool:
+            while True:
+                for edition_id in editions:
+                    claimed = deliveries.claim(edition_id)
+                    if claimed:
+                        break
+                if not claimed:
+                    # Nothing due: wait for the next transient failure to come due, unless that is too far off
+                    wait = deliveries.seconds_until_due(editions)
+                    if wait is None or wait > MAX_RETRY_WAIT:
+                        break
+                    print(f"⏳ Waiting {wait:.0f}s for the next retry")
+                    time.sleep(wait)
+                    continue
+                html_content, variants = editions[edition_id]
+                messages = [(sender, row['email'],
+                             self.build_email(variants.get(segment_key(row['preferences']), html_content),
+                                              sender, row['email'], subject))
+                            for row in claimed]
+                message_bytes += sum(len(message) for _, _, message in messages)
+                message_count += len(messages)
+                results = pool.send_all(messages)
+                for row, error in zip(claimed, results):
+                    if error is None:
+                        print(f"Newsletter to {row['email']} has been sent.")
+                    elif error is not pool.fatal:
+                        print(f"❌ Failed to send newsletter to {row['email']}: {error}")
+                # Deliveries the SMTP server could not even be reached for stay pending
+                deliveries.record(edition_id, [(row['subscriber_id'], error)
+                                               for row, error in zip(claimed, results) if error is None or error is not pool.fatal])
+                if pool.fatal is not None:
+                    print(f"❌ Cannot send through {smtp_server}: {pool.fatal}; the remaining deliveries stay queued")
+                    break
+        for edition_id in editions:
+            counts = deliveries.counts(edition_id)
+            print(f"📨 Edition {edition_id}: {counts.get('sent', 0)} sent, {counts.get('pending', 0)} pending, "
+                  f"{counts.get('failed', 0)} failed")
+        print(f"🔌 {pool.connections} SMTP connections ({pool.retries} retries)")
+        if message_count:
+            print(f"📦 Average message size: {message_bytes // message_count} bytes")
 
 if __name__ == "__main__":    
     load_dotenv()
@@ -83,5 +159,8 @@ if __name__ == "__main__":
         "password": parsed_url.password,
         "host": parsed_url.hostname,
     }
+    arg_parser = argparse.ArgumentParser(description="Send the latest newsletter to every subscriber.")
+    arg_parser.add_argument("--retry-failed", action="store_true", help="also resend deliveries that failed permanently")
+    args = arg_parser.parse_args()
     newsletter_sender = SendNewsletter(db_config)
-    newsletter_sender.send_newsletter()
+    newsletter_sender.send_newsletter(retry_failed=args.retry_failed)
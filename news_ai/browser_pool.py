@@ -0,0 +1,206 @@
+import os
+import re
+import queue
+import subprocess
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+import undetected_chromedriver as uc
+
+
+CHROME_ARGUMENTS = [
+    "--headless=new",
+    "--disable-blink-features=AutomationControlled",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--window-size=1920,1080",
+    "--disable-setuid-sandbox",
+    "--disable-extensions",
+    "--disable-infobars",
+    "--single-process",
+    "--disable-dev-tools",
+    "--ignore-certificate-errors",
+    "--homedir=/tmp",
+]
+
+# Used when the installed Chrome version cannot be detected
+FALLBACK_CHROME_MAJOR_VERSION = 114
+
+
+def build_chrome_options(remote_debugging_port=None):
+    """
+    Build a fresh ChromeOptions object (undetected_chromedriver refuses to reuse one).
+    Pooled drivers leave remote_debugging_port unset so that every browser gets its own free port.
+    """
+    options = uc.ChromeOptions()
+    for argument in CHROME_ARGUMENTS:
+        options.add_argument(argument)
+    if remote_debugging_port:
+        options.add_argument(f"--remote-debugging-port={remote_debugging_port}")
+    return options
+
+
+@lru_cache(maxsize=1)
+def detect_chrome_major_version():
+    """
+    Probe the installed Chrome version once per process and return its major version (or None).
+    """
+    version_output = ""
+    try:
+        if os.name == 'nt':  # Windows
+            process = subprocess.Popen(
+                'reg query "HKEY_CURRENT_USER\\Software\\Google\\Chrome\\BLBeacon" /v version',
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True
+            )
+            output, error = process.communicate()
+            version_output = output.decode('utf-8')
+            chrome_version = re.search(r'version\s+REG_SZ\s+([\d.]+)', version_output).group(1)
+        else:  # Linux/Mac
+            process = subprocess.Popen(
+                'google-chrome --version',
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True
+            )
+            output, error = process.communicate()
+            version_output = output.decode('utf-8')
+            chrome_version = re.search(r'Chrome\s+([\d.]+)', version_output).group(1)
+
+        main_version = int(chrome_version.split('.')[0])
+        print(f"Detected Chrome version: {chrome_version} (Main: {main_version})")
+        return main_version
+    except Exception as version_error:
+        print(f"⚠️ Error detecting Chrome version: {version_error}")
+        print(f"Version output: {version_output}")
+        return None
+
+
+def create_driver(remote_debugging_port=None):
+    """
+    Start an undetected Chrome driver, retrying with an explicit major version if the default setup fails.
+    """
+    try:
+        return uc.Chrome(options=build_chrome_options(remote_debugging_port), use_subprocess=True)
+    except Exception as chrome_error:
+        print(f"⚠️ Error with default Chrome setup: {chrome_error}")
+        print("Trying with explicit version handling...")
+        version_main = detect_chrome_major_version() or FALLBACK_CHROME_MAJOR_VERSION
+        return uc.Chrome(
+            options=build_chrome_options(remote_debugging_port),
+            version_main=version_main,
+            use_subprocess=True,
+        )
+
+
+class BrowserPool:
+    """
+    A small pool of warm headless Chrome drivers for the Selenium fallback path.
+      - Drivers are started lazily, at most `size` of them.
+      - A driver is health-checked before it is handed out and replaced if it died.
+      - A driver is recycled (quit and replaced on demand) after `max_pages` page loads,
+        which keeps Chrome's memory growth in check.
+    """
+
+    def __init__(self, size=2, max_pages=25, page_load_timeout=60):
+        self.size = size
+        self.max_pages = max_pages
+        self.page_load_timeout = page_load_timeout
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = 0
+        self._closed = False
+
+    def _start_driver(self):
+        driver = create_driver()
+        driver.set_page_load_timeout(self.page_load_timeout)
+        return {"driver": driver, "pages": 0}
+
+    @staticmethod
+    def _is_healthy(entry):
+        try:
+            return entry["driver"].execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def _discard(self, entry):
+        try:
+            entry["driver"].quit()
+        except Exception:
+            pass
+        with self._lock:
+            self._started -= 1
+
+    def _take(self):
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                can_start = self._started < self.size
+                if can_start:
+                    self._started += 1
+            if can_start:
+                try:
+                    return self._start_driver()
+                except Exception:
+                    with self._lock:
+                        self._started -= 1
+                    raise
+            # Every driver is busy; wait for one to come back (or to be recycled, freeing a slot)
+            try:
+                return self._idle.get(timeout=1)
+            except queue.Empty:
+                continue
+
+    def warm(self, count=None):
+        """
+        Start drivers up front so that the first fallback fetches do not pay for a browser launch.
+        """
+        entries = []
+        for _ in range(min(count or self.size, self.size)):
+            entries.append(self._take())
+        for entry in entries:
+            self._idle.put(entry)
+
+    @contextmanager
+    def driver(self):
+        """
+        Borrow a healthy driver: `with pool.driver() as driver: driver.get(url)`.
+        """
+        if self._closed:
+            raise RuntimeError("BrowserPool is closed")
+        entry = self._take()
+        while not self._is_healthy(entry):
+            print("⚠️ Pooled Chrome driver failed its health check, replacing it.")
+            self._discard(entry)
+            entry = self._take()
+
+        failed = False
+        try:
+            yield entry["driver"]
+        except Exception:
+            failed = True
+            raise
+        finally:
+            entry["pages"] += 1
+            if self._closed or entry["pages"] >= self.max_pages or (failed and not self._is_healthy(entry)):
+                self._discard(entry)
+            else:
+                self._idle.put(entry)
+
+    def fetch(self, url):
+        """
+        Load a URL in a pooled browser and return the rendered page source.
+        """
+        with self.driver() as driver:
+            driver.get(url)
+            return driver.page_source
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(entry)
@@ -1,7 +1,7 @@
 import json
 import requests
-from pydantic import BaseModel, Field
-from typing import List
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, List
 from urllib.parse import urljoin
 import time
 from selenium.webdriver.common.by import By
@@ -14,13 +14,84 @@ import os
 from urllib.parse import urlparse
 import openai
 from dotenv import load_dotenv
+from html_chunker import estimate_tokens
+from batch_jobs import BatchRunner, create_backend
+from llm_cache import open_cache
+from category_classifier import CategoryClassifier
 
 
+# Batch mode: several articles per request, within these limits
+BATCH_MAX_ARTICLES = 8
+BATCH_TOKEN_BUDGET = 12000
+OUTPUT_TOKENS_PER_ARTICLE = 450
+SINGLE_MAX_TOKENS = 10000
+# Bump when the meaning of the extraction answers changes, so cached answers are not reused (see llm_cache.py)
+CATEGORIZATION_PROMPT_VERSION = 2
+# Keywords and summary of the articles the local pre-classifier categorizes, from a smaller model
+SUMMARY_MODEL = "gpt-4o-mini"
+SUMMARY_MAX_TOKENS = 400
+SUMMARY_PROMPT_VERSION = 1
+
+# Offline mode (LLM_BATCH_BACKEND=openai|local): requests go through the Batch API instead
+BATCH_JOBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".batch_jobs")
+
+# Influence criteria scored in the categorization pass; InfluentialFactor is their weighted sum
+SCORE_WEIGHTS = {
+    "PSI": 0.30,   # Public & Social Impact
+    "ITP": 0.25,   # Industry Transformation Potential
+    "TBS": 0.20,   # Technological Breakthrough Significance
+    "GRI": 0.10,   # Governance & Regulation Influence
+    "VMB": 0.10,   # Virality & Media Buzz
+    "LSSI": 0.05,  # Long-Term Societal Shift Indicator
+}
+
+BATCH_INSTRUCTIONS = """
+
+            📦 **Batch mode:** the user message holds several articles, each starting with a line `### ARTICLE <id>`.
+            Return one JSON object of the form
+            {"articles": [{"id": "<id>", "keywords": [...], "main_category": "...", "summary": "...", "scores": {...}}, ...]}
+            with exactly one entry per article, using the ids as given.
+"""
+
+
+def strip_code_fences(text):
+    """Remove markdown code fences around a JSON reply, if present."""
+    text = text.strip()
+    if text.startswith("```"):
+        lines = text.splitlines()
+        if lines[0].startswith("```"):
+            lines = lines[1:]
+        if lines and lines[-1].startswith("```"):
+            lines = lines[:-1]
+        text = "\n".join(lines).strip()
+    return text
+
+
+def influential_factor(scores) -> float:
+    """InfluentialFactor of an article: the weighted sum of its criterion scores, rounded like the LLM's."""
+    return round(sum(weight * getattr(scores, name) for name, weight in SCORE_WEIGHTS.items()), 2)
+
+
+# Influence criterion scores, each between 0 and 1
+class InfluenceScores(BaseModel):
+    PSI: float = Field(..., ge=0, le=1, description="Public & Social Impact.")
+    ITP: float = Field(..., ge=0, le=1, description="Industry Transformation Potential.")
+    TBS: float = Field(..., ge=0, le=1, description="Technological Breakthrough Significance.")
+    GRI: float = Field(..., ge=0, le=1, description="Governance & Regulation Influence.")
+    VMB: float = Field(..., ge=0, le=1, description="Virality & Media Buzz.")
+    LSSI: float = Field(..., ge=0, le=1, description="Long-Term Societal Shift Indicator.")
+
 # Define the Pydantic model for extraction response
 class ArticleExtractionResponse(BaseModel):
     keywords: List[str] = Field(..., description="Keywords extracted from the article.")
     main_category: str = Field(..., description="The main category of the article.")
     summary: str = Field(..., description="A brief summary of the article in a personal blogger's style.")
+    scores: InfluenceScores = Field(..., description="The influence criterion scores of the article.")
+
+# Keywords and summary only, for articles categorized by the local pre-classifier
+class ArticleSummaryResponse(BaseModel):
+    keywords: List[str] = Field(..., description="Keywords extracted from the article.")
+    summary: str = Field(..., description="A brief summary of the article in a personal blogger's style.")
 
 class ArticleExtractor:
     def __init__(self, db_config: dict):
@@ -43,13 +114,33 @@ class ArticleExtractor:
             6. Market Trends, Funding & Investment
             7. Tools, Platforms & Developer Ecosystem
             - **Summary:** Provide an engaging, human-style summary (~3–5 sentences) like a blogger or tech journalist. Focus on **why it matters**, who’s involved, and the **impact on society, work, or innovation**.
+            - **Scores:** Rate the article's potential influence or popularity from 0 to 1 (two decimals) on each criterion:
+            PSI (Public & Social Impact): Does this article highlight changes in how people live, work, learn, or interact due to AI? Look for shifts in behavior, mass adoption, or ethical/social debates.
+            ITP (Industry Transformation Potential): Does the article describe AI affecting a major industry (e.g., healthcare, finance, education, manufacturing)? Consider scale, disruption potential, or cross-sector relevance.
+            TBS (Technological Breakthrough Significance): Does it feature novel capabilities, architectures, or models (e.g., new LLMs, multimodal models)? Evaluate its innovation level and technical leap.
+            GRI (Governance & Regulation Influence): Does it involve AI-related policies, bans, global alignment, or government frameworks? Consider international attention, legal implications, and political interest.
+            VMB (Virality & Media Buzz): Is the topic trending, meme-worthy, emotionally provocative, or viral on social platforms? Think about shareability, outrage factor, or media attention.
+            LSSI (Long-Term Societal Shift Indicator): Could this news indicate a deep, lasting shift in human-AI relations or infrastructure? Assess ideological, educational, or systemic changes.
 
             ❌ **Strict Rules:**
             - The `main_category` **must be one of the provided categories**.
             - If the main category **does not match any of the predefined categories**, choose `"AI in Daily Life"` as a fallback.
+            - Return one JSON object with the keys `keywords`, `main_category`, `summary` and `scores`, where `scores` is {"PSI": 0.0, "ITP": 0.0, "TBS": 0.0, "GRI": 0.0, "VMB": 0.0, "LSSI": 0.0} filled in.
+        """
+
+        # The same keyword and summary guidelines, for the articles the local pre-classifier categorizes
+        self.summary_prompt = """
+            You are an AI assistant for article summarization. Analyze the article and return one JSON object with the keys `keywords` and `summary`.
+
+            📌 **Guidelines:**
+            - **Keywords:** Extract relevant terms from the article.
+            - **Summary:** Provide an engaging, human-style summary (~3–5 sentences) like a blogger or tech journalist. Focus on **why it matters**, who’s involved, and the **impact on society, work, or innovation**.
         """
         
         self.client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        self.llm_cache = open_cache("llm_cache", label="LLM response")
+        # Local pre-classifier; None until category_classifier.py has been trained
+        self.classifier = CategoryClassifier.load()
         # Connect to the PostgreSQL database.
         self.conn = psycopg2.connect(
             dbname=db_config["dbname"],
@@ -59,44 +150,29 @@ class ArticleExtractor:
             cursor_factory=psycopg2.extras.RealDictCursor
         )
 
+    def _extraction_request(self, article_text: str) -> dict:
+        """
+        Keyword arguments for chat.completions.create that extract one article; shared by the
+        synchronous path and the offline batch files.
+        """
+        return {
+            "model": "gpt-4o",
+            "messages": [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": article_text},
+            ],
+            "max_tokens": SINGLE_MAX_TOKENS,
+            "temperature": 0.1,
+            "response_format": {"type": "json_object"},
+        }
+
     def _call_llm(self, article_text: str) -> ArticleExtractionResponse:
         """
-        Call the Corcel API (using streaming) with the GPT-4o model and return the parsed extraction response.
+        Call the OpenAI API with the GPT-4o model and return the parsed extraction response.
         """
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": article_text},
-        ]
-        
         try: 
-            # Create a streaming response
-            stream = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=messages,
-                max_tokens=10000,
-                temperature=0.1,
-                stream=True,
-                response_format={"type": "json_object"}
-            )
-
-            accumulated_chunks = []
-
-            # Process the streaming response
-            for chunk in stream:
-                if chunk.choices and chunk.choices[0].delta.content is not None:
-                    accumulated_chunks.append(chunk.choices[0].delta.content)
-
-            # Join accumulated JSON chunks to form a complete JSON string
-            extracted_text = "".join(accumulated_chunks).strip()
-
-            # Remove markdown code fences if present
-            if extracted_text.startswith("```"):
-                lines = extracted_text.splitlines()
-                if lines[0].startswith("```"):
-                    lines = lines[1:]
-                if lines and lines[-1].startswith("```"):
-                    lines = lines[:-1]
-                extracted_text = "\n".join(lines).strip()
+            response = self.client.chat.completions.create(**self._extraction_request(article_text))
+            extracted_text = strip_code_fences(response.choices[0].message.content)
 
             # Debugging output (print extracted text)
             print("📝 Extracted JSON Text:", extracted_text)
@@ -105,6 +181,7 @@ class ArticleExtractor:
             try:
                 parsed_response = json.loads(extracted_text)
                 extraction = ArticleExtractionResponse(**parsed_response)
+                self._remember(article_text, extraction)
                 return extraction
             except Exception as e:
                 raise Exception(f"⚠ Failed to parse LLM response for categorization: {str(e)}. Extracted text: {extracted_text}")
@@ -112,49 +189,257 @@ class ArticleExtractor:
         except Exception as e:
             raise Exception(f"Calling API error for categorization: {str(e)}")
 
+    def _cached_extraction(self, article_text: str):
+        """
+        The extraction of an identical article from the LLM response cache, or None.
+        """
+        extracted_text = self.llm_cache.get(self._extraction_request(article_text), CATEGORIZATION_PROMPT_VERSION)
+        if extracted_text is None:
+            return None
+        try:
+            return ArticleExtractionResponse(**json.loads(extracted_text))
+        except (ValueError, ValidationError):
+            self.llm_cache.discard(self._extraction_request(article_text), CATEGORIZATION_PROMPT_VERSION)
+            return None
+
+    def _remember(self, article_text: str, extraction: ArticleExtractionResponse):
+        """
+        Cache a validated extraction under the single-article request, whichever call produced it,
+        so the article is never sent again; batch answers are stored per article too.
+        """
+        self.llm_cache.put(
+            self._extraction_request(article_text),
+            CATEGORIZATION_PROMPT_VERSION,
+            json.dumps(extraction.dict())
+        )
+
+    def _call_llm_batch(self, articles: Dict[str, str]) -> Dict[str, ArticleExtractionResponse]:
+        """
+        Extract several articles with one JSON-mode request, so the system prompt is paid once per batch.
+        Returns {article id: ArticleExtractionResponse} for the items that came back valid; missing or
+        invalid items are left out for the caller to retry with single calls.
+        """
+        user_content = "\n\n".join(f"### ARTICLE {article_id}\n{text}" for article_id, text in articles.items())
+        response = self.client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": self.system_prompt + BATCH_INSTRUCTIONS},
+                {"role": "user", "content": user_content},
+            ],
+            max_tokens=OUTPUT_TOKENS_PER_ARTICLE * len(articles),
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
+        payload = json.loads(strip_code_fences(response.choices[0].message.content))
+        items = payload.get("articles", []) if isinstance(payload, dict) else payload
+
+        extractions = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            article_id = str(item.get("id"))
+            if article_id not in articles or article_id in extractions:
+                continue
+            try:
+                extractions[article_id] = ArticleExtractionResponse(**item)
+            except ValidationError as e:
+                print(f"⚠ Invalid batch item {article_id}, it will be retried alone: {e}")
+        return extractions
+
+    def _pack_batches(self, rows):
+        """
+        Group rows into batches of at most BATCH_MAX_ARTICLES articles and BATCH_TOKEN_BUDGET estimated
+        input tokens. An article larger than the budget ends up alone and takes the single-call path.
+        """
+        batch = []
+        batch_tokens = 0
+        for row in rows:
+            tokens = estimate_tokens(row["article"] or "")
+            if batch and (len(batch) >= BATCH_MAX_ARTICLES or batch_tokens + tokens > BATCH_TOKEN_BUDGET):
+                yield batch
+                batch = []
+                batch_tokens = 0
+            batch.append(row)
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    def _summary_request(self, article_text: str) -> dict:
+        """
+        Keyword arguments for chat.completions.create that write the keywords and summary of one article.
+        """
+        return {
+            "model": SUMMARY_MODEL,
+            "messages": [
+                {"role": "system", "content": self.summary_prompt},
+                {"role": "user", "content": article_text},
+            ],
+            "max_tokens": SUMMARY_MAX_TOKENS,
+            "temperature": 0.1,
+            "response_format": {"type": "json_object"},
+        }
+
+    def _call_llm_summary(self, article_text: str) -> ArticleSummaryResponse:
+        """
+        Keywords and summary of an article from the smaller model, through the LLM response cache.
+        """
+        content = self.llm_cache.complete(self.client, self._summary_request(article_text), SUMMARY_PROMPT_VERSION)
+        try:
+            return ArticleSummaryResponse(**json.loads(strip_code_fences(content)))
+        except (ValueError, ValidationError):
+            self.llm_cache.discard(self._summary_request(article_text), SUMMARY_PROMPT_VERSION)
+            raise
+
+    def _preclassify(self, cursor, rows):
+        """
+        Categorize the articles the local classifier is confident about and return the others for the LLM.
+        The classifier only sets main_category; keywords and summary come from the smaller SUMMARY_MODEL.
+        An article whose summary call fails goes to the LLM with the others. Locally categorized articles
+        are not scored here; evaluate_articles.py picks them up.
+        """
+        if self.classifier is None or not rows:
+            return rows
+        uncertain = []
+        predictions = self.classifier.predict([row["article"] for row in rows])
+        for row, (category, confidence) in zip(rows, predictions):
+            if confidence < self.classifier.threshold:
+                uncertain.append(row)
+                continue
+            try:
+                summary = self._call_llm_summary(row["article"])
+            except Exception as e:
+                print(f"⚠ Summary of '{row['title']}' failed, it goes to the LLM: {e}")
+                uncertain.append(row)
+                continue
+            cursor.execute(
+                """
+                UPDATE news
+                SET keywords = %s, main_category = %s, summary = %s, category_source = 'classifier', categorized_at = now()
+                WHERE Title = %s
+                """,
+                (json.dumps(summary.keywords), category, summary.summary, row["title"])
+            )
+        self.conn.commit()
+        saved = len(rows) - len(uncertain)
+        print(f"🧮 Pre-classifier (threshold {self.classifier.threshold:.2f}): {saved} of {len(rows)} articles "
+              f"categorized locally, their extraction calls replaced by {SUMMARY_MODEL} summaries")
+        return uncertain
+
+    def _save_extraction(self, cursor, article_title, extraction: ArticleExtractionResponse):
+        cursor.execute(
+            """
+            UPDATE news
+            SET keywords = %s, main_category = %s, summary = %s, influence_scores = %s, InfluentialFactor = %s,
+                categorized_at = now(), scored_at = now()
+            WHERE Title = %s
+            """,
+            (json.dumps(extraction.keywords), extraction.main_category, extraction.summary,
+             json.dumps(extraction.scores.dict()), influential_factor(extraction.scores), article_title)
+        )
+        self.conn.commit()
+
     def process_articles(self):
         """
-        Extract information from articles and update the database.
+        Extract information from articles and update the database. The same pass scores the article on the
+        influence criteria, so InfluentialFactor (their weighted sum, see SCORE_WEIGHTS) is stored with the
+        category and evaluate_articles.py has nothing left to do for these rows.
+        Order per article: the LLM response cache, the local pre-classifier, then the LLM.
         """
         articles = self.load_articles()
         cursor = self.conn.cursor()
+        requests_sent = 0
+        uncached = []
 
         for row in articles:
-            article_title = row["title"]
-            article_text = row["article"]
+            extraction = self._cached_extraction(row["article"])
+            if extraction is None:
+                uncached.append(row)
+                continue
+            self._save_extraction(cursor, row["title"], extraction)
+            print(f"♻️ Processed article from the LLM response cache: {row['title']}")
 
-            try:
-                extraction = self._call_llm(article_text)
-                
-                cursor.execute(
-                    """
-                    UPDATE news
-                    SET keywords = %s, main_category = %s, summary = %s
-                    WHERE Title = %s
-                    """,
-                    (json.dumps(extraction.keywords), extraction.main_category, extraction.summary, article_title)
-                )
-                self.conn.commit()
-                print(f"✅ Processed article: {article_title}")
-            except Exception as e:
-                print(f"❌ Error processing '{article_title}': {e}")
+        uncached = self._preclassify(cursor, uncached)
+
+        for batch in self._pack_batches(uncached):
+            extractions = {}
+            if len(batch) > 1:
+                requests_sent += 1
+                try:
+                    extractions = self._call_llm_batch({str(index): row["article"] for index, row in enumerate(batch)})
+                    for index, extraction in extractions.items():
+                        self._remember(batch[int(index)]["article"], extraction)
+                    print(f"📦 Batch of {len(batch)} articles: {len(extractions)} extracted")
+                except Exception as e:
+                    print(f"⚠ Batch of {len(batch)} articles failed, falling back to single calls: {e}")
+
+            for index, row in enumerate(batch):
+                article_title = row["title"]
+                article_text = row["article"]
+
+                try:
+                    extraction = extractions.get(str(index))
+                    if extraction is None:
+                        requests_sent += 1
+                        extraction = self._call_llm(article_text)
+
+                    self._save_extraction(cursor, article_title, extraction)
+                    print(f"✅ Processed article: {article_title}")
+                except Exception as e:
+                    print(f"❌ Error processing '{article_title}': {e}")
+
+        print(f"📊 Categorized and scored {len(articles)} articles with {requests_sent} requests")
+
+    def process_articles_offline(self, backend):
+        """
+        Offline mode: collect the finished categorization batches, then submit the articles that are still
+        pending and not already in an open batch. Each cron run advances the flow by one step; results are
+        only written to rows that are still uncategorized, so re-applying a batch changes nothing.
+        """
+        runner = BatchRunner(self.conn, "batch_job", "categorization", backend)
+
+        def apply(cursor, news_id, content):
+            extraction = ArticleExtractionResponse(**json.loads(strip_code_fences(content)))
+            cursor.execute(
+                """
+                UPDATE news
+                SET keywords = %s, main_category = %s, summary = %s, influence_scores = %s, InfluentialFactor = %s,
+                    categorized_at = now(), scored_at = now()
+                WHERE news_id = %s AND categorized_at IS NULL
+                """,
+                (json.dumps(extraction.keywords), extraction.main_category, extraction.summary,
+                 json.dumps(extraction.scores.dict()), influential_factor(extraction.scores), news_id)
+            )
+
+        applied = runner.collect(apply)
+        in_flight = runner.open_news_ids()
+        articles = []
+        cursor = self.conn.cursor()
+        for row in self.load_articles():
+            if row["news_id"] in in_flight:
+                continue
+            extraction = self._cached_extraction(row["article"])
+            if extraction is None:
+                articles.append(row)
+            else:
+                self._save_extraction(cursor, row["title"], extraction)
+        articles = self._preclassify(cursor, articles)
+        if articles:
+            runner.submit([(row["news_id"], self._extraction_request(row["article"])) for row in articles])
+        print(f"📊 Applied {applied} categorizations, submitted {len(articles)} articles, {len(in_flight)} still in flight")
 
     def load_articles(self):
-        """Load articles missing extracted data."""
+        """Load the enriched articles that have not been categorized yet (partial index on categorized_at)."""
         cursor = self.conn.cursor()
-        # Delete the row where article is empty
-        cursor.execute("""
-            DELETE FROM news WHERE article IS NULL
-        """)
-        # Select articles where extracted
+        # Rows without an article text are never claimed: enrichment either stores the text or deletes the row
         cursor.execute("""
-            SELECT Title, article FROM news 
-            WHERE summary IS NULL OR keywords IS NULL OR main_category IS NULL
+            SELECT news_id, Title, article FROM news 
+            WHERE categorized_at IS NULL AND enriched_at IS NOT NULL
         """)
         return cursor.fetchall()
 
     def close(self):
-        """Close the database connection."""
+        """Close the database connection and the LLM response cache."""
+        self.llm_cache.close()
         self.conn.close()
 
 
@@ -172,7 +457,13 @@ if __name__ == "__main__":
     }
     
     extractor = ArticleExtractor(db_config=db_config)
+    batch_backend = os.environ.get("LLM_BATCH_BACKEND")
     try:
-        extractor.process_articles()
+        if batch_backend:
+            extractor.process_articles_offline(
+                create_backend(batch_backend, os.environ.get("LLM_BATCH_DIR", BATCH_JOBS_DIR), client=extractor.client)
+            )
+        else:
+            extractor.process_articles()
     finally:
         extractor.close()
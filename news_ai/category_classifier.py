@@ -0,0 +1,150 @@
+import argparse
+import os
+from collections import Counter
+from urllib.parse import urlparse
+import joblib
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".models", "category_classifier.joblib")
+NEWS_TABLE = "news"
+DEFAULT_THRESHOLD = 0.9
+# Training needs enough LLM-labelled history; rare categories are left to the LLM
+MIN_TRAINING_ARTICLES = 200
+MIN_ARTICLES_PER_CATEGORY = 10
+REPORT_THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95)
+
+
+class CategoryClassifier:
+    """
+    CPU-only pre-classifier for ArticleExtractor: TF-IDF features of the article text and a logistic
+    regression trained on the main_category the LLM assigned to earlier articles. Articles it is at
+    least `threshold` confident about get their category without the extraction call (keywords and
+    summary then come from a smaller model); the others go to the LLM as before.
+    """
+
+    def __init__(self, pipeline, threshold=DEFAULT_THRESHOLD):
+        self.pipeline = pipeline
+        self.threshold = threshold
+
+    @classmethod
+    def train(cls, texts, labels, threshold=DEFAULT_THRESHOLD):
+        """
+        Fit on (article text, LLM category) pairs. A quarter of the history is held out first to report
+        accuracy and coverage per confidence threshold; the returned model is refit on everything.
+        """
+        counts = Counter(labels)
+        kept = [(text, label) for text, label in zip(texts, labels) if counts[label] >= MIN_ARTICLES_PER_CATEGORY]
+        if len(kept) < MIN_TRAINING_ARTICLES or len({label for _, label in kept}) < 2:
+            raise ValueError(f"Not enough labelled articles to train on ({len(kept)}, need {MIN_TRAINING_ARTICLES} in 2+ categories)")
+        texts, labels = [text for text, _ in kept], [label for _, label in kept]
+
+        train_texts, test_texts, train_labels, test_labels = train_test_split(
+            texts, labels, test_size=0.25, random_state=0, stratify=labels
+        )
+        holdout = cls(cls._pipeline().fit(train_texts, train_labels), threshold)
+        report = holdout.report(test_texts, test_labels)
+
+        return cls(cls._pipeline().fit(texts, labels), threshold), report
+
+    @staticmethod
+    def _pipeline():
+        return make_pipeline(
+            TfidfVectorizer(sublinear_tf=True, ngram_range=(1, 2), min_df=2, max_features=50000, stop_words="english"),
+            LogisticRegression(max_iter=1000, class_weight="balanced"),
+        )
+
+    def predict(self, texts):
+        """
+        [(category, confidence)] for the given article texts.
+        """
+        probabilities = self.pipeline.predict_proba(texts)
+        best = probabilities.argmax(axis=1)
+        classes = self.pipeline.classes_
+        return [(classes[index], float(probabilities[row, index])) for row, index in enumerate(best)]
+
+    def report(self, texts, labels):
+        """
+        {threshold: (share of articles at or above it, accuracy on those)} on labelled articles.
+        """
+        predictions = self.predict(texts)
+        labels = np.asarray(labels)
+        categories = np.asarray([category for category, _ in predictions])
+        confidences = np.asarray([confidence for _, confidence in predictions])
+        report = {}
+        for threshold in sorted(set(REPORT_THRESHOLDS) | {self.threshold}):
+            confident = confidences >= threshold
+            accuracy = float((categories[confident] == labels[confident]).mean()) if confident.any() else 0.0
+            report[threshold] = (float(confident.mean()), accuracy)
+        return report
+
+    def save(self, path=MODEL_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        joblib.dump(self.pipeline, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path=MODEL_PATH, threshold=None):
+        """
+        The trained classifier, or None if none was trained yet (the LLM then categorizes everything).
+        Threshold: CATEGORY_CLASSIFIER_THRESHOLD, default DEFAULT_THRESHOLD; above 1 disables it.
+        """
+        if threshold is None:
+            threshold = float(os.environ.get("CATEGORY_CLASSIFIER_THRESHOLD", DEFAULT_THRESHOLD))
+        if threshold > 1 or not os.path.exists(path):
+            return None
+        return cls(joblib.load(path), threshold)
+
+
+def load_training_data(conn):
+    """
+    Articles categorized by the LLM (not by the classifier itself, to avoid training on its own output).
+    """
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT article, main_category FROM {NEWS_TABLE}
+        WHERE categorized_at IS NOT NULL AND category_source IS NULL
+          AND article IS NOT NULL AND main_category IS NOT NULL
+    """)
+    rows = c.fetchall()
+    c.close()
+    return [row[0] for row in rows], [row[1] for row in rows]
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    arg_parser = argparse.ArgumentParser(description="Train the category pre-classifier on the LLM-labelled history.")
+    arg_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    arg_parser.add_argument("--model-path", default=MODEL_PATH)
+    args = arg_parser.parse_args()
+
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        raise ValueError("❌ DATABASE_URL environment variable not set.")
+    parsed_url = urlparse(db_url)
+    conn = psycopg2.connect(
+        dbname=parsed_url.path[1:],
+        user=parsed_url.username,
+        password=parsed_url.password,
+        host=parsed_url.hostname,
+    )
+    texts, labels = load_training_data(conn)
+    conn.close()
+
+    try:
+        classifier, report = CategoryClassifier.train(texts, labels, args.threshold)
+    except ValueError as e:
+        print(f"⚠️ {e}; keeping the current model")
+        raise SystemExit(0)
+    classifier.save(args.model_path)
+    print(f"✅ Trained on {len(texts)} articles, {len(classifier.pipeline.classes_)} categories; saved to {args.model_path}")
+    print("📊 Held-out articles per confidence threshold (share categorized locally / accuracy):")
+    for threshold, (coverage, accuracy) in report.items():
+        marker = "  <- threshold" if threshold == args.threshold else ""
+        print(f"   ≥ {threshold:.2f}: {coverage:6.1%} / {accuracy:6.1%}{marker}")
@@ -5,9 +5,109 @@ import psycopg2.extras
 from urllib.parse import urlparse
 from dotenv import load_dotenv
 import os
+from batch_jobs import BatchRunner, create_backend
+from llm_cache import open_cache
+from influence_model import InfluenceModel
 
 # Set your OpenAI API key (preferably load from an environment variable for security)
 
+# Offline mode (LLM_BATCH_BACKEND=openai|local): requests go through the Batch API instead
+BATCH_JOBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".batch_jobs")
+# Bump when the meaning of the score answers changes, so cached answers are not reused (see llm_cache.py)
+SCORING_PROMPT_VERSION = 1
+
+
+def evaluation_request(title, summary):
+    """
+    Keyword arguments for chat.completions.create that score one article; shared by the synchronous
+    path and the offline batch files.
+    """
+    return {
+        "model": "gpt-3.5-turbo",
+        "messages": [{
+            "role": "user",
+            "content": (
+                f"Evaluate the potential influential factor or popularity of the article titled '{title}' with the summary: {summary}. "
+                "Consider the following criteria: "
+                "1. Public & Social Impact (PSI, 30%): Does this article highlight changes in how people live, work, learn, or interact due to AI? Look for shifts in behavior, mass adoption, or ethical/social debates. "
+                "2. Industry Transformation Potential (ITP, 25%): Does the article describe AI affecting a major industry (e.g., healthcare, finance, education, manufacturing)? Consider scale, disruption potential, or cross-sector relevance. "                   
+                "3. Technological Breakthrough Significance (TBS, 20%): Does it feature novel capabilities, architectures, or models (e.g., new LLMs, multimodal models)? Evaluate its innovation level and technical leap. "                    
+                "4. Governance & Regulation Influence (GRI, 10%): Does it involve AI-related policies, bans, global alignment, or government frameworks? Consider international attention, legal implications, and political interest. "                   
+                "5. Virality & Media Buzz (VMB, 10%): Is the topic trending, meme-worthy, emotionally provocative, or viral on social platforms? Think about shareability, outrage factor, or media attention. "                    
+                "6. Long-Term Societal Shift Indicator (LSSI, 5%): Could this news indicate a deep, lasting shift in human-AI relations or infrastructure? Assess ideological, educational, or systemic changes. "                   
+                "Return a **popularity score between 0 and 1**, rounded to **two decimal places**, with **no explanation or extra text**."
+            )
+        }],
+        "max_tokens": 50,
+    }
+
+
+def fetch_pending_articles(cursor):
+    # Claim the categorized articles that have not been scored yet (partial index on scored_at)
+    # categorizationLLM.py scores articles in the same pass, so this only finds rows categorized before that
+    # or by the local pre-classifier. Scoring does not use the publication date, so rows whose date could not be
+    # parsed are scored too instead of staying pending forever
+    cursor.execute("""
+        SELECT news_id, title, summary, main_category, keywords, base_url
+        FROM news
+        WHERE scored_at IS NULL
+          AND categorized_at IS NOT NULL
+          AND title IS NOT NULL
+          AND summary IS NOT NULL
+    """)
+    return cursor.fetchall()
+
+
+def score_with_model(conn, articles, model):
+    """
+    Score, in one vectorized pass and one UPDATE, the articles the local influence model is confident
+    about (score_source = 'model'), and return the others, which still go to the LLM.
+    """
+    if model is None or not articles:
+        return articles
+    scores, spread = model.predict(articles)
+    confident = spread <= model.max_std
+    updates = [(article['news_id'], round(float(score), 2))
+               for article, score, ok in zip(articles, scores, confident) if ok]
+    if updates:
+        cursor = conn.cursor()
+        psycopg2.extras.execute_values(cursor, """
+            UPDATE news AS n
+            SET InfluentialFactor = v.score, score_source = 'model', scored_at = now()
+            FROM (VALUES %s) AS v (news_id, score)
+            WHERE n.news_id = v.news_id AND n.scored_at IS NULL;
+        """, updates, template="(%s, %s::real)", page_size=len(updates))
+        conn.commit()
+        cursor.close()
+    print(f"🧮 Influence model (max std {model.max_std:.2f}): {len(updates)} of {len(articles)} articles "
+          f"scored locally, {len(updates) / len(articles):.0%} of LLM calls saved")
+    return [article for article, ok in zip(articles, confident) if not ok]
+
+
+def evaluate_articles_offline(conn, backend):
+    """
+    Offline mode: collect the finished scoring batches, then submit the articles that are still pending,
+    not already in an open batch and not scored by the local influence model. Scores are only written to rows that are still unscored, so
+    re-applying a batch changes nothing.
+    """
+    runner = BatchRunner(conn, "batch_job", "scoring", backend)
+
+    def apply(cursor, news_id, content):
+        cursor.execute("""
+            UPDATE news
+            SET InfluentialFactor = %s, scored_at = now()
+            WHERE news_id = %s AND scored_at IS NULL
+        """, (float(content.strip()), news_id))
+
+    applied = runner.collect(apply)
+    in_flight = runner.open_news_ids()
+    articles = [article for article in fetch_pending_articles(conn.cursor()) if article['news_id'] not in in_flight]
+    articles = score_with_model(conn, articles, InfluenceModel.load())
+    if articles:
+        runner.submit([(article['news_id'], evaluation_request(article['title'], article['summary'])) for article in articles])
+    print(f"📊 Applied {applied} scores, submitted {len(articles)} articles, {len(in_flight)} still in flight")
+
+
 def evaluate_articles():
     # Connect to the PostgreSQL database
     conn = psycopg2.connect(
@@ -19,18 +119,18 @@ def evaluate_articles():
     )
     cursor = conn.cursor()
 
-    # Query articles that have Title, summary, Publication_Date but no InfluentialFactor set
-    cursor.execute("""
-        SELECT news_id, title, summary
-        FROM news
-        WHERE title IS NOT NULL
-          AND summary IS NOT NULL
-          AND publication_date IS NOT NULL
-          AND influentialfactor IS NULL
-    """)
+    batch_backend = os.environ.get("LLM_BATCH_BACKEND")
+    if batch_backend:
+        client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        evaluate_articles_offline(conn, create_backend(batch_backend, os.environ.get("LLM_BATCH_DIR", BATCH_JOBS_DIR), client=client))
+        conn.close()
+        return
 
-    articles = cursor.fetchall()
+    articles = fetch_pending_articles(cursor)
     print(f"Fetched {len(articles)} articles for evaluation.")
+    # Articles the local influence model is confident about are scored without an API call
+    articles = score_with_model(conn, articles, InfluenceModel.load())
+    llm_cache = open_cache("llm_cache", label="LLM response")
 
     for article in articles:
         news_id = article['news_id']
@@ -38,31 +138,16 @@ def evaluate_articles():
         summary = article['summary']
         print(f"Evaluating article ID {news_id} with title: {title}")
         client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{
-                "role": "user",
-                "content": (
-                    f"Evaluate the potential influential factor or popularity of the article titled '{title}' with the summary: {summary}. "
-                    "Consider the following criteria: "
-                    "1. Public & Social Impact (PSI, 30%): Does this article highlight changes in how people live, work, learn, or interact due to AI? Look for shifts in behavior, mass adoption, or ethical/social debates. "
-                    "2. Industry Transformation Potential (ITP, 25%): Does the article describe AI affecting a major industry (e.g., healthcare, finance, education, manufacturing)? Consider scale, disruption potential, or cross-sector relevance. "                   
-                    "3. Technological Breakthrough Significance (TBS, 20%): Does it feature novel capabilities, architectures, or models (e.g., new LLMs, multimodal models)? Evaluate its innovation level and technical leap. "                    
-                    "4. Governance & Regulation Influence (GRI, 10%): Does it involve AI-related policies, bans, global alignment, or government frameworks? Consider international attention, legal implications, and political interest. "                   
-                    "5. Virality & Media Buzz (VMB, 10%): Is the topic trending, meme-worthy, emotionally provocative, or viral on social platforms? Think about shareability, outrage factor, or media attention. "                    
-                    "6. Long-Term Societal Shift Indicator (LSSI, 5%): Could this news indicate a deep, lasting shift in human-AI relations or infrastructure? Assess ideological, educational, or systemic changes. "                   
-                    "Return a **popularity score between 0 and 1**, rounded to **two decimal places**, with **no explanation or extra text**."
-                )
-            }],
-            max_tokens=50
-        )
+        # Identical requests answered before come from the LLM response cache
+        request = evaluation_request(title, summary)
 
         # Attempt to parse the evaluated factor from the response
-        factor_str = response.choices[0].message.content.strip()
+        factor_str = llm_cache.complete(client, request, SCORING_PROMPT_VERSION).strip()
         try:
             influential_factor = float(factor_str)
         except ValueError:
             influential_factor = None  # or handle error as needed
+            llm_cache.discard(request, SCORING_PROMPT_VERSION)
 
         print(f"The evaluated score for the article '{title}' is: {influential_factor}")
 
@@ -70,12 +155,13 @@ def evaluate_articles():
         if influential_factor is not None:
             cursor.execute("""
                 UPDATE news
-                SET InfluentialFactor = %s
+                SET InfluentialFactor = %s, scored_at = now()
                 WHERE news_id = %s
             """, (influential_factor, news_id))
 
     conn.commit()
     conn.close()
+    llm_cache.close()
 
 # Example usage
 if __name__ == "__main__":
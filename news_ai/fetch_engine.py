@@ -0,0 +1,73 @@
+import asyncio
+import threading
+from urllib.parse import urlparse
+import requests
+
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+class AsyncFetcher:
+    """
+    Fetches many URLs concurrently with asyncio.
+    Every request runs on a worker thread with its own requests.Session, while two limits keep us polite:
+      - max_concurrency: the number of requests in flight across all hosts
+      - per_host: the number of requests in flight against a single host
+    """
+
+    def __init__(self, max_concurrency=8, per_host=2, timeout=30, headers=None):
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.headers = dict(headers or DEFAULT_HEADERS)
+        self._local = threading.local()
+
+    def _session(self):
+        """
+        requests.Session is not thread-safe, so every worker thread keeps its own.
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            self._local.session = session
+        return session
+
+    def _get(self, url, headers=None):
+        response = self._session().get(url, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    async def _fetch(self, url, headers, global_limit, host_limits):
+        host_limit = host_limits[urlparse(url).netloc]
+        # Host slot first: a task waiting on a busy host must not hold one of the global slots meanwhile
+        async with host_limit, global_limit:
+            try:
+                return url, await asyncio.to_thread(self._get, url, headers)
+            except Exception as e:
+                return url, e
+
+    async def fetch_all(self, urls, headers_by_url=None):
+        """
+        Fetch every URL (duplicates are fetched once) and return {url: requests.Response or Exception}.
+        headers_by_url optionally adds per-URL request headers (e.g. conditional-request validators).
+        """
+        headers_by_url = headers_by_url or {}
+        unique_urls = list(dict.fromkeys(urls))
+        global_limit = asyncio.Semaphore(self.max_concurrency)
+        host_limits = {
+            urlparse(url).netloc: asyncio.Semaphore(self.per_host)
+            for url in unique_urls
+        }
+        results = await asyncio.gather(
+            *(self._fetch(url, headers_by_url.get(url), global_limit, host_limits) for url in unique_urls)
+        )
+        return dict(results)
+
+    def run(self, urls, headers_by_url=None):
+        """
+        Synchronous entry point for callers that are not running an event loop.
+        """
+        return asyncio.run(self.fetch_all(urls, headers_by_url))
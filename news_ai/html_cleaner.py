@@ -0,0 +1,94 @@
+import re
+import lxml.html
+from lxml import etree
+
+
+# Tags removed together with everything inside them
+REMOVED_TAGS = frozenset([
+    "script", "style", "noscript", "iframe", "svg", "path", "object",
+    "embed", "picture", "video", "audio", "source", "input",
+    "ins", "del", "form", "button",
+])
+
+# Attributes stripped from every tag (an <a>'s href is always kept)
+REMOVED_ATTRIBUTES = re.compile(r"(?:class|id|role|data-.*|aria-.*|onclick|onload|style)")
+
+BETWEEN_TAGS_WHITESPACE = re.compile(r">\s+<")
+NEWLINES = re.compile(r"\n+")
+REPEATED_WHITESPACE = re.compile(r"\s{2,}")
+
+
+def _drop(element):
+    """
+    Remove an element and its subtree, keeping the text that follows it (its tail).
+    """
+    parent = element.getparent()
+    if element.tail:
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or "") + element.tail
+        else:
+            parent.text = (parent.text or "") + element.tail
+    parent.remove(element)
+
+
+def _has_text(element):
+    """
+    True if the element still contains visible text. Its children are already cleaned at this point,
+    and a child only survives cleaning if it has text, so there is no need to walk the subtree again.
+    """
+    if len(element):
+        return True
+    return bool(element.text and element.text.strip())
+
+
+def _strip_attributes(element):
+    for attr in element.attrib.keys():
+        if element.tag == "a" and attr == "href":
+            continue
+        if REMOVED_ATTRIBUTES.match(attr):
+            del element.attrib[attr]
+
+
+def clean_html(raw_html):
+    """
+    Reduce a listing page to the markup the extraction prompt needs, in a single post-order pass:
+      - comments and REMOVED_TAGS subtrees are dropped,
+      - tags without any text in their subtree are dropped,
+      - styling/scripting attributes are stripped,
+      - whitespace between tags is collapsed.
+    Accepts str or bytes and returns the cleaned HTML as str.
+    """
+    if not raw_html:
+        return ""
+    try:
+        root = lxml.html.document_fromstring(raw_html)
+    except ValueError:
+        # lxml refuses str input that carries an XML encoding declaration
+        root = lxml.html.document_fromstring(raw_html.encode("utf-8"))
+    except etree.ParserError:
+        return ""
+
+    # Explicit stack instead of recursion: news sites happily nest a few hundred levels deep
+    stack = [(root, False)]
+    while stack:
+        element, children_done = stack.pop()
+        if not children_done:
+            if element is not root and (not isinstance(element.tag, str) or element.tag in REMOVED_TAGS):
+                _drop(element)
+                continue
+            stack.append((element, True))
+            stack.extend((child, False) for child in element)
+            continue
+        if not _has_text(element):
+            if element is root:
+                return ""
+            _drop(element)
+            continue
+        _strip_attributes(element)
+
+    cleaned_html = lxml.html.tostring(root, encoding="unicode")
+    cleaned_html = BETWEEN_TAGS_WHITESPACE.sub("><", cleaned_html)
+    cleaned_html = NEWLINES.sub("", cleaned_html)
+    cleaned_html = REPEATED_WHITESPACE.sub(" ", cleaned_html)
+    return cleaned_html
@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+from urllib.parse import urlparse
+import joblib
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+from scipy import sparse
+from scipy.stats import spearmanr
+from sklearn.compose import ColumnTransformer
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.linear_model import Ridge
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import OneHotEncoder
+
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".models", "influence_model.joblib")
+NEWS_TABLE = "news"
+# Articles whose bootstrap predictions spread more than this (standard deviation) go to the LLM
+DEFAULT_MAX_STD = 0.05
+BOOTSTRAP_MODELS = 10
+MIN_TRAINING_ARTICLES = 200
+REPORT_MAX_STDS = (0.02, 0.03, 0.05, 0.08, 0.1, 0.15)
+
+
+def feature_rows(articles):
+    """
+    Feature matrix (object array) from article rows with title, main_category, keywords (JSON list)
+    and base_url. Keywords become "kw1|kw2|..." so a plain CountVectorizer can split them.
+    """
+    rows = []
+    for article in articles:
+        try:
+            keywords = json.loads(article["keywords"] or "[]")
+        except ValueError:
+            keywords = []
+        rows.append([
+            article["title"] or "",
+            article["main_category"] or "",
+            "|".join(str(keyword).strip().lower() for keyword in keywords if isinstance(keyword, str)),
+            urlparse(article["base_url"] or "").netloc,
+        ])
+    return np.array(rows, dtype=object).reshape(-1, 4)
+
+
+def rank_correlation(predicted, actual):
+    """
+    Spearman rank correlation between predicted and LLM scores (0.0 when undefined).
+    """
+    if len(predicted) < 3:
+        return 0.0
+    correlation = spearmanr(predicted, actual).correlation
+    return 0.0 if np.isnan(correlation) else float(correlation)
+
+
+class InfluenceModel:
+    """
+    Predicts InfluentialFactor from cheap features of a categorized article: category and source
+    (one-hot), keywords (bag of keywords) and title word n-grams (TF-IDF), with an ensemble of Ridge
+    regressions fitted on bootstrap resamples of the LLM-scored history. The mean of the ensemble is
+    the score and its standard deviation the uncertainty: articles above max_std still go to the LLM.
+    The spread says nothing about articles unlike anything in the history (every model falls back to its
+    intercept), so an unseen category or a title without a known term counts as infinitely uncertain.
+    """
+
+    def __init__(self, features, models, max_std=DEFAULT_MAX_STD):
+        self.features = features
+        self.models = models
+        self.max_std = max_std
+
+    @staticmethod
+    def _features():
+        return ColumnTransformer([
+            ("title", TfidfVectorizer(sublinear_tf=True, ngram_range=(1, 2), min_df=2, stop_words="english"), 0),
+            ("category", OneHotEncoder(handle_unknown="ignore"), [1]),
+            ("keywords", CountVectorizer(token_pattern=r"[^|]+", min_df=2, binary=True), 2),
+            ("source", OneHotEncoder(handle_unknown="ignore"), [3]),
+        ], sparse_threshold=1.0)
+
+    @classmethod
+    def fit(cls, articles, scores, max_std=DEFAULT_MAX_STD, n_models=BOOTSTRAP_MODELS, seed=0):
+        features = cls._features()
+        matrix = features.fit_transform(feature_rows(articles))
+        scores = np.asarray(scores, dtype=float)
+        rng = np.random.default_rng(seed)
+        models = []
+        for _ in range(n_models):
+            sample = rng.integers(0, len(scores), len(scores))
+            models.append(Ridge(alpha=1.0).fit(matrix[sample], scores[sample]))
+        return cls(features, models, max_std)
+
+    @classmethod
+    def train(cls, articles, scores, max_std=DEFAULT_MAX_STD):
+        """
+        Fit on the LLM-scored history. A quarter is held out first to report, per uncertainty cut-off,
+        the share of articles the model would score and its rank correlation with the LLM on them;
+        the returned model is refit on everything.
+        """
+        if len(articles) < MIN_TRAINING_ARTICLES:
+            raise ValueError(f"Not enough scored articles to train on ({len(articles)}, need {MIN_TRAINING_ARTICLES})")
+        train_articles, test_articles, train_scores, test_scores = train_test_split(
+            articles, scores, test_size=0.25, random_state=0
+        )
+        report = cls.fit(train_articles, train_scores, max_std).report(test_articles, test_scores)
+        return cls.fit(articles, scores, max_std), report
+
+    def predict(self, articles):
+        """
+        (scores, standard deviations) for the given articles, scores clipped to [0, 1].
+        """
+        # CSR even from models saved before sparse_threshold=1.0, whose output could come back dense
+        matrix = sparse.csr_matrix(self.features.transform(feature_rows(articles)))
+        predictions = np.stack([model.predict(matrix) for model in self.models])
+        spread = predictions.std(axis=0)
+        for name in ("title", "category"):
+            columns = self.features.output_indices_[name]
+            spread[matrix[:, columns].getnnz(axis=1) == 0] = np.inf
+        return np.clip(predictions.mean(axis=0), 0.0, 1.0), spread
+
+    def report(self, articles, scores):
+        """
+        {"all": Spearman on every article, max_std: (share of articles within it, Spearman on those)}.
+        """
+        scores = np.asarray(scores, dtype=float)
+        predicted, spread = self.predict(articles)
+        report = {"all": rank_correlation(predicted, scores)}
+        for max_std in sorted(set(REPORT_MAX_STDS) | {self.max_std}):
+            confident = spread <= max_std
+            report[max_std] = (float(confident.mean()), rank_correlation(predicted[confident], scores[confident]))
+        return report
+
+    def save(self, path=MODEL_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        joblib.dump({"features": self.features, "models": self.models}, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path=MODEL_PATH, max_std=None):
+        """
+        The trained model, or None if none was trained yet (the LLM then scores everything).
+        Cut-off: INFLUENCE_MODEL_MAX_STD, default DEFAULT_MAX_STD; 0 or less disables the model.
+        """
+        if max_std is None:
+            max_std = float(os.environ.get("INFLUENCE_MODEL_MAX_STD", DEFAULT_MAX_STD))
+        if max_std <= 0 or not os.path.exists(path):
+            return None
+        saved = joblib.load(path)
+        return cls(saved["features"], saved["models"], max_std)
+
+
+def load_training_data(conn):
+    """
+    Articles scored by the LLM (not by this model, to avoid training on its own output).
+    """
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT title, main_category, keywords, base_url, InfluentialFactor FROM {NEWS_TABLE}
+        WHERE InfluentialFactor IS NOT NULL AND score_source IS NULL
+    """)
+    rows = c.fetchall()
+    c.close()
+    articles = [dict(zip(("title", "main_category", "keywords", "base_url"), row[:4])) for row in rows]
+    return articles, [row[4] for row in rows]
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    arg_parser = argparse.ArgumentParser(description="Train the influence score model on the LLM-scored history.")
+    arg_parser.add_argument("--max-std", type=float, default=DEFAULT_MAX_STD)
+    arg_parser.add_argument("--model-path", default=MODEL_PATH)
+    args = arg_parser.parse_args()
+
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        raise ValueError("❌ DATABASE_URL environment variable not set.")
+    parsed_url = urlparse(db_url)
+    conn = psycopg2.connect(
+        dbname=parsed_url.path[1:],
+        user=parsed_url.username,
+        password=parsed_url.password,
+        host=parsed_url.hostname,
+    )
+    articles, scores = load_training_data(conn)
+    conn.close()
+
+    try:
+        model, report = InfluenceModel.train(articles, scores, args.max_std)
+    except ValueError as e:
+        print(f"⚠️ {e}; keeping the current model")
+        raise SystemExit(0)
+    model.save(args.model_path)
+    print(f"✅ Trained on {len(articles)} articles ({len(model.models)} bootstrap models); saved to {args.model_path}")
+    print(f"📊 Held-out Spearman rank correlation with the LLM scores: {report.pop('all'):.3f}")
+    print("📊 Per uncertainty cut-off (share scored by the model / Spearman on those):")
+    for max_std, (coverage, correlation) in report.items():
+        marker = "  <- cut-off" if max_std == args.max_std else ""
+        print(f"   std ≤ {max_std:.2f}: {coverage:6.1%} / {correlation:6.3f}{marker}")
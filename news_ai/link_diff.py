@@ -0,0 +1,78 @@
+from urllib.parse import urljoin, urldefrag
+import lxml.html
+from lxml import etree
+
+
+# A fragment grows from the anchor up to the largest ancestor that stays within these limits
+MAX_FRAGMENT_CHARS = 2000
+MAX_LINKS_PER_FRAGMENT = 3
+
+
+def _parse(cleaned_html):
+    try:
+        return lxml.html.document_fromstring(cleaned_html)
+    except (etree.ParserError, ValueError):
+        return None
+
+
+def _absolute(href, page_url):
+    return urldefrag(urljoin(page_url, href.strip()))[0]
+
+
+def extract_links(cleaned_html, page_url):
+    """
+    Absolute URLs of all <a href> anchors in the page, in document order, without duplicates.
+    """
+    root = _parse(cleaned_html) if cleaned_html else None
+    if root is None:
+        return []
+    links = (_absolute(a.get("href"), page_url) for a in root.iter("a") if a.get("href"))
+    return list(dict.fromkeys(link for link in links if link.startswith("http")))
+
+
+def _distinct_links(element, page_url):
+    return {_absolute(a.get("href"), page_url) for a in element.iter("a") if a.get("href")}
+
+
+def new_link_fragments(cleaned_html, page_url, known_links):
+    """
+    Returns (new_links, fragments): the links on the page that are not in known_links, and the
+    HTML fragments around them (the anchor's largest ancestor with at most MAX_LINKS_PER_FRAGMENT
+    links and MAX_FRAGMENT_CHARS characters, which is usually the article teaser holding the title,
+    author and date). Fragments shared by several new links are returned once.
+    """
+    root = _parse(cleaned_html) if cleaned_html else None
+    if root is None:
+        return [], []
+
+    new_links = []
+    chosen = []
+    for anchor in root.iter("a"):
+        href = anchor.get("href")
+        if not href:
+            continue
+        link = _absolute(href, page_url)
+        if not link.startswith("http") or link in known_links or link in new_links:
+            continue
+        new_links.append(link)
+
+        element = anchor
+        parent = element.getparent()
+        while (
+            parent is not None
+            and parent.tag not in ("body", "html")
+            and len(lxml.html.tostring(parent, encoding="unicode")) <= MAX_FRAGMENT_CHARS
+            and len(_distinct_links(parent, page_url)) <= MAX_LINKS_PER_FRAGMENT
+        ):
+            element = parent
+            parent = element.getparent()
+
+        # Skip fragments already covered by (or identical to) a chosen one
+        if any(element is c or c in element.iterancestors() for c in chosen):
+            continue
+        # A wider fragment replaces the narrower ones it contains
+        chosen = [c for c in chosen if element not in c.iterancestors()]
+        chosen.append(element)
+
+    fragments = [lxml.html.tostring(element, encoding="unicode", with_tail=False) for element in chosen]
+    return new_links, fragments
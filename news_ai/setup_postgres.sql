@@ -3,7 +3,9 @@ CREATE TABLE IF NOT EXISTS news (
     news_id SERIAL PRIMARY KEY,
     Title TEXT UNIQUE,
     Author TEXT,
-    Publication_Date TEXT,
+    Publication_Date DATE,
+    publication_date_raw TEXT,
+    publication_date_unparseable BOOLEAN NOT NULL DEFAULT false,
     Link TEXT NOT NULL,
     base_url TEXT NOT NULL,
     paginated_url TEXT,
@@ -11,10 +13,34 @@ CREATE TABLE IF NOT EXISTS news (
     article TEXT,
     keywords TEXT,
     main_category TEXT,
+    category_source TEXT,
     summary TEXT,
-    InfluentialFactor REAL
+    InfluentialFactor REAL,
+    score_source TEXT,
+    influence_scores TEXT,
+    enriched_at TIMESTAMPTZ,
+    categorized_at TIMESTAMPTZ,
+    scored_at TIMESTAMPTZ
 );
 
+-- Rows whose raw publication date has not been parsed into Publication_Date yet (nor found unparseable)
+CREATE INDEX IF NOT EXISTS news_unparsed_publication_date_idx ON news (news_id)
+WHERE Publication_Date IS NULL AND publication_date_raw IS NOT NULL AND NOT publication_date_unparseable;
+
+-- Pipeline watermarks: the rows each stage still has to process
+CREATE INDEX IF NOT EXISTS news_pending_enrichment_idx ON news (news_id)
+WHERE enriched_at IS NULL;
+CREATE INDEX IF NOT EXISTS news_pending_categorization_idx ON news (news_id)
+WHERE categorized_at IS NULL AND enriched_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS news_pending_scoring_idx ON news (news_id)
+WHERE scored_at IS NULL AND categorized_at IS NOT NULL;
+
+-- Top articles of a date window by InfluentialFactor (NewsletterGenerator.fetch_top_articles)
+CREATE INDEX IF NOT EXISTS news_top_articles_idx ON news (Publication_Date, InfluentialFactor DESC)
+WHERE InfluentialFactor IS NOT NULL;
+-- Lookup of already stored links (NewsScrapperGeneral.load_known_links)
+CREATE INDEX IF NOT EXISTS news_link_idx ON news (Link);
+
 -- Newsletter table
 CREATE TABLE IF NOT EXISTS newsletter (
     newsletter_id SERIAL PRIMARY KEY,
@@ -29,6 +55,9 @@ CREATE TABLE IF NOT EXISTS newsletter (
     creation TEXT
 );
 
+-- Latest newsletter (render_html_from_db, Newsletter_send)
+CREATE INDEX IF NOT EXISTS newsletter_creation_idx ON newsletter (creation DESC);
+
 -- Subscriber table
 CREATE TABLE IF NOT EXISTS subscriber (
     subscriber_id SERIAL PRIMARY KEY,
@@ -42,3 +71,52 @@ CREATE TABLE IF NOT EXISTS subscriber (
     ai_involement TEXT,
     reason_for_subscribing TEXT
 );
+
+-- Send queue (Newsletter_send): one row per (edition, subscriber), claimed with FOR UPDATE SKIP LOCKED
+CREATE TABLE IF NOT EXISTS newsletter_delivery (
+    newsletter_id INTEGER NOT NULL REFERENCES newsletter (newsletter_id) ON DELETE CASCADE,
+    subscriber_id INTEGER NOT NULL REFERENCES subscriber (subscriber_id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at TIMESTAMPTZ,
+    sent_at TIMESTAMPTZ,
+    PRIMARY KEY (newsletter_id, subscriber_id)
+);
+CREATE INDEX IF NOT EXISTS newsletter_delivery_pending_idx ON newsletter_delivery (newsletter_id, subscriber_id)
+WHERE status = 'pending';
+
+-- Edition variants (generate_newsletter): one render per distinct subscriber preference set
+CREATE TABLE IF NOT EXISTS newsletter_variant (
+    newsletter_id INTEGER NOT NULL REFERENCES newsletter (newsletter_id) ON DELETE CASCADE,
+    segment_key TEXT NOT NULL,
+    selected_news_id TEXT,
+    html TEXT,
+    PRIMARY KEY (newsletter_id, segment_key)
+);
+
+-- Extraction cache: last LLM extraction per listing page, keyed by URL and cleaned-HTML hash
+CREATE TABLE IF NOT EXISTS extraction_cache (
+    url TEXT PRIMARY KEY,
+    html_hash TEXT NOT NULL,
+    extracted_json TEXT NOT NULL,
+    updated_time TEXT NOT NULL
+);
+
+-- Site templates: learned CSS extraction template per base URL
+CREATE TABLE IF NOT EXISTS site_template (
+    base_url TEXT PRIMARY KEY,
+    template_json TEXT NOT NULL,
+    updated_time TEXT NOT NULL
+);
+
+-- Offline LLM batches (LLM_BATCH_BACKEND): submitted Batch API jobs per stage, collected by later cron runs
+CREATE TABLE IF NOT EXISTS batch_job (
+    batch_id TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    news_ids INTEGER[] NOT NULL,
+    status TEXT NOT NULL,
+    submitted_time TEXT NOT NULL,
+    finished_time TEXT
+);
@@ -0,0 +1,202 @@
+import re
+from collections import Counter
+from urllib.parse import urljoin, urldefrag
+import lxml.html
+from lxml import etree
+
+
+# Learning needs at least this many of the LLM's articles located on the page
+MIN_LEARNING_MATCHES = 3
+# A learned template must find this share of the LLM's links, and this share of its own links must be real articles
+MIN_RECALL = 0.8
+MIN_PRECISION = 0.8
+# Below this share of the learned yield the template is considered broken and is re-learned
+MIN_YIELD_RATIO = 0.5
+
+FIELDS = ("title", "author", "date")
+SEGMENT = re.compile(r"^([a-z][a-z0-9]*)(?::nth-of-type\((\d+)\))?$")
+
+
+def _normalize(text):
+    return " ".join((text or "").split())
+
+
+def _absolute(href, page_url):
+    return urldefrag(urljoin(page_url, href.strip()))[0]
+
+
+def _parse(cleaned_html):
+    try:
+        return lxml.html.document_fromstring(cleaned_html)
+    except (etree.ParserError, ValueError):
+        return None
+
+
+def selector_to_xpath(selector, absolute=False):
+    """
+    Translate the child-combinator CSS subset used by templates ("main > div > h2:nth-of-type(1)")
+    into XPath, so templates work without the optional cssselect package.
+    """
+    if not selector:
+        return "."
+    steps = []
+    for segment in selector.split(">"):
+        match = SEGMENT.match(segment.strip())
+        if not match:
+            raise ValueError(f"Unsupported selector segment: {segment!r}")
+        tag, index = match.groups()
+        steps.append(f"{tag}[{index}]" if index else tag)
+    return ("/" if absolute else "./") + "/".join(steps)
+
+
+def _absolute_selector(element):
+    tags = [ancestor.tag for ancestor in element.iterancestors()][::-1]
+    return " > ".join(tags + [element.tag])
+
+
+def _relative_selector(element, container):
+    segments = []
+    while element is not container:
+        parent = element.getparent()
+        same_tag = [sibling for sibling in parent if sibling.tag == element.tag]
+        segments.append(f"{element.tag}:nth-of-type({same_tag.index(element) + 1})")
+        element = parent
+    return " > ".join(reversed(segments))
+
+
+def _first(container, selector):
+    found = container.xpath(selector_to_xpath(selector))
+    return found[0] if found else None
+
+
+def _text_of(element):
+    if element is None:
+        return None
+    if element.tag == "time" and element.get("datetime"):
+        return element.get("datetime")
+    return _normalize(element.text_content()) or None
+
+
+def _find_field(card, value):
+    """
+    Deepest element inside the card whose text equals the extracted value (or contains it, for longer texts).
+    """
+    value = _normalize(value)
+    if not value or value.lower() == "null":
+        return None
+    exact = None
+    containing = None
+    for element in card.iter():
+        if not isinstance(element.tag, str):
+            continue
+        text = _normalize(element.text_content())
+        if text == value or (element.tag == "time" and element.get("datetime") == value):
+            exact = element
+        elif len(value) >= 8 and value in text:
+            containing = element
+    return exact if exact is not None else containing
+
+
+def _majority(values, minimum):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    value, count = Counter(values).most_common(1)[0]
+    return value if count >= minimum else None
+
+
+def apply_template(template, cleaned_html, page_url):
+    """
+    Extract articles from a cleaned listing page with a learned template.
+    Returns a list of {"Title", "Publication Date", "Author", "Link"} dicts, like the LLM extraction.
+    """
+    root = _parse(cleaned_html) if cleaned_html else None
+    if root is None:
+        return []
+    articles = []
+    seen = set()
+    for container in root.xpath(selector_to_xpath(template["container"], absolute=True)):
+        link_element = _first(container, template["link"])
+        title = _text_of(_first(container, template["title"]))
+        if link_element is None or not link_element.get("href") or not title:
+            continue
+        link = _absolute(link_element.get("href"), page_url)
+        if link in seen:
+            continue
+        seen.add(link)
+        articles.append({
+            "Title": title,
+            "Publication Date": _text_of(_first(container, template["date"])) if template.get("date") is not None else None,
+            "Author": _text_of(_first(container, template["author"])) if template.get("author") is not None else None,
+            "Link": link,
+        })
+    return articles
+
+
+def learn_template(cleaned_html, page_url, articles, known_links=()):
+    """
+    Derive a template from the LLM's own extraction of a page: locate each extracted link on the page,
+    take the largest ancestor holding only that article (the card), and keep the tag paths that most
+    cards agree on. Returns None if the page does not support a reliable template.
+    """
+    root = _parse(cleaned_html) if cleaned_html else None
+    if root is None:
+        return None
+
+    anchors = {}
+    for anchor in root.iter("a"):
+        if anchor.get("href"):
+            anchors.setdefault(_absolute(anchor.get("href"), page_url), anchor)
+
+    matched = [(article, anchors[article["Link"]]) for article in articles
+               if article.get("Link") in anchors]
+    if len(matched) < MIN_LEARNING_MATCHES:
+        return None
+    matched_anchors = [anchor for _, anchor in matched]
+
+    cards = []
+    for article, anchor in matched:
+        card = anchor
+        parent = card.getparent()
+        while parent is not None and parent.tag != "body" and not any(
+            other is not anchor and parent in other.iterancestors() for other in matched_anchors
+        ):
+            card = parent
+            parent = card.getparent()
+        cards.append((article, anchor, card))
+
+    minimum = max(MIN_LEARNING_MATCHES, len(cards) // 2)
+    container = _majority([_absolute_selector(card) for _, _, card in cards], minimum)
+    if not container:
+        return None
+    cards = [entry for entry in cards if _absolute_selector(entry[2]) == container]
+
+    template = {
+        "container": container,
+        "link": _majority([_relative_selector(anchor, card) for _, anchor, card in cards], minimum),
+    }
+    for field, key in zip(FIELDS, ("Title", "Author", "Publication Date")):
+        selectors = []
+        for article, _, card in cards:
+            element = _find_field(card, article.get(key))
+            if element is not None:
+                selectors.append(_relative_selector(element, card))
+        template[field] = _majority(selectors, minimum if field == "title" else max(2, len(cards) // 3))
+    if template["link"] is None or template["title"] is None:
+        return None
+
+    # Only keep templates that reproduce the LLM's extraction on the very page they were learned from
+    found = {article["Link"] for article in apply_template(template, cleaned_html, page_url)}
+    expected = {article["Link"] for article in articles if article.get("Link")}
+    if not found:
+        return None
+    recall = len(found & expected) / len(expected)
+    precision = len(found & (expected | set(known_links))) / len(found)
+    if recall < MIN_RECALL or precision < MIN_PRECISION:
+        return None
+    template["yield"] = len(found)
+    return template
+
+
+def template_is_healthy(template, articles):
+    return bool(articles) and len(articles) >= MIN_YIELD_RATIO * template["yield"]
@@ -0,0 +1,155 @@
+import queue
+import smtplib
+import threading
+import time
+
+
+DEFAULT_POOL_SIZE = 4
+# Mail servers cap the messages accepted per connection; sessions are replaced before reaching it
+MAX_MESSAGES_PER_SESSION = 100
+
+
+def is_transient(error):
+    """
+    True for failures worth retrying on a fresh session: 4xx replies (421 "closing connection", greylisting,
+    rate limits) and dropped or timed-out connections. 5xx replies are permanent.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class SMTPPool:
+    """
+    Delivers many messages over a few persistent, authenticated SMTP sessions instead of opening a
+    connection (plus STARTTLS and LOGIN) per message:
+      - size: sessions, each driven by its own worker thread during send_all
+      - max_per_session: messages sent on a session before it is replaced
+    Idle sessions are kept between send_all calls until close(). A transient failure (see is_transient)
+    drops the session and retries the message on a new one, up to max_retries times with exponential
+    backoff; a permanent rejection fails only that message. If a session cannot be opened at all (e.g.
+    wrong credentials), the remaining messages fail right away instead of each retrying the login.
+    """
+
+    def __init__(self, host, port, username=None, password=None, size=DEFAULT_POOL_SIZE, starttls=True,
+                 timeout=30, max_per_session=MAX_MESSAGES_PER_SESSION, max_retries=3, base_delay=1.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = size
+        self.starttls = starttls
+        self.timeout = timeout
+        self.max_per_session = max_per_session
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.fatal = None
+        self.connections = 0
+        self.retries = 0
+
+    def _connect(self):
+        session = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                session.starttls()
+            if self.password:
+                session.login(self.username, self.password)
+        except Exception:
+            self._discard(session)
+            raise
+        with self._lock:
+            self.connections += 1
+        return session
+
+    @staticmethod
+    def _discard(session):
+        if session is None:
+            return
+        try:
+            session.quit()
+        except Exception:
+            session.close()
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return None, 0
+
+    def _send(self, slot, sender, recipient, message):
+        """
+        Send one message on the worker's (session, sent count) slot; returns the updated slot and None or
+        the error that failed the message.
+        """
+        session, sent = slot
+        for attempt in range(self.max_retries + 1):
+            if self.fatal is not None:
+                return (session, sent), self.fatal
+            try:
+                if session is None or sent >= self.max_per_session:
+                    self._discard(session)
+                    session, sent = None, 0
+                    try:
+                        session = self._connect()
+                    except Exception as e:
+                        if not is_transient(e):
+                            self.fatal = e
+                        raise
+                session.sendmail(sender, [recipient], message)
+                return (session, sent + 1), None
+            except Exception as e:
+                if not is_transient(e) or attempt == self.max_retries:
+                    return (session, sent), e
+                self._discard(session)
+                session, sent = None, 0
+                with self._lock:
+                    self.retries += 1
+                time.sleep(self.base_delay * 2 ** attempt)
+
+    def _work(self, jobs, results):
+        slot = self._checkout()
+        while True:
+            try:
+                index, (sender, recipient, message) = jobs.get_nowait()
+            except queue.Empty:
+                break
+            slot, results[index] = self._send(slot, sender, recipient, message)
+        if slot[0] is not None:
+            self._idle.put(slot)
+
+    def send_all(self, messages):
+        """
+        Send (sender, recipient, message) triples, message being a string as for smtplib's sendmail.
+        Returns, in the same order, None for each delivered message and the error for each failed one.
+        """
+        jobs = queue.Queue()
+        for item in enumerate(messages):
+            jobs.put(item)
+        results = [None] * len(messages)
+        workers = [threading.Thread(target=self._work, args=(jobs, results))
+                   for _ in range(min(self.size, len(messages)))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return results
+
+    def close(self):
+        while True:
+            try:
+                session, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(session)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,10 +1,16 @@
-import smtplib
+import argparse
+from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from urllib.parse import quote, urlparse
 import psycopg2
 import psycopg2.extras
 import os
+import time
 from dotenv import load_dotenv
+from smtp_pool import DEFAULT_POOL_SIZE, SMTPPool
+from delivery_queue import MAX_RETRY_WAIT, DeliveryQueue
+from segments import segment_key
+from newsletter_images import attach_images, cid_keys
 import re
 
 # Load environment variables
@@ -46,26 +52,56 @@ class SendNewsletter:
             cursor_factory=psycopg2.extras.RealDictCursor,
         )
 
-    def get_subscribers(self):
-        conn=self.conn      
-        cursor = conn.cursor()
-        cursor.execute("SELECT email FROM crypto_subscriber")
-        rows = cursor.fetchall()
-        return [row.get('email') for row in rows]
-
-    def send_email(self, recipient, subject):
-        # Validate email address
-        if not is_valid_email(recipient):
-            print(f"Invalid email address: {recipient}")
-            return False
-
-        conn = self.conn
-        cursor = conn.cursor()
-        cursor.execute("SELECT html FROM crypto_newsletter order by creation desc limit 1")
-        html_row = cursor.fetchone()
-        html_content = html_row['html']
+    def latest_newsletter(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT newsletter_id, html FROM crypto_newsletter order by creation desc limit 1")
+        return cursor.fetchone()
+
+    def newsletter(self, newsletter_id):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT newsletter_id, html FROM crypto_newsletter WHERE newsletter_id = %s", (newsletter_id,))
+        return cursor.fetchone()
+
+    def segment_variants(self, newsletter_id):
+        """
+        The edition's pre-rendered variants by preference segment key (see generate_newsletter.py's
+        render_segment_variants); subscribers of other segments get the edition itself.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT to_regclass('crypto_newsletter_variant') AS known")
+        if cursor.fetchone()['known'] is None:
+            return {}
+        cursor.execute("SELECT segment_key, html FROM crypto_newsletter_variant WHERE newsletter_id = %s", (newsletter_id,))
+        return {row['segment_key']: row['html'] for row in cursor.fetchall()}
+
+    def build_email(self, html_content, sender, recipient, subject):
         replaced_html = html_content.replace("{EMAIL}", quote(recipient))
 
+        # Create message; images the HTML references by Content-ID go once each into a multipart/related wrapper
+        msg = MIMEText(replaced_html, 'html')
+        if cid_keys(replaced_html):
+            related = MIMEMultipart('related')
+            related.attach(msg)
+            attach_images(related, replaced_html)
+            msg = related
+        msg['Subject'] = subject
+        msg['From'] = sender
+        msg['To'] = recipient
+        return msg.as_string()
+
+    def send_newsletter(self, retry_failed=False):
+        """
+        Send the latest edition through its delivery queue (see delivery_queue.py): only subscribers it has
+        not been delivered to yet are sent to, so an interrupted run is resumed by running it again, and
+        several processes can send the same edition in parallel. Deliveries that failed transiently are
+        retried once their backoff is over, waiting at most MAX_RETRY_WAIT for the next one; the pending
+        deliveries of earlier editions, left by earlier runs, are sent too. retry_failed also resends the
+        deliveries of the latest edition that failed permanently.
+        """
+        subject = "Crypto News Digest"
+        successful_sends = 0
+        failed_sends = 0
+
         # Get email credentials from environment variables
         sender = os.environ.get("EMAIL_SENDER", "newsletter@homesmartify.lu")
         password = os.environ.get("SMTP_PASSWORD")
@@ -75,43 +111,86 @@ class SendNewsletter:
         if not password:
             raise ValueError("SMTP_PASSWORD environment variable not set")
 
-        try:
-            # Create message
-            msg = MIMEText(replaced_html, 'html')
-            msg['Subject'] = subject
-            msg['From'] = sender
-            msg['To'] = recipient
-
-            # Connect to SMTP server and send email
-            server = smtplib.SMTP(smtp_server, smtp_port)
-            server.starttls()
-            server.login(sender, password)
-            server.sendmail(sender, recipient, msg.as_string())
-            server.quit()
-            return True
-        except Exception as e:
-            print(f"Error sending email to {recipient}: {str(e)}")
-            return False
-
-    def send_newsletter(self):
-        subscribers = self.get_subscribers()
-        subject = "Crypto News Digest"
-        successful_sends = 0
-        failed_sends = 0
-        
-        for email in subscribers:  
-            if self.send_email(email, subject):
-                successful_sends += 1
-                print(f"Newsletter to {email} has been sent.")
-            else:
-                failed_sends += 1
-                print(f"Failed to send newsletter to {email}")
+        newsletter_id = self.latest_newsletter()['newsletter_id']
+
+        deliveries = DeliveryQueue(self.conn, "crypto_newsletter_delivery", "crypto_newsletter", "crypto_subscriber")
+        message_bytes = message_count = 0
+        if retry_failed:
+            print(f"Failed deliveries queued again: {deliveries.retry_failed(newsletter_id)}")
+        print(f"New subscribers queued for edition {newsletter_id}: {deliveries.enqueue(newsletter_id)}")
+
+        # Each edition with pending deliveries is loaded once for all its recipients, the oldest first
+        editions = {}
+        for edition_id in dict.fromkeys(deliveries.pending_editions() + [newsletter_id]):
+            editions[edition_id] = (self.newsletter(edition_id)['html'], self.segment_variants(edition_id))
+            print(f"Edition {edition_id} preference segment variants: {len(editions[edition_id][1])}")
+
+        # A few authenticated sessions, reused for all messages and sending concurrently
+        with SMTPPool(smtp_server, smtp_port, sender, password,
+                      size=int(os.environ.get("SMTP_POOL_SIZE", DEFAULT_POOL_SIZE))) as pool:
+            while True:
+                for edition_id in editions:
+                    claimed = deliveries.claim(edition_id)
+                    if claimed:
+                        break
+                if not claimed:
+                    # Nothing due: wait for the next transient failure to come due, unless that is too far off
+                    wait = deliveries.seconds_until_due(editions)
+                    if wait is None or wait > MAX_RETRY_WAIT:
+                        break
+                    print(f"Waiting {wait:.0f}s for the next retry")
+                    time.sleep(wait)
+                    continue
+                html_content, variants = editions[edition_id]
+                outcomes = []
+                # Validate email addresses
+                recipients = []
+                for row in claimed:
+                    if is_valid_email(row['email']):
+                        recipients.append(row)
+                    else:
+                        print(f"Invalid email address: {row['email']}")
+                        outcomes.append((row['subscriber_id'], ValueError("Invalid email address")))
+                        failed_sends += 1
+
+                messages = [(sender, row['email'],
+                             self.build_email(variants.get(segment_key(row['preferences']), html_content),
+                                              sender, row['email'], subject))
+                            for row in recipients]
+                message_bytes += sum(len(message) for _, _, message in messages)
+                message_count += len(messages)
+                results = pool.send_all(messages)
+
+                for row, error in zip(recipients, results):
+                    if error is None:
+                        successful_sends += 1
+                        print(f"Newsletter to {row['email']} has been sent.")
+                    elif error is not pool.fatal:
+                        failed_sends += 1
+                        print(f"Error sending email to {row['email']}: {str(error)}")
+                        print(f"Failed to send newsletter to {row['email']}")
+                # Deliveries the SMTP server could not even be reached for stay pending
+                outcomes += [(row['subscriber_id'], error) for row, error in zip(recipients, results) if error is None or error is not pool.fatal]
+                deliveries.record(edition_id, outcomes)
+                if pool.fatal is not None:
+                    print(f"Cannot send through {smtp_server}: {pool.fatal}; the remaining deliveries stay queued")
+                    break
         
         print(f"\nNewsletter sending completed:")
         print(f"Successfully sent: {successful_sends}")
         print(f"Failed to send: {failed_sends}")
+        print(f"SMTP connections opened: {pool.connections} ({pool.retries} retries)")
+        if message_count:
+            print(f"Average message size: {message_bytes // message_count} bytes")
+        for edition_id in editions:
+            counts = deliveries.counts(edition_id)
+            print(f"Edition {edition_id} overall: {counts.get('sent', 0)} sent, {counts.get('pending', 0)} pending, "
+                  f"{counts.get('failed', 0)} failed")
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Send the latest newsletter to every subscriber.")
+    arg_parser.add_argument("--retry-failed", action="store_true", help="also resend deliveries that failed permanently")
+    args = arg_parser.parse_args()
     # Use environment variables for configuration
     newsletter_sender = SendNewsletter()
-    newsletter_sender.send_newsletter()
+    newsletter_sender.send_newsletter(retry_failed=args.retry_failed)
@@ -8,16 +8,26 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import undetected_chromedriver as uc
-from bs4 import BeautifulSoup
 import requests
 from datetime import datetime, timedelta
 import psycopg2
 import psycopg2.extras
-from newspaper import Article, Config # Requires: pip install newspaper3k
+from newspaper import Config # Requires: pip install newspaper3k
 from dateutil import parser
 from urllib.parse import urlparse
 import sys
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fetch_engine import AsyncFetcher
+from browser_pool import BrowserPool, build_chrome_options
+from http_cache import HTTPCache, content_hash
+from html_cleaner import clean_html
+from link_diff import extract_links, new_link_fragments
+from site_templates import apply_template, learn_template, template_is_healthy
+from html_chunker import DEFAULT_CHUNK_TOKENS, chunk_html, merge_articles
+from llm_dispatcher import LLMDispatcher
+from llm_cache import open_cache
+from article_fetcher import ArticleFetcher
 
 # Print startup information for debugging
 print(f"Script started at: {datetime.now().isoformat()}")
@@ -48,24 +58,39 @@ if not DATABASE_URL:
 else:
     print(f"✅ DATABASE_URL is set, connecting to: {urlparse(DATABASE_URL).hostname}")
 
+# Listing-page cache shared across cron runs
+HTTP_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".http_cache")
+# Rows per INSERT statement in save_to_db; a scraper run stays well below this, so it is one round trip
+BULK_INSERT_PAGE_SIZE = 5000
+# update_article_details writes its results back every this many articles
+ARTICLE_WRITE_BATCH_SIZE = 50
+# Bump when the meaning of the extraction answers changes, so cached answers are not reused (see llm_cache.py)
+EXTRACTION_PROMPT_VERSION = 1
+
 class NewsScrapperGeneral:
-    def __init__(self, base_urls, db_config=None):
+    def __init__(self, base_urls, db_config=None, extraction_mode=None):
         """
         Initialize the NewsScrapperGeneral with a list of base URLs.
         For each base URL, we maintain:
           - paginated_url: a list of discovered URLs (pages)
           - html: a dict mapping each paginated URL to its cleaned HTML
           - extracted_news: a dict mapping each paginated URL to the raw extracted text (markdown)
+          - unchanged: paginated URLs whose content did not change since the last run (skipped downstream)
+        extraction_mode (or SCRAPER_EXTRACTION_MODE) selects what is sent to the LLM:
+          - "full": the whole cleaned page
+          - "link_diff": only the fragments around links that are not yet in the database
         """
         self.webpages = [
             {
                 "base_url": url,
                 "paginated_url": [],
                 "html": {},           # {paginated_url: cleaned_html, ...}
-                "extracted_news": {}  # {paginated_url: extracted_text, ...}
+                "extracted_news": {}, # {paginated_url: extracted_text, ...}
+                "unchanged": set()    # {paginated_url, ...}
             }
             for url in base_urls
         ]
+        self.extraction_mode = extraction_mode or os.environ.get("SCRAPER_EXTRACTION_MODE", "full")
         
         # Use DATABASE_URL if db_config is not provided
         if db_config is None:
@@ -93,6 +118,7 @@ class NewsScrapperGeneral:
             self.db_config = db_config
             
         # Connect to the database
+        self.http_cache = HTTPCache(os.environ.get("SCRAPER_HTTP_CACHE_DIR", HTTP_CACHE_DIR))
         self.conn = psycopg2.connect(
             dbname=self.db_config["dbname"],
             user=self.db_config["user"],
@@ -100,27 +126,85 @@ class NewsScrapperGeneral:
             host=self.db_config["host"],
             cursor_factory=psycopg2.extras.RealDictCursor  # to get dictionary-like rows
         )
+        self.create_scraper_tables()
+
+    def create_scraper_tables(self):
+        """
+        Creates the scraper's bookkeeping tables if they are missing:
+          - crypto_extraction_cache: the last extraction per listing-page URL and the hash of the cleaned HTML it came from
+          - crypto_site_template: the learned CSS extraction template per base URL (see site_templates.py)
+        """
+        c = self.conn.cursor()
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS crypto_extraction_cache (
+                url TEXT PRIMARY KEY,
+                html_hash TEXT NOT NULL,
+                extracted_json TEXT NOT NULL,
+                updated_time TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS crypto_site_template (
+                base_url TEXT PRIMARY KEY,
+                template_json TEXT NOT NULL,
+                updated_time TEXT NOT NULL
+            );
+        """)
+        self.conn.commit()
+        c.close()
+        self.migrate_publication_date()
+        self.add_stage_watermarks()
+        self.create_query_indexes()
+
+    def migrate_publication_date(self):
+        """
+        Moves 'crypto_news'.Publication_Date from TEXT to DATE (once; later runs find it migrated).
+        The original strings are kept in publication_date_raw and normalized into the DATE column by
+        normalize_and_update_publication_dates. A partial index keeps the rows still waiting for a
+        date cheap to find, however large the table grows. Raw strings that do not parse are flagged in
+        publication_date_unparseable (added once) and leave the index.
+        """
+        c = self.conn.cursor()
+        c.execute("""
+            SELECT column_name, data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'crypto_news'
+              AND column_name IN ('publication_date', 'publication_date_unparseable');
+        """)
+        columns = {row["column_name"]: row["data_type"] for row in c.fetchall()}
+        if "publication_date" not in columns:
+            c.close()
+            return
+        migrate = columns["publication_date"] == "text"
+        if migrate:
+            print("🛠️ Migrating crypto_news.Publication_Date from TEXT to DATE")
+            c.execute("""
+                ALTER TABLE crypto_news ADD COLUMN IF NOT EXISTS publication_date_raw TEXT;
+                UPDATE crypto_news
+                SET publication_date_raw = CASE
+                    WHEN lower(trim(Publication_Date)) IN ('', 'null', 'none') THEN NULL
+                    ELSE Publication_Date
+                END;
+                ALTER TABLE crypto_news ALTER COLUMN Publication_Date TYPE DATE USING NULL;
+            """)
+        if "publication_date_unparseable" not in columns:
+            # The index is rebuilt without the flagged rows
+            c.execute("""
+                ALTER TABLE crypto_news ADD COLUMN IF NOT EXISTS publication_date_unparseable BOOLEAN NOT NULL DEFAULT false;
+                DROP INDEX IF EXISTS crypto_news_unparsed_publication_date_idx;
+            """)
+        c.execute("""
+            CREATE INDEX IF NOT EXISTS crypto_news_unparsed_publication_date_idx ON crypto_news (news_id)
+            WHERE Publication_Date IS NULL AND publication_date_raw IS NOT NULL AND NOT publication_date_unparseable;
+        """)
+        self.conn.commit()
+        c.close()
+        if migrate:
+            self.normalize_and_update_publication_dates()
 
     def find_all_pagination_urls(self):
         """
         Extracts pagination URLs from different webpage structures.
         Stops after finding 10 additional pages per base URL (total 11 pages).
         """
-        options = uc.ChromeOptions()
-        options.add_argument("--headless=new")
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--window-size=1920,1080")
-        options.add_argument("--remote-debugging-port=9222")
-        options.add_argument("--disable-setuid-sandbox")
-        options.add_argument("--disable-extensions")
-        options.add_argument("--disable-infobars")
-        options.add_argument("--single-process")
-        options.add_argument("--disable-dev-tools")
-        options.add_argument("--ignore-certificate-errors")
-        options.add_argument("--homedir=/tmp")
+        options = build_chrome_options(remote_debugging_port=9222)
 
         driver = uc.Chrome(options=options)
         max_pages = 5  # base URL + 10 additional pages
@@ -164,128 +248,104 @@ class NewsScrapperGeneral:
 
     def get_and_clean_html(self):
         """
-        Fetches raw HTML from each paginated URL using requests first,
-        falls back to undetected_chromedriver if needed,
-        cleans it, and stores the cleaned HTML in the 'html' dict keyed by the paginated URL.
-        """
-        session = requests.Session()
-        session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
-
-        def clean_html(raw_html):
-            soup = BeautifulSoup(raw_html, "html.parser")
-            for tag in soup(["script", "style", "noscript", "iframe", "svg", "path", "object",
-                           "embed", "picture", "video", "audio", "source", "input",
-                           "ins", "del", "form", "button"]):
-                tag.decompose()
-            for tag in soup.find_all():
-                if not tag.get_text(strip=True):
-                    tag.decompose()
-            for tag in soup.find_all(True):
-                attrs_to_remove = ["class", "id", "role", "data-*", "aria-*", "onclick", "onload", "style"]
-                for attr in list(tag.attrs):
-                    if tag.name == "a" and attr == "href":
-                        continue
-                    if any(re.match(pattern.replace("*", ".*"), attr) for pattern in attrs_to_remove):
-                        del tag[attr]
-            cleaned_html = str(soup)
-            cleaned_html = re.sub(r">\s+<", "><", cleaned_html)
-            cleaned_html = re.sub(r"\n+", "", cleaned_html)
-            cleaned_html = re.sub(r"\s{2,}", " ", cleaned_html)
-            return cleaned_html
+        Fetches raw HTML from all paginated URLs concurrently using requests first
+        (bounded globally and per host, see fetch_engine.AsyncFetcher),
+        falls back to a pool of warm undetected_chromedriver browsers if needed (see browser_pool.BrowserPool),
+        cleans it (see html_cleaner.clean_html), and stores the cleaned HTML in the 'html' dict keyed by the paginated URL.
+        Pages are fetched conditionally against an on-disk cache (see http_cache.HTTPCache):
+        a 304 response or an identical body reuses the cached cleaned HTML and marks the URL as 'unchanged'.
+        The new cache entries are committed by save_to_db, once the pages' articles are stored.
+        """
+        cache = self.http_cache
+        fetcher = AsyncFetcher(
+            max_concurrency=int(os.environ.get("SCRAPER_MAX_CONCURRENCY", 8)),
+            per_host=int(os.environ.get("SCRAPER_PER_HOST_CONCURRENCY", 2)),
+            timeout=30,
+        )
+
+        def store_page(page, single_url, raw_html, etag=None, last_modified=None):
+            body_hash = content_hash(raw_html)
+            cached = cache.get(single_url)
+            if cached and cached.get("content_hash") == body_hash:
+                page["html"][single_url] = cached["cleaned_html"]
+                page["unchanged"].add(single_url)
+                cache.put(single_url, body_hash, cached["cleaned_html"], etag, last_modified)
+                return False
+            page["html"][single_url] = clean_html(raw_html)
+            cache.put(single_url, body_hash, page["html"][single_url], etag, last_modified)
+            return True
 
         for page in self.webpages:
             if page['base_url'] not in page["paginated_url"]:
                 page["paginated_url"].append(page["base_url"])
-            
+
+        # Fetch every paginated URL of every source concurrently
+        all_urls = [url for page in self.webpages for url in page["paginated_url"]]
+        started = time.perf_counter()
+        fetched = fetcher.run(all_urls, {url: cache.conditional_headers(url) for url in all_urls})
+        print(f"⏱️ Fetched {len(fetched)} URLs with requests in {time.perf_counter() - started:.1f}s")
+
+        fallback = []
+        for page in self.webpages:
             for single_url in page["paginated_url"]:
-                try:
-                    # First try with requests
-                    response = session.get(single_url, timeout=30)
-                    response.raise_for_status()
-                    raw_html = response.text
-                    page["html"][single_url] = clean_html(raw_html)
-                    print(f"✅ Successfully fetched {single_url} using requests")
-                    continue
-                except Exception as e:
-                    print(f"⚠️ Failed to fetch {single_url} with requests: {e}")
-                    print("Falling back to Selenium...")
-
-                # Fall back to Selenium if requests fails
-                try:
-                    options = uc.ChromeOptions()
-                    options.add_argument("--headless=new")
-                    options.add_argument("--disable-blink-features=AutomationControlled")
-                    options.add_argument("--no-sandbox")
-                    options.add_argument("--disable-dev-shm-usage")
-                    options.add_argument("--disable-gpu")
-                    options.add_argument("--window-size=1920,1080")
-                    options.add_argument("--remote-debugging-port=9222")
-                    options.add_argument("--disable-setuid-sandbox")
-                    options.add_argument("--disable-extensions")
-                    options.add_argument("--disable-infobars")
-                    options.add_argument("--single-process")
-                    options.add_argument("--disable-dev-tools")
-                    options.add_argument("--ignore-certificate-errors")
-                    options.add_argument("--homedir=/tmp")
+                result = fetched.get(single_url)
+                if isinstance(result, requests.Response):
+                    cached = cache.get(single_url)
+                    if result.status_code == 304 and cached:
+                        page["html"][single_url] = cached["cleaned_html"]
+                        page["unchanged"].add(single_url)
+                        print(f"♻️ Not modified since last run: {single_url}")
+                        continue
+                    if result.status_code != 304:
+                        changed = store_page(
+                            page, single_url, result.text,
+                            etag=result.headers.get("ETag"),
+                            last_modified=result.headers.get("Last-Modified"),
+                        )
+                        if changed:
+                            print(f"✅ Successfully fetched {single_url} using requests")
+                        else:
+                            print(f"♻️ Unchanged content since last run: {single_url}")
+                        continue
+                    result = "304 Not Modified without a cached copy"
+                print(f"⚠️ Failed to fetch {single_url} with requests: {result}")
+                print("Falling back to Selenium...")
+                fallback.append((page, single_url))
 
+        if not fallback:
+            return
+
+        # Fall back to Selenium if requests fails, reusing a small pool of warm browsers
+        pool = BrowserPool(
+            size=min(len(fallback), int(os.environ.get("SCRAPER_BROWSER_POOL_SIZE", 2))),
+            max_pages=int(os.environ.get("SCRAPER_BROWSER_MAX_PAGES", 25)),
+        )
+        try:
+            with ThreadPoolExecutor(max_workers=pool.size) as executor:
+                futures = {executor.submit(pool.fetch, single_url): (page, single_url) for page, single_url in fallback}
+                for future in as_completed(futures):
+                    page, single_url = futures[future]
                     try:
-                        # Use undetected-chromedriver with version_main parameter to automatically match Chrome version
-                        driver = uc.Chrome(options=options, use_subprocess=True)
-                    except Exception as chrome_error:
-                        print(f"⚠️ Error with default Chrome setup: {chrome_error}")
-                        print("Trying with explicit version handling...")
-                        try:
-                            # Get the installed Chrome version using selenium-stealth
-                            import subprocess
-                            version_output = ""
-                            try:
-                                if os.name == 'nt':  # Windows
-                                    process = subprocess.Popen(
-                                        'reg query "HKEY_CURRENT_USER\\Software\\Google\\Chrome\\BLBeacon" /v version',
-                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True
-                                    )
-                                    output, error = process.communicate()
-                                    version_output = output.decode('utf-8')
-                                    chrome_version = re.search(r'version\s+REG_SZ\s+([\d.]+)', version_output).group(1)
-                                else:  # Linux/Mac
-                                    process = subprocess.Popen(
-                                        'google-chrome --version',
-                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True
-                                    )
-                                    output, error = process.communicate()
-                                    version_output = output.decode('utf-8')
-                                    chrome_version = re.search(r'Chrome\s+([\d.]+)', version_output).group(1)
-                                
-                                main_version = int(chrome_version.split('.')[0])
-                                print(f"Detected Chrome version: {chrome_version} (Main: {main_version})")
-                                driver = uc.Chrome(options=options, version_main=main_version, use_subprocess=True)
-                            except Exception as version_error:
-                                print(f"⚠️ Error detecting Chrome version: {version_error}")
-                                print(f"Version output: {version_output}")
-                                # If we still can't detect, try with a hardcoded recent version
-                                driver = uc.Chrome(options=options, version_main=114, use_subprocess=True)
-                        except Exception as detailed_error:
-                            print(f"❌ Failed to create Chrome driver with explicit version: {detailed_error}")
-                            # Skip this URL and continue with the next one
-                            continue
-                            
-                    try:
-                        driver.get(single_url)
-                        raw_html = driver.page_source
-                        page["html"][single_url] = clean_html(raw_html)
-                        print(f"✅ Successfully fetched {single_url} using Selenium")
-                    finally:
-                        driver.quit()
-                except Exception as e:
-                    print(f"❌ Failed to fetch {single_url} with both methods: {e}")
-                    continue
+                        if store_page(page, single_url, future.result()):
+                            print(f"✅ Successfully fetched {single_url} using Selenium")
+                        else:
+                            print(f"♻️ Unchanged content since last run: {single_url}")
+                    except Exception as e:
+                        print(f"❌ Failed to fetch {single_url} with both methods: {e}")
+        finally:
+            pool.close()
 
     def extract_news_articles_with_chatgpt(self):
         """
         For each cleaned HTML (keyed by URL in the 'html' dict),
         uses the OpenAI API to extract news article information.
+        Identical pages (same URL and cleaned-HTML hash) reuse the extraction stored in the
+        'crypto_extraction_cache' table without an API call.
+        Pages larger than SCRAPER_CHUNK_TOKENS are split on element boundaries and the chunks are
+        extracted, then merged and de-duplicated by link (nothing is truncated).
+        The chunks of all pages are sent concurrently through one LLMDispatcher, within the account's
+        rate limits (OPENAI_REQUESTS_PER_MINUTE, OPENAI_TOKENS_PER_MINUTE, SCRAPER_LLM_CONCURRENCY).
+        Chunks answered before (same model, prompt and HTML) come from the LLM response cache.
         The extracted markdown is accumulated per URL and stored in the 'extracted_news' dict.
         """
         # Check if OpenAI API key is available before trying to use it
@@ -296,44 +356,228 @@ class NewsScrapperGeneral:
                     page["extracted_news"][url_key] = ""
             return
 
+        # One client for the whole run; retries are left to the dispatcher, which knows about the shared budget
+        self.llm_dispatcher = LLMDispatcher(
+            openai.OpenAI(api_key=OPENAI_API_KEY, max_retries=0),
+            max_concurrency=int(os.environ.get("SCRAPER_LLM_CONCURRENCY", 8)),
+            requests_per_minute=int(os.environ.get("OPENAI_REQUESTS_PER_MINUTE", 500)),
+            tokens_per_minute=int(os.environ.get("OPENAI_TOKENS_PER_MINUTE", 30000)),
+        )
+        self.llm_cache = open_cache("crypto_llm_cache", label="LLM response")
+        cache_hits = 0
+        cache_misses = 0
+        stored_extractions = self.load_stored_extractions(
+            [url_key for page in self.webpages for url_key in page["html"].keys()]
+        )
+        known_links = self.load_known_links([
+            link
+            for page in self.webpages
+            for url_key, html_content in page["html"].items()
+            if url_key not in page["unchanged"]
+            for link in extract_links(html_content, url_key)
+        ])
+        templates = self.load_site_templates([page["base_url"] for page in self.webpages])
+        relearn = set()
+        template_hits = 0
+        chunk_tokens = int(os.environ.get("SCRAPER_CHUNK_TOKENS", DEFAULT_CHUNK_TOKENS))
+        # Pages that need the LLM: (page, url_key, html_content, html_hash, number of chunks)
+        pending = []
+        llm_requests = []
+
         for page in self.webpages:
             for url_key, html_content in page["html"].items():
+                if url_key in page["unchanged"]:
+                    print(f"♻️ Skipping extraction for unchanged page: {url_key}")
+                    continue
                 if not isinstance(html_content, str):
                     print("Skipping non-string content for URL:", url_key)
                     continue
-                raw_html = html_content[:100000]
-                parsed_url = urlparse(page["base_url"])
-                base_url = f"{parsed_url.scheme}://{parsed_url.netloc}/"
-                prompt = f"""
-                You are an AI that extracts structured data from raw HTML of a crypto news portal.
-                Extract the following details for each news article:
-                - **Title**: the title of the article.
-                - **Publication Date**: If no date is explicitly given, return null.
-                - **Author**: the name(s) of the author(s).
-                - **Link**: the article's full hyperlink. If the hyperlink is relative, prepend the base URL (e.g., "https://cointelegraph.com/") so that the result is an absolute URL starting with "http://" or "https://".
-                Extract this from the following HTML:
-                ```html
-                {raw_html}
-                Return the result as a JSON array of objects, e.g.:
-                [{{"Title": "Example", "Publication Date": "2023-01-01", "Author": "John Doe", "Link": "https://cointelegraph.com/article1"}}, ...]
-                ```
-                """
-                try:
-                    client = openai.OpenAI(api_key=OPENAI_API_KEY)
-                    response = client.chat.completions.create(
-                        model="gpt-4o",
-                        messages=[{"role": "system", "content": prompt}],
-                        temperature=0.1,
-                        max_tokens=2000
-                    )
-                    extracted_text = response.choices[0].message.content.strip()
-                    print(f"✅ Extracted for {url_key}:\n{extracted_text[:500]}...\n")
-                    page["extracted_news"][url_key] = extracted_text
-                except Exception as e:
-                    print(f"❌ Error with OpenAI API for {url_key}: {e}")
-                    page["extracted_news"][url_key] = ""
+                html_hash = content_hash(html_content)
+                stored = stored_extractions.get(url_key)
+                if stored and stored["html_hash"] == html_hash:
+                    cache_hits += 1
+                    page["extracted_news"][url_key] = stored["extracted_json"]
+                    print(f"♻️ Reusing stored extraction for identical page: {url_key}")
+                    continue
+                cache_misses += 1
 
-    def flatten_news(self):
+                template = templates.get(page["base_url"])
+                if template:
+                    articles = apply_template(template, html_content, url_key)
+                    if template_is_healthy(template, articles):
+                        template_hits += 1
+                        extracted_text = json.dumps(articles)
+                        page["extracted_news"][url_key] = extracted_text
+                        self.store_extraction(url_key, html_hash, extracted_text)
+                        print(f"🧩 Extracted {len(articles)} articles for {url_key} with the learned template")
+                        continue
+                    print(f"⚠️ Template yield dropped for {url_key} ({len(articles)} vs {template['yield']}), falling back to the LLM")
+                    relearn.add(page["base_url"])
+
+                if self.extraction_mode == "link_diff":
+                    # Only links stored in the news table count as known: a link merely seen on an earlier version
+                    # of the page may belong to an article that never got saved. Navigation fragments are sent
+                    # again, but their answer stays the same and comes from the LLM response cache.
+                    new_links, fragments = new_link_fragments(html_content, url_key, known_links)
+                    if not new_links:
+                        print(f"🔗 No new links on {url_key}, skipping the API call")
+                        page["extracted_news"][url_key] = "[]"
+                        self.store_extraction(url_key, html_hash, "[]")
+                        continue
+                    raw_html = "".join(fragments)
+                    print(f"🔗 {len(new_links)} new links on {url_key}: sending {len(raw_html)} of {len(html_content)} characters")
+                else:
+                    raw_html = html_content
+                chunks = chunk_html(raw_html, max_tokens=chunk_tokens)
+                if len(chunks) > 1:
+                    print(f"✂️ Split {url_key} into {len(chunks)} chunks of at most ~{chunk_tokens} tokens")
+                pending.append((page, url_key, html_content, html_hash, len(chunks)))
+                llm_requests.extend(self.build_extraction_request(chunk) for chunk in chunks)
+
+        # All chunks of all pages go out together, so the run takes as long as the slowest page
+        started = time.perf_counter()
+        results = self.llm_cache.complete_many(
+            llm_requests, EXTRACTION_PROMPT_VERSION, self.llm_dispatcher.run
+        ) if llm_requests else []
+        if llm_requests:
+            print(f"⏱️ {len(llm_requests)} LLM calls finished in {time.perf_counter() - started:.1f}s "
+                  f"({self.llm_dispatcher.retries} retries)")
+
+        offset = 0
+        for page, url_key, html_content, html_hash, chunk_count in pending:
+            page_requests = llm_requests[offset:offset + chunk_count]
+            page_results = results[offset:offset + chunk_count]
+            offset += chunk_count
+            chunk_articles = []
+            for index, (request, result) in enumerate(zip(page_requests, page_results), 1):
+                if isinstance(result, Exception):
+                    print(f"❌ Error with OpenAI API for {url_key} (chunk {index}/{chunk_count}): {result}")
+                    continue
+                articles = self.parse_extracted_news(result, url_key, page["base_url"])
+                if articles is not None:
+                    chunk_articles.append(articles)
+                else:
+                    self.llm_cache.discard(request, EXTRACTION_PROMPT_VERSION)
+            failed = chunk_count - len(chunk_articles)
+            if failed == chunk_count:
+                page["extracted_news"][url_key] = ""
+                # Forget the cached copy so the next run retries this page instead of skipping it
+                self.http_cache.invalidate(url_key)
+                continue
+            articles = merge_articles(chunk_articles)
+            extracted_text = json.dumps(articles)
+            print(f"✅ Extracted {len(articles)} articles for {url_key}:\n{extracted_text[:500]}...\n")
+            page["extracted_news"][url_key] = extracted_text
+            if failed:
+                # Keep what was extracted, but neither store nor learn from an incomplete page
+                print(f"⚠️ {failed} of {chunk_count} chunks failed for {url_key}; it will be retried next run")
+                self.http_cache.invalidate(url_key)
+                continue
+            self.store_extraction(url_key, html_hash, extracted_text)
+            if page["base_url"] not in templates or page["base_url"] in relearn:
+                self.learn_site_template(page, url_key, html_content, extracted_text, known_links, templates)
+                relearn.discard(page["base_url"])
+
+        print(f"📊 Extraction cache: {cache_hits} hits, {cache_misses} misses")
+        self.llm_cache.close()
+        print(f"📊 Site templates: {template_hits} pages extracted without the LLM, {len(llm_requests)} LLM calls")
+
+    def build_extraction_request(self, raw_html):
+        """
+        Keyword arguments for the chat.completions.create call that extracts the articles of one chunk.
+        """
+        prompt = f"""
+        You are an AI that extracts structured data from raw HTML of a crypto news portal.
+        Extract the following details for each news article:
+        - **Title**: the title of the article.
+        - **Publication Date**: If no date is explicitly given, return null.
+        - **Author**: the name(s) of the author(s).
+        - **Link**: the article's full hyperlink. If the hyperlink is relative, prepend the base URL (e.g., "https://cointelegraph.com/") so that the result is an absolute URL starting with "http://" or "https://".
+        Extract this from the following HTML:
+        ```html
+        {raw_html}
+        Return the result as a JSON array of objects, e.g.:
+        [{{"Title": "Example", "Publication Date": "2023-01-01", "Author": "John Doe", "Link": "https://cointelegraph.com/article1"}}, ...]
+        ```
+        """
+        return {
+            "model": "gpt-4o",
+            "messages": [{"role": "system", "content": prompt}],
+            "temperature": 0.1,
+            "max_tokens": 2000,
+        }
+
+    def learn_site_template(self, page, url_key, html_content, extracted_text, known_links, templates):
+        """
+        Derive a CSS extraction template for the page's base URL from the LLM's extraction and store it,
+        so later runs can extract the site deterministically.
+        """
+        articles = self.parse_extracted_news(extracted_text, url_key, page["base_url"]) or []
+        template = learn_template(html_content, url_key, articles, known_links)
+        if not template:
+            print(f"🧩 Could not learn a reliable template for {page['base_url']} from {url_key}")
+            return
+        templates[page["base_url"]] = template
+        c = self.conn.cursor()
+        c.execute("""
+            INSERT INTO crypto_site_template (base_url, template_json, updated_time)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (base_url) DO UPDATE
+            SET template_json = EXCLUDED.template_json,
+                updated_time = EXCLUDED.updated_time;
+        """, (page["base_url"], json.dumps(template), datetime.now().isoformat()))
+        self.conn.commit()
+        c.close()
+        print(f"🧩 Learned template for {page['base_url']} (yield {template['yield']} articles)")
+
+    def load_site_templates(self, base_urls):
+        c = self.conn.cursor()
+        c.execute("SELECT base_url, template_json FROM crypto_site_template WHERE base_url = ANY(%s);", (list(base_urls),))
+        templates = {row["base_url"]: json.loads(row["template_json"]) for row in c.fetchall()}
+        c.close()
+        return templates
+
+    def load_stored_extractions(self, urls):
+        """
+        Returns {url: {"html_hash": ..., "extracted_json": ...}} for the given URLs from the 'crypto_extraction_cache' table.
+        """
+        c = self.conn.cursor()
+        c.execute(
+            "SELECT url, html_hash, extracted_json FROM crypto_extraction_cache WHERE url = ANY(%s);",
+            (list(urls),)
+        )
+        rows = c.fetchall()
+        c.close()
+        return {row["url"]: row for row in rows}
+
+    def load_known_links(self, links):
+        """
+        Returns the subset of the given links that is already stored in the 'crypto_news' table.
+        """
+        c = self.conn.cursor()
+        c.execute("SELECT Link FROM crypto_news WHERE Link = ANY(%s);", (list(set(links)),))
+        known = {row["link"] for row in c.fetchall()}
+        c.close()
+        return known
+
+    def store_extraction(self, url, html_hash, extracted_json):
+        c = self.conn.cursor()
+        c.execute("""
+            INSERT INTO crypto_extraction_cache (url, html_hash, extracted_json, updated_time)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (url) DO UPDATE
+            SET html_hash = EXCLUDED.html_hash,
+                extracted_json = EXCLUDED.extracted_json,
+                updated_time = EXCLUDED.updated_time;
+        """, (url, html_hash, extracted_json, datetime.now().isoformat()))
+        self.conn.commit()
+        c.close()
+
+    def parse_extracted_news(self, news_data, url_key, base_url):
+        """
+        Parse one extraction (JSON array, possibly fenced, or the legacy markdown list) into article dicts
+        with absolute links. Returns None if the extraction cannot be parsed.
+        """
         def convert_markdown_to_articles(markdown_text):
             blocks = re.split(r"\n(?=\d+\.)", markdown_text.strip())
             articles = []
@@ -352,51 +596,62 @@ class NewsScrapperGeneral:
                         articles.append(article)
             return articles
 
+        news_data = news_data.strip()
+        if news_data.startswith("```json"):
+            news_data = news_data[len("```json"):].strip()
+            if news_data.endswith("```"):
+                news_data = news_data[:-3].strip()
+        if not news_data.startswith("[") and not news_data.startswith("{"):
+            articles = convert_markdown_to_articles(news_data)
+        else:
+            try:
+                articles = json.loads(news_data)
+                if not isinstance(articles, list):
+                    print(f"Invalid JSON format for {url_key}: expected list, got {type(articles)}")
+                    return None
+            except json.JSONDecodeError as e:
+                print(f"⚠️ Error decoding JSON from extracted_news for {url_key}: {e}")
+                print(f"Problematic content:\n{news_data}")
+                return None
+        valid_articles = []
+        for article in articles:
+            if not isinstance(article, dict):  # Skip if not a dict
+                print(f"Skipping invalid article for {url_key}: {article}")
+                continue
+            link = article.get("Link", "") or ""  # Default to empty string if None
+            link = link.strip()
+            if not link:
+                continue
+            if not link.startswith("http"):
+                article["Link"] = urljoin(base_url, link)
+            valid_articles.append(article)
+        return valid_articles
+
+    def flatten_news(self):
         for page in self.webpages:
             new_extracted = {}
             for url_key, news_data in page.get("extracted_news", {}).items():
                 if not news_data:  # Skip empty or None
                     print(f"Skipping empty news data for {url_key}")
                     continue
-                news_data = news_data.strip()
-                print(f"Processing news data for {url_key}:\n{news_data}")  # Debug output
-                if news_data.startswith("```json"):
-                    news_data = news_data[len("```json"):].strip()
-                    if news_data.endswith("```"):
-                        news_data = news_data[:-3].strip()
-                if not news_data.startswith("[") and not news_data.startswith("{"):
-                    articles = convert_markdown_to_articles(news_data)
-                else:
-                    try:
-                        articles = json.loads(news_data)
-                        if not isinstance(articles, list):
-                            print(f"Invalid JSON format for {url_key}: expected list, got {type(articles)}")
-                            continue
-                    except json.JSONDecodeError as e:
-                        print(f"⚠️ Error decoding JSON from extracted_news for {url_key}: {e}")
-                        print(f"Problematic content:\n{news_data}")
-                        continue
-                base_url = page.get("base_url", "")
-                valid_articles = []
-                for article in articles:
-                    if not isinstance(article, dict):  # Skip if not a dict
-                        print(f"Skipping invalid article for {url_key}: {article}")
-                        continue
-                    link = article.get("Link", "") or ""  # Default to empty string if None
-                    link = link.strip()
-                    if not link:
-                        continue
-                    if not link.startswith("http"):
-                        article["Link"] = urljoin(base_url, link)
-                    valid_articles.append(article)
+                print(f"Processing news data for {url_key}:\n{news_data.strip()}")  # Debug output
+                valid_articles = self.parse_extracted_news(news_data, url_key, page.get("base_url", ""))
+                if valid_articles is None:
+                    continue
                 new_extracted[url_key] = valid_articles
                 print(f"✅ Successfully flattened {len(valid_articles)} articles for {url_key}")
             page["extracted_news"] = new_extracted
 
     def save_to_db(self):
+        """
+        Insert all extracted articles with one batched INSERT (psycopg2.extras.execute_values) instead of
+        one round trip per article. Articles whose title is already stored are skipped.
+        Returns (inserted, skipped).
+        """
         conn = self.conn
-        c = conn.cursor()
         created_time = datetime.now().isoformat()
+        rows = {}
+        candidates = 0
         for page in self.webpages:
             base_url = page.get("base_url")
             for paginated_url, articles in page.get("extracted_news", {}).items():
@@ -407,23 +662,48 @@ class NewsScrapperGeneral:
                     link = article.get("Link")
                     if not (title and link and base_url and paginated_url):
                         continue
-                    insert_sql = """
-                    INSERT INTO crypto_news (Title, Author, Publication_Date, Link, base_url, paginated_url, created_time)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (Title) DO NOTHING;
-                    """
-                    c.execute(insert_sql, (title, author, pub_date, link, base_url, paginated_url, created_time))
+                    candidates += 1
+                    # Dates are normalized once, here; the extracted string is kept for dates that do not parse
+                    pub_date_raw = pub_date.strip() if isinstance(pub_date, str) else None
+                    if pub_date_raw and pub_date_raw.lower() in ("null", "none"):
+                        pub_date_raw = None
+                    # Same title twice in one run: the first one wins, as with the per-row inserts
+                    rows.setdefault(title, (
+                        title, author, self.normalize_date(pub_date_raw), pub_date_raw,
+                        link, base_url, paginated_url, created_time,
+                    ))
+        if not rows:
+            print("ℹ️ No articles to save")
+            self.http_cache.commit()
+            return 0, 0
+
+        c = conn.cursor()
+        inserted = psycopg2.extras.execute_values(c, """
+            INSERT INTO crypto_news (Title, Author, Publication_Date, publication_date_raw, Link, base_url, paginated_url, created_time)
+            VALUES %s
+            ON CONFLICT (Title) DO NOTHING
+            RETURNING news_id;
+        """, list(rows.values()), page_size=BULK_INSERT_PAGE_SIZE, fetch=True)
         conn.commit()
-        print("✅ Data saved to PostgreSQL database:", self.db_config['dbname'])
+        c.close()
+        # Only now are the fetched pages done: mark them current in the HTTP cache
+        self.http_cache.commit()
+        skipped = candidates - len(inserted)
+        print(f"✅ Data saved to PostgreSQL database: {self.db_config['dbname']} "
+              f"({len(inserted)} inserted, {skipped} skipped as already stored or duplicated)")
+        return len(inserted), skipped
 
 
     def update_article_details(self):
         """
-        For each record in the 'crypto_news' table where the article text, Author, or Publication_Date is NULL,
+        For each record in the 'crypto_news' table that has not been enriched yet (enriched_at is NULL),
         scrape the main article text from the Link using Newspaper3k, and update the record.
         The scraped main text is saved under the 'article' column, and if Author or Publication_Date
         are missing, they are updated as well.
         If the article text cannot be retrieved successfully, the record will be dropped from the database.
+        Articles are downloaded on a thread pool (at most SCRAPER_PER_DOMAIN_DOWNLOADS at a time per site)
+        and parsed on a process pool by ArticleFetcher, while this thread writes the results back in
+        batches of ARTICLE_WRITE_BATCH_SIZE.
         """
         config = Config()
         config.browser_user_agent = (
@@ -433,81 +713,183 @@ class NewsScrapperGeneral:
         )
         conn = self.conn
         c = conn.cursor()
-        # Update the rows where the article text, Author, or Publication_Date is NULL
-        c.execute("SELECT Title, Link, Author, Publication_Date FROM crypto_news WHERE article IS NULL OR Author IS NULL OR Publication_Date IS NULL;")
-        rows = c.fetchall()
-        
-        for row in rows:
-            title = row['title']
-            link = row['link']
-            db_author = row['author']
-            db_pub_date = row['publication_date']
-            try:
-                art = Article(link, config=config)
-                art.download()
-                art.parse()
-                main_text = art.text
-                
+        # Claim the rows that have not been enriched yet (partial index on enriched_at)
+        c.execute("SELECT Title, Link, Author, Publication_Date FROM crypto_news WHERE enriched_at IS NULL;")
+        rows_by_link = {}
+        for row in c.fetchall():
+            rows_by_link.setdefault(row['link'], []).append(row)
+        c.close()
+
+        fetcher = ArticleFetcher(
+            download_workers=int(os.environ.get("SCRAPER_DOWNLOAD_WORKERS", 16)),
+            per_domain=int(os.environ.get("SCRAPER_PER_DOMAIN_DOWNLOADS", 4)),
+            parse_workers=int(os.environ.get("SCRAPER_PARSE_WORKERS", 0)) or None,
+            config=config,
+        )
+        updates = []
+        deletions = []
+        started = time.perf_counter()
+        for link, result in fetcher.fetch_all(rows_by_link):
+            for row in rows_by_link[link]:
+                title = row['title']
+                if isinstance(result, Exception):
+                    print(f"❌ Error scraping article at {link}: {result}")
+                    # Drop the record if scraping failed
+                    deletions.append(title)
+                    continue
+                main_text = result["text"]
+
                 # Verify if the article text was successfully retrieved
                 if not main_text or len(main_text.strip()) < 50:  # Minimum length check
                     print(f"❌ Article text retrieval failed for: {title}")
                     # Drop the record if text retrieval failed
-                    c.execute("DELETE FROM crypto_news WHERE Title = %s", (title,))
-                    print(f"Deleted record for article: {title}")
+                    deletions.append(title)
                     continue
-                
-                scraped_author = ", ".join(art.authors) if art.authors else db_author
-                scraped_pub_date = art.publish_date.isoformat() if art.publish_date else db_pub_date
-                update_sql = """
-                UPDATE crypto_news 
-                SET article = %s, Author = COALESCE(%s, Author),
-                    Publication_Date = COALESCE(%s, Publication_Date)
-                WHERE Title = %s;
-                """
-                c.execute(update_sql, (main_text, scraped_author, scraped_pub_date, title))
-                print(f"✅ Updated details for article: {title}")
-            except Exception as e:
-                print(f"❌ Error scraping article at {link}: {e}")
-                # Drop the record if scraping failed
-                c.execute("DELETE FROM crypto_news WHERE Title = %s", (title,))
-                print(f"Deleted record for article: {title}")
-        conn.commit()
-        print("✅ Article details updated in the database.")
+
+                scraped_author = ", ".join(result["authors"]) if result["authors"] else row['author']
+                scraped_pub_date = self.normalize_date(result["publish_date"])
+                updates.append((title, main_text, scraped_author, scraped_pub_date))
+                print(f"✅ Scraped details for article: {title}")
+            if len(updates) + len(deletions) >= ARTICLE_WRITE_BATCH_SIZE:
+                self.write_article_details(updates, deletions)
+                updates, deletions = [], []
+        self.write_article_details(updates, deletions)
+        print(f"✅ Article details updated in the database ({len(rows_by_link)} links in {time.perf_counter() - started:.1f}s).")
+
+    def write_article_details(self, updates, deletions):
+        """
+        Apply one batch of update_article_details results in a single transaction:
+        updates are (title, article, author, publication_date) tuples, deletions are titles.
+        """
+        c = self.conn.cursor()
+        if updates:
+            psycopg2.extras.execute_values(c, """
+                UPDATE crypto_news AS n
+                SET article = v.article,
+                    Author = COALESCE(v.author, n.Author),
+                    Publication_Date = COALESCE(v.publication_date::date, n.Publication_Date),
+                    enriched_at = now()
+                FROM (VALUES %s) AS v (title, article, author, publication_date)
+                WHERE n.Title = v.title;
+            """, updates, page_size=len(updates))
+        if deletions:
+            c.execute("DELETE FROM crypto_news WHERE Title = ANY(%s);", (deletions,))
+        self.conn.commit()
+        c.close()
+
+    def add_stage_watermarks(self):
+        """
+        Adds the per-stage watermark columns to 'crypto_news' (once) and their partial indexes:
+          - enriched_at: set by update_article_details once the article body is stored
+          - categorized_at: set by categorizationLLM.py once keywords, category and summary are stored
+            (category_source is 'classifier' when the local pre-classifier set them instead of the LLM)
+          - scored_at: set once InfluentialFactor is stored, by categorizationLLM.py in the same pass as the
+            category (the sub-scores go to influence_scores), or by evaluate_articles.py for older rows
+            (score_source is 'model' when the local influence model scored them instead of the LLM)
+        Each stage claims the rows the previous stage finished and it has not, through its own partial
+        index, so a run costs the same however many processed articles the table holds.
+        Existing rows are backfilled from the columns the stages used to check for NULL.
+        """
+        c = self.conn.cursor()
+        c.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'crypto_news'
+              AND column_name IN ('news_id', 'enriched_at', 'influence_scores', 'category_source', 'score_source');
+        """)
+        columns = {row["column_name"] for row in c.fetchall()}
+        if "news_id" not in columns:
+            c.close()
+            return
+        if "enriched_at" not in columns:
+            print("🛠️ Adding pipeline watermark columns to crypto_news")
+            c.execute("""
+                ALTER TABLE crypto_news
+                    ADD COLUMN IF NOT EXISTS enriched_at TIMESTAMPTZ,
+                    ADD COLUMN IF NOT EXISTS categorized_at TIMESTAMPTZ,
+                    ADD COLUMN IF NOT EXISTS scored_at TIMESTAMPTZ;
+                UPDATE crypto_news
+                SET enriched_at = CASE WHEN article IS NOT NULL THEN now() END,
+                    categorized_at = CASE WHEN summary IS NOT NULL AND keywords IS NOT NULL AND main_category IS NOT NULL THEN now() END,
+                    scored_at = CASE WHEN InfluentialFactor IS NOT NULL THEN now() END;
+            """)
+        if "influence_scores" not in columns:
+            c.execute("ALTER TABLE crypto_news ADD COLUMN IF NOT EXISTS influence_scores TEXT;")
+        if "category_source" not in columns:
+            c.execute("ALTER TABLE crypto_news ADD COLUMN IF NOT EXISTS category_source TEXT;")
+        if "score_source" not in columns:
+            c.execute("ALTER TABLE crypto_news ADD COLUMN IF NOT EXISTS score_source TEXT;")
+        c.execute("""
+            CREATE INDEX IF NOT EXISTS crypto_news_pending_enrichment_idx ON crypto_news (news_id)
+            WHERE enriched_at IS NULL;
+            CREATE INDEX IF NOT EXISTS crypto_news_pending_categorization_idx ON crypto_news (news_id)
+            WHERE categorized_at IS NULL AND enriched_at IS NOT NULL;
+            CREATE INDEX IF NOT EXISTS crypto_news_pending_scoring_idx ON crypto_news (news_id)
+            WHERE scored_at IS NULL AND categorized_at IS NOT NULL;
+        """)
+        self.conn.commit()
+        c.close()
+
+    def create_query_indexes(self):
+        """
+        Creates the indexes for the pipeline's hot queries on existing databases (fresh ones get them
+        from setup_postgres.sql):
+          - crypto_news_top_articles_idx: the scored articles of a date window, by InfluentialFactor (fetch_top_articles)
+          - crypto_news_link_idx: the lookup of already stored links (load_known_links)
+          - crypto_newsletter_creation_idx: the latest newsletter (render_html_from_db, Newsletter_send)
+        """
+        c = self.conn.cursor()
+        c.execute("SELECT to_regclass('crypto_news') AS news, to_regclass('crypto_newsletter') AS newsletter;")
+        tables = c.fetchone()
+        if tables["news"]:
+            c.execute("""
+                CREATE INDEX IF NOT EXISTS crypto_news_top_articles_idx ON crypto_news (Publication_Date, InfluentialFactor DESC)
+                WHERE InfluentialFactor IS NOT NULL;
+                CREATE INDEX IF NOT EXISTS crypto_news_link_idx ON crypto_news (Link);
+            """)
+        if tables["newsletter"]:
+            c.execute("CREATE INDEX IF NOT EXISTS crypto_newsletter_creation_idx ON crypto_newsletter (creation DESC);")
+        self.conn.commit()
+        c.close()
 
     def normalize_and_update_publication_dates(self):
         """
-        Connects to PostgreSQL database, retrieves publication dates, normalizes them to "%Y-%m-%d",
-        and updates them only if the date isn't already in the correct format.
+        Fills Publication_Date for the rows that have a raw date string but no parsed date yet
+        (found through the partial index), parsing each string once and writing all results in one UPDATE.
+        Rows that already have a date are never read again, nor are rows whose string did not parse: they
+        are flagged publication_date_unparseable (reset the flag to parse them again, e.g. after
+        normalize_date learned a new format).
         """
         conn = self.conn
         c = conn.cursor()
-        
-        c.execute("SELECT news_id, publication_date FROM crypto_news")
+
+        c.execute("""
+            SELECT news_id, publication_date_raw FROM crypto_news
+            WHERE Publication_Date IS NULL AND publication_date_raw IS NOT NULL AND NOT publication_date_unparseable;
+        """)
         rows = c.fetchall()
-        
+
+        updates = []
+        unparseable = []
         for row in rows:
-            news_id = row['news_id']
-            pub_date = row['publication_date']
-            
-            # Skip processing if date is already in the correct format
-            try:
-                # This ensures the date is strictly "%Y-%m-%d"
-                if parser.parse(pub_date).strftime("%Y-%m-%d") == pub_date:
-                    continue  # Date already in the target format, skip updating
-            except:
-                pass  # If parsing fails here, it'll be handled below
-                
-            # Attempt to normalize date
-            normalized_date = self.normalize_date(pub_date)
-            
-            # Update only if normalization is successful
+            normalized_date = self.normalize_date(row['publication_date_raw'])
             if normalized_date:
-                c.execute("UPDATE crypto_news SET publication_date = %s WHERE news_id = %s", (normalized_date, news_id))
-                print(f"Updated news_id {news_id}: '{pub_date}' -> '{normalized_date}'")
+                updates.append((row['news_id'], normalized_date))
             else:
-                print(f"Skipping news_id {news_id} with unparseable date: '{pub_date}'")
+                print(f"Flagging news_id {row['news_id']} with unparseable date: '{row['publication_date_raw']}'")
+                unparseable.append(row['news_id'])
 
+        if updates:
+            psycopg2.extras.execute_values(c, """
+                UPDATE crypto_news AS n
+                SET Publication_Date = v.publication_date::date
+                FROM (VALUES %s) AS v (news_id, publication_date)
+                WHERE n.news_id = v.news_id;
+            """, updates, page_size=1000)
+        if unparseable:
+            c.execute("UPDATE crypto_news SET publication_date_unparseable = true WHERE news_id = ANY(%s);", (unparseable,))
         conn.commit()
+        c.close()
+        print(f"📅 Normalized {len(updates)} of {len(rows)} unparsed publication dates, {len(unparseable)} flagged unparseable")
 
     def normalize_date(self, date_str):
         """
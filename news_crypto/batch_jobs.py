@@ -0,0 +1,249 @@
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# OpenAI accepts at most this many requests per batch file
+MAX_REQUESTS_PER_BATCH = 50000
+PENDING_STATUSES = {"validating", "in_progress", "finalizing"}
+
+
+def write_requests(path, requests):
+    """
+    Write (custom_id, chat.completions.create keyword arguments) pairs as a Batch API JSONL input file.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, body in requests:
+            f.write(json.dumps({"custom_id": str(custom_id), "method": "POST", "url": BATCH_ENDPOINT, "body": body}) + "\n")
+
+
+def parse_results(lines):
+    """
+    Parse Batch API output lines into {custom_id: message content or Exception}.
+    """
+    results = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        if item.get("error") or response.get("status_code") != 200:
+            results[item["custom_id"]] = Exception(str(item.get("error") or response.get("body")))
+            continue
+        results[item["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+    return results
+
+
+class OpenAIBatchBackend:
+    """
+    Runs batches on the OpenAI Batch API (completed within 24 hours, at half the synchronous price).
+    """
+    name = "openai"
+
+    def __init__(self, client, directory):
+        self.client = client
+        self.directory = directory
+
+    def submit(self, path):
+        with open(path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window="24h"
+        )
+        return batch.id
+
+    def poll(self, batch_id):
+        """
+        Returns "pending", "completed" or "failed". An expired batch still delivers the requests it
+        finished, so it counts as completed when it has an output file.
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status in PENDING_STATUSES:
+            return "pending"
+        if batch.status == "completed" or (batch.status == "expired" and batch.output_file_id):
+            return "completed"
+        return "failed"
+
+    def results(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        if not batch.output_file_id:
+            return {}
+        return parse_results(self.client.files.content(batch.output_file_id).text.splitlines())
+
+
+class LocalBatchBackend:
+    """
+    File-based stand-in for the Batch API, for running the whole offline flow without network access.
+    A submitted batch is a directory holding input.jsonl; it is completed once output.jsonl (same format
+    as the Batch API's output file) appears next to it. If a responder is given (a function from request
+    body to message content), polling produces output.jsonl right away.
+    """
+    name = "local"
+
+    def __init__(self, directory, responder=None):
+        self.directory = directory
+        self.responder = responder
+
+    def _job_dir(self, batch_id):
+        return os.path.join(self.directory, batch_id)
+
+    def submit(self, path):
+        batch_id = f"local_{uuid.uuid4().hex[:12]}"
+        os.makedirs(self._job_dir(batch_id))
+        shutil.copy(path, os.path.join(self._job_dir(batch_id), "input.jsonl"))
+        return batch_id
+
+    def _run(self, batch_id):
+        with open(os.path.join(self._job_dir(batch_id), "input.jsonl"), encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        lines = []
+        for request in requests:
+            try:
+                content = self.responder(request["body"])
+                response = {"status_code": 200, "body": {"choices": [{"message": {"role": "assistant", "content": content}}]}}
+                lines.append({"custom_id": request["custom_id"], "response": response, "error": None})
+            except Exception as e:
+                lines.append({"custom_id": request["custom_id"], "response": None, "error": {"message": str(e)}})
+        output_path = os.path.join(self._job_dir(batch_id), "output.jsonl")
+        with open(output_path + ".tmp", "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(line) + "\n" for line in lines)
+        os.replace(output_path + ".tmp", output_path)
+
+    def poll(self, batch_id):
+        if not os.path.isdir(self._job_dir(batch_id)):
+            return "failed"
+        if not os.path.exists(os.path.join(self._job_dir(batch_id), "output.jsonl")):
+            if self.responder is None:
+                return "pending"
+            self._run(batch_id)
+        return "completed"
+
+    def results(self, batch_id):
+        with open(os.path.join(self._job_dir(batch_id), "output.jsonl"), encoding="utf-8") as f:
+            return parse_results(f)
+
+
+def create_backend(kind, directory, client=None, responder=None):
+    os.makedirs(directory, exist_ok=True)
+    if kind == "openai":
+        return OpenAIBatchBackend(client, directory)
+    if kind == "local":
+        return LocalBatchBackend(directory, responder)
+    raise ValueError(f"Unknown batch backend: {kind!r} (expected 'openai' or 'local')")
+
+
+class BatchRunner:
+    """
+    Submits the requests of one pipeline stage as batches and applies their results when they are done.
+    Submitted batches are tracked in job_table, so a batch submitted by one cron run is collected by a
+    later one, and a row is never in two open batches at once. Results are applied in the same
+    transaction that marks the batch applied, so a crash mid-way can never apply a batch twice.
+    """
+
+    def __init__(self, conn, job_table, stage, backend):
+        self.conn = conn
+        self.job_table = job_table
+        self.stage = stage
+        self.backend = backend
+        c = conn.cursor()
+        c.execute(f"""
+            CREATE TABLE IF NOT EXISTS {job_table} (
+                batch_id TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                backend TEXT NOT NULL,
+                news_ids INTEGER[] NOT NULL,
+                status TEXT NOT NULL,
+                submitted_time TEXT NOT NULL,
+                finished_time TEXT
+            );
+        """)
+        conn.commit()
+        c.close()
+
+    def _open_jobs(self):
+        c = self.conn.cursor()
+        c.execute(
+            f"SELECT batch_id, news_ids FROM {self.job_table} WHERE stage = %s AND backend = %s AND status = 'submitted';",
+            (self.stage, self.backend.name)
+        )
+        jobs = c.fetchall()
+        c.close()
+        return jobs
+
+    def open_news_ids(self):
+        return {news_id for job in self._open_jobs() for news_id in job["news_ids"]}
+
+    def _finish(self, c, batch_id, status):
+        c.execute(
+            f"UPDATE {self.job_table} SET status = %s, finished_time = %s WHERE batch_id = %s;",
+            (status, datetime.now().isoformat(), batch_id)
+        )
+
+    def collect(self, apply):
+        """
+        Poll the open batches and apply the results of the finished ones. apply(cursor, news_id, content)
+        writes one result with a single statement and raises if the content is unusable; such rows stay
+        pending and are part of the next batch. Returns the number of rows the results changed.
+        """
+        applied = 0
+        for job in self._open_jobs():
+            batch_id = job["batch_id"]
+            status = self.backend.poll(batch_id)
+            if status == "pending":
+                print(f"⏳ Batch {batch_id} ({self.stage}) is still running")
+                continue
+            c = self.conn.cursor()
+            if status == "failed":
+                print(f"❌ Batch {batch_id} ({self.stage}) failed; its rows will be resubmitted")
+                self._finish(c, batch_id, "failed")
+                self.conn.commit()
+                c.close()
+                continue
+            results = self.backend.results(batch_id)
+            job_applied = 0
+            for custom_id, content in results.items():
+                if isinstance(content, Exception):
+                    print(f"❌ Batch {batch_id}: request {custom_id} failed: {content}")
+                    continue
+                try:
+                    c.execute("SAVEPOINT apply_result;")
+                    apply(c, int(custom_id), content)
+                    # 0 when the row was already written by an earlier run
+                    job_applied += max(c.rowcount, 0)
+                    c.execute("RELEASE SAVEPOINT apply_result;")
+                except Exception as e:
+                    c.execute("ROLLBACK TO SAVEPOINT apply_result;")
+                    print(f"❌ Batch {batch_id}: could not apply result for news_id {custom_id}: {e}")
+            self._finish(c, batch_id, "applied")
+            self.conn.commit()
+            c.close()
+            applied += job_applied
+            print(f"✅ Batch {batch_id} ({self.stage}): applied {job_applied} of {len(job['news_ids'])} results")
+        return applied
+
+    def submit(self, requests):
+        """
+        Submit (news_id, chat.completions.create keyword arguments) pairs, in batches of at most
+        MAX_REQUESTS_PER_BATCH. Returns the batch ids.
+        """
+        batch_ids = []
+        for start in range(0, len(requests), MAX_REQUESTS_PER_BATCH):
+            chunk = requests[start:start + MAX_REQUESTS_PER_BATCH]
+            path = os.path.join(
+                self.backend.directory, f"{self.stage}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{start}.jsonl"
+            )
+            write_requests(path, chunk)
+            batch_id = self.backend.submit(path)
+            c = self.conn.cursor()
+            c.execute(f"""
+                INSERT INTO {self.job_table} (batch_id, stage, backend, news_ids, status, submitted_time)
+                VALUES (%s, %s, %s, %s, 'submitted', %s);
+            """, (batch_id, self.stage, self.backend.name, [news_id for news_id, _ in chunk], datetime.now().isoformat()))
+            self.conn.commit()
+            c.close()
+            batch_ids.append(batch_id)
+            print(f"📤 Submitted batch {batch_id} ({self.stage}) with {len(chunk)} requests")
+        return batch_ids
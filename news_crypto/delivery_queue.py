@@ -0,0 +1,162 @@
+import psycopg2.extras
+from smtp_pool import is_transient
+
+
+# Deliveries claimed (and kept locked while they are sent) per transaction
+CLAIM_SIZE = 100
+# Sends after which a transiently failing delivery is given up
+MAX_ATTEMPTS = 5
+# A transient failure is retried after attempts * RETRY_DELAY
+RETRY_DELAY = "5 minutes"
+# Seconds a send run waits at most for the next retry to come due; later retries are left to the next run
+MAX_RETRY_WAIT = 15 * 60
+
+
+class DeliveryQueue:
+    """
+    Durable send queue of newsletter editions: one row per (edition, subscriber) in delivery_table with its
+    status ('pending', 'sent' or 'failed'), attempt count and last error.
+      - enqueue() adds the current subscribers of an edition (idempotent)
+      - claim() locks a chunk of due pending rows with FOR UPDATE SKIP LOCKED, so several processes can send
+        the same edition in parallel without sending a message twice
+      - record() stores the outcome of every claimed row and commits, which releases the locks
+    A crashed run leaves its rows pending and the next run resumes from there; only the chunk being sent at
+    the crash can go out twice. Transient failures are retried after a backoff, up to MAX_ATTEMPTS sends:
+    a run waits for the retries due within MAX_RETRY_WAIT (seconds_until_due()) and the next run picks up
+    the rest, of whichever edition (pending_editions()). Permanent failures are marked 'failed' and are only
+    sent again after retry_failed().
+    """
+
+    def __init__(self, conn, delivery_table, newsletter_table, subscriber_table):
+        self.conn = conn
+        self.table = delivery_table
+        self.subscriber_table = subscriber_table
+        c = conn.cursor()
+        # Parallel senders may start together; concurrent CREATE TABLE IF NOT EXISTS can still collide
+        c.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (delivery_table,))
+        c.execute(f"""
+            CREATE TABLE IF NOT EXISTS {delivery_table} (
+                newsletter_id INTEGER NOT NULL REFERENCES {newsletter_table} (newsletter_id) ON DELETE CASCADE,
+                subscriber_id INTEGER NOT NULL REFERENCES {subscriber_table} (subscriber_id) ON DELETE CASCADE,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                next_attempt_at TIMESTAMPTZ,
+                sent_at TIMESTAMPTZ,
+                PRIMARY KEY (newsletter_id, subscriber_id)
+            );
+            CREATE INDEX IF NOT EXISTS {delivery_table}_pending_idx ON {delivery_table} (newsletter_id, subscriber_id)
+            WHERE status = 'pending';
+        """)
+        conn.commit()
+        c.close()
+
+    def enqueue(self, newsletter_id):
+        """
+        Add a pending delivery for every subscriber who has none for this edition yet; returns how many.
+        """
+        c = self.conn.cursor()
+        c.execute(f"""
+            INSERT INTO {self.table} (newsletter_id, subscriber_id)
+            SELECT %s, subscriber_id FROM {self.subscriber_table}
+            ON CONFLICT DO NOTHING;
+        """, (newsletter_id,))
+        added = c.rowcount
+        self.conn.commit()
+        c.close()
+        return added
+
+    def claim(self, newsletter_id, limit=CLAIM_SIZE):
+        """
+        Lock up to `limit` due pending deliveries, skipping rows other workers hold. Returns the subscriber
+        rows (subscriber_id, email, preferences); the transaction stays open until record().
+        """
+        c = self.conn.cursor()
+        c.execute(f"""
+            SELECT s.subscriber_id, s.email, s.preferences
+            FROM {self.table} d
+            JOIN {self.subscriber_table} s USING (subscriber_id)
+            WHERE d.newsletter_id = %s AND d.status = 'pending'
+              AND (d.next_attempt_at IS NULL OR d.next_attempt_at <= now())
+            ORDER BY d.subscriber_id
+            LIMIT %s
+            FOR UPDATE OF d SKIP LOCKED;
+        """, (newsletter_id, limit))
+        rows = c.fetchall()
+        c.close()
+        return rows
+
+    def record(self, newsletter_id, outcomes):
+        """
+        Store (subscriber_id, None or the error that failed the send) outcomes of claimed rows and commit.
+        Claimed rows without an outcome stay pending and are released as they were.
+        """
+        c = self.conn.cursor()
+        if outcomes:
+            values = [(newsletter_id, subscriber_id, None if error is None else str(error)[:500],
+                       error is not None and is_transient(error))
+                      for subscriber_id, error in outcomes]
+            psycopg2.extras.execute_values(c, f"""
+                UPDATE {self.table} AS d
+                SET status = CASE WHEN v.error IS NULL THEN 'sent'
+                                  WHEN v.transient AND d.attempts + 1 < {MAX_ATTEMPTS} THEN 'pending'
+                                  ELSE 'failed' END,
+                    attempts = d.attempts + 1,
+                    last_error = v.error,
+                    sent_at = CASE WHEN v.error IS NULL THEN now() END,
+                    next_attempt_at = CASE WHEN v.transient AND d.attempts + 1 < {MAX_ATTEMPTS}
+                                           THEN now() + (d.attempts + 1) * interval '{RETRY_DELAY}' END
+                FROM (VALUES %s) AS v (newsletter_id, subscriber_id, error, transient)
+                WHERE d.newsletter_id = v.newsletter_id AND d.subscriber_id = v.subscriber_id;
+            """, values, template="(%s, %s, %s::text, %s)", page_size=len(values))
+        self.conn.commit()
+        c.close()
+
+    def seconds_until_due(self, newsletter_ids):
+        """
+        Seconds until the next pending delivery of these editions comes due for a retry, or None if none waits
+        for one. Rows that are already due but were not claimed are held by another process, which sends them.
+        """
+        c = self.conn.cursor()
+        c.execute(f"""
+            SELECT EXTRACT(EPOCH FROM min(next_attempt_at) - now()) AS wait
+            FROM {self.table}
+            WHERE newsletter_id = ANY(%s) AND status = 'pending' AND next_attempt_at > now();
+        """, (list(newsletter_ids),))
+        wait = c.fetchone()["wait"]
+        self.conn.commit()
+        c.close()
+        return None if wait is None else float(wait)
+
+    def pending_editions(self):
+        """
+        Ids of the editions that still have pending deliveries, oldest first.
+        """
+        c = self.conn.cursor()
+        c.execute(f"SELECT DISTINCT newsletter_id FROM {self.table} WHERE status = 'pending' ORDER BY newsletter_id;")
+        edition_ids = [row["newsletter_id"] for row in c.fetchall()]
+        self.conn.commit()
+        c.close()
+        return edition_ids
+
+    def retry_failed(self, newsletter_id):
+        """
+        Put the failed deliveries of an edition back in the queue with a fresh attempt count; returns how many.
+        """
+        c = self.conn.cursor()
+        c.execute(f"""
+            UPDATE {self.table} SET status = 'pending', attempts = 0, next_attempt_at = NULL
+            WHERE newsletter_id = %s AND status = 'failed';
+        """, (newsletter_id,))
+        reset = c.rowcount
+        self.conn.commit()
+        c.close()
+        return reset
+
+    def counts(self, newsletter_id):
+        c = self.conn.cursor()
+        c.execute(f"SELECT status, count(*) AS n FROM {self.table} WHERE newsletter_id = %s GROUP BY status;",
+                  (newsletter_id,))
+        counts = {row["status"]: row["n"] for row in c.fetchall()}
+        c.close()
+        return counts
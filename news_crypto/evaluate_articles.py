@@ -5,10 +5,111 @@ import psycopg2.extras
 import os
 from urllib.parse import urlparse
 from dotenv import load_dotenv
+from batch_jobs import BatchRunner, create_backend
+from llm_cache import open_cache
+from influence_model import InfluenceModel
 
 # Load environment variables
 load_dotenv()
 
+# Offline mode (LLM_BATCH_BACKEND=openai|local): requests go through the Batch API instead
+BATCH_JOBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".batch_jobs")
+# Bump when the meaning of the score answers changes, so cached answers are not reused (see llm_cache.py)
+SCORING_PROMPT_VERSION = 1
+
+
+def evaluation_request(title, summary):
+    """
+    Keyword arguments for chat.completions.create that score one article; shared by the synchronous
+    path and the offline batch files.
+    """
+    return {
+        "model": "gpt-3.5-turbo",
+        "messages": [{
+            "role": "user",
+            "content": (
+                f"Evaluate the potential influential factor or popularity of the article titled '{title}' with the summary: {summary}. "
+                "Consider the following criteria: "
+                "1. Market Impact Potential (MIP, 35%): Does the news likely affect crypto prices, trading volume, or investor behavior? Look for big financial stakes, sentiment shifts (FUD/FOMO), or adoption signals. "
+                "2. Scandal or Controversy Factor (SCF, 25%): Is there drama, loss, or ethical breaches? Check for large-scale losses, notable figures, or legal fallout. "
+                "3. Technological Innovation Significance (TIS, 15%): Does it introduce or impact blockchain tech? Assess novelty, scalability, or ecosystem relevance. "
+                "4. Regulatory or Policy Influence (RPI, 15%): Does it shape laws or government actions? Evaluate jurisdictional scope, precedent, or clarity. "
+                "5. Social Buzz and Virality (SBV, 5%): Will it spark online discussion? Look for emotional hooks, community ties, or shareability. "
+                "6. Long-Term Industry Impact (LTI, 5%): Does it alter the sector's future? Consider structural changes, narrative shifts, or stakeholder effects. "
+                "Evaluate the crypto/blockchain news article's influence/popularity using these criteria. Return a score between 0 and 1 with 2 digits, without extra text."
+            )
+        }],
+        "max_tokens": 50,
+        "temperature": 0.1,
+    }
+
+
+def fetch_pending_articles(cursor):
+    # Claim the categorized articles that have not been scored yet (partial index on scored_at)
+    # categorizationLLM.py scores articles in the same pass, so this only finds rows categorized before that
+    # or by the local pre-classifier. Scoring does not use the publication date, so rows whose date could not be
+    # parsed are scored too instead of staying pending forever
+    cursor.execute("""
+        SELECT news_id, title, summary, main_category, keywords, base_url
+        FROM crypto_news
+        WHERE scored_at IS NULL
+          AND categorized_at IS NOT NULL
+          AND title IS NOT NULL
+          AND summary IS NOT NULL
+    """)
+    return cursor.fetchall()
+
+
+def score_with_model(conn, articles, model):
+    """
+    Score, in one vectorized pass and one UPDATE, the articles the local influence model is confident
+    about (score_source = 'model'), and return the others, which still go to the LLM.
+    """
+    if model is None or not articles:
+        return articles
+    scores, spread = model.predict(articles)
+    confident = spread <= model.max_std
+    updates = [(article['news_id'], round(float(score), 2))
+               for article, score, ok in zip(articles, scores, confident) if ok]
+    if updates:
+        cursor = conn.cursor()
+        psycopg2.extras.execute_values(cursor, """
+            UPDATE crypto_news AS n
+            SET InfluentialFactor = v.score, score_source = 'model', scored_at = now()
+            FROM (VALUES %s) AS v (news_id, score)
+            WHERE n.news_id = v.news_id AND n.scored_at IS NULL;
+        """, updates, template="(%s, %s::real)", page_size=len(updates))
+        conn.commit()
+        cursor.close()
+    print(f"🧮 Influence model (max std {model.max_std:.2f}): {len(updates)} of {len(articles)} articles "
+          f"scored locally, {len(updates) / len(articles):.0%} of LLM calls saved")
+    return [article for article, ok in zip(articles, confident) if not ok]
+
+
+def evaluate_articles_offline(conn, backend):
+    """
+    Offline mode: collect the finished scoring batches, then submit the articles that are still pending,
+    not already in an open batch and not scored by the local influence model. Scores are only written to rows that are still unscored, so
+    re-applying a batch changes nothing.
+    """
+    runner = BatchRunner(conn, "crypto_batch_job", "scoring", backend)
+
+    def apply(cursor, news_id, content):
+        cursor.execute("""
+            UPDATE crypto_news
+            SET InfluentialFactor = %s, scored_at = now()
+            WHERE news_id = %s AND scored_at IS NULL
+        """, (float(content.strip()), news_id))
+
+    applied = runner.collect(apply)
+    in_flight = runner.open_news_ids()
+    articles = [article for article in fetch_pending_articles(conn.cursor()) if article['news_id'] not in in_flight]
+    articles = score_with_model(conn, articles, InfluenceModel.load())
+    if articles:
+        runner.submit([(article['news_id'], evaluation_request(article['title'], article['summary'])) for article in articles])
+    print(f"📊 Applied {applied} scores, submitted {len(articles)} articles, {len(in_flight)} still in flight")
+
+
 def evaluate_articles():
     # Get DATABASE_URL from environment
     db_url = os.environ.get("DATABASE_URL")
@@ -32,24 +133,24 @@ def evaluate_articles():
     )
     cursor = conn.cursor()
 
-    # Query articles that have Title, summary, Publication_Date but no InfluentialFactor set
-    cursor.execute("""
-        SELECT news_id, title, summary
-        FROM crypto_news
-        WHERE title IS NOT NULL
-          AND summary IS NOT NULL
-          AND publication_date IS NOT NULL
-          AND influentialfactor IS NULL
-    """)
-
-    articles = cursor.fetchall()
-    print(f"Fetched {len(articles)} articles for evaluation.")
-
     # Get API key from environment variable
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
         raise ValueError("OpenAI API key not found in environment variables")
 
+    batch_backend = os.environ.get("LLM_BATCH_BACKEND")
+    if batch_backend:
+        client = openai.OpenAI(api_key=api_key)
+        evaluate_articles_offline(conn, create_backend(batch_backend, os.environ.get("LLM_BATCH_DIR", BATCH_JOBS_DIR), client=client))
+        conn.close()
+        return
+
+    articles = fetch_pending_articles(cursor)
+    print(f"Fetched {len(articles)} articles for evaluation.")
+    # Articles the local influence model is confident about are scored without an API call
+    articles = score_with_model(conn, articles, InfluenceModel.load())
+    llm_cache = open_cache("crypto_llm_cache", label="LLM response")
+
     for article in articles:
         news_id = article['news_id']
         title = article['title']
@@ -60,29 +161,11 @@ def evaluate_articles():
             # Create the client with API key
             client = openai.OpenAI(api_key=api_key)
             
-            # Make the API call
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{
-                    "role": "user",
-                    "content": (
-                        f"Evaluate the potential influential factor or popularity of the article titled '{title}' with the summary: {summary}. "
-                        "Consider the following criteria: "
-                        "1. Market Impact Potential (MIP, 35%): Does the news likely affect crypto prices, trading volume, or investor behavior? Look for big financial stakes, sentiment shifts (FUD/FOMO), or adoption signals. "
-                        "2. Scandal or Controversy Factor (SCF, 25%): Is there drama, loss, or ethical breaches? Check for large-scale losses, notable figures, or legal fallout. "
-                        "3. Technological Innovation Significance (TIS, 15%): Does it introduce or impact blockchain tech? Assess novelty, scalability, or ecosystem relevance. "
-                        "4. Regulatory or Policy Influence (RPI, 15%): Does it shape laws or government actions? Evaluate jurisdictional scope, precedent, or clarity. "
-                        "5. Social Buzz and Virality (SBV, 5%): Will it spark online discussion? Look for emotional hooks, community ties, or shareability. "
-                        "6. Long-Term Industry Impact (LTI, 5%): Does it alter the sector's future? Consider structural changes, narrative shifts, or stakeholder effects. "
-                        "Evaluate the crypto/blockchain news article's influence/popularity using these criteria. Return a score between 0 and 1 with 2 digits, without extra text."
-                    )
-                }],
-                max_tokens=50,
-                temperature=0.1
-            )
+            # Make the API call, unless an identical request was answered before
+            request = evaluation_request(title, summary)
 
             # Extract the score from the response
-            factor_str = response.choices[0].message.content.strip()
+            factor_str = llm_cache.complete(client, request, SCORING_PROMPT_VERSION).strip()
             
             try:
                 influential_factor = float(factor_str)
@@ -91,18 +174,20 @@ def evaluate_articles():
                 # Update the database with the score
                 cursor.execute("""
                     UPDATE crypto_news
-                    SET InfluentialFactor = %s
+                    SET InfluentialFactor = %s, scored_at = now()
                     WHERE news_id = %s
                 """, (influential_factor, news_id))
                 conn.commit()
                 
             except ValueError:
                 print(f"❌ Invalid score format: '{factor_str}' for article: {title}")
+                llm_cache.discard(request, SCORING_PROMPT_VERSION)
         
         except Exception as e:
             print(f"❌ Error with OpenAI API for article '{title}': {e}")
 
     conn.close()
+    llm_cache.close()
     print("✅ Evaluation process completed.")
 
 # Example usage
@@ -7,11 +7,21 @@ from urllib.parse import urlparse, quote
 import psycopg2
 import psycopg2.extras
 from dotenv import load_dotenv
+from llm_cache import open_cache
+from segments import segment_articles, segment_key
+from newsletter_images import DEFAULT_IMAGE_MODE, IMAGE_MODES, image_cid, image_url
+from newsletter_templates import get_template
 
 
 # Load environment variables
 load_dotenv()
 
+# Bump when the meaning of the newsletter answers changes, so cached answers are not reused (see llm_cache.py)
+NEWSLETTER_PROMPT_VERSION = 1
+# Best articles of the edition's window that preference segments pick their articles from
+SEGMENT_CANDIDATES = 30
+
+
 class NewsletterGenerator:
     """
     A class to:
@@ -21,7 +31,7 @@ class NewsletterGenerator:
       4) Render the newsletter HTML from DB data (so no repeated LLM calls).
     """
 
-    def __init__(self, db_config=None, days_from_now: int = 2, api_key=None):
+    def __init__(self, db_config=None, days_from_now: int = 2, api_key=None, image_mode: str = DEFAULT_IMAGE_MODE):
         """
         Initialize the NewsletterGenerator with database configuration and time range.
         
@@ -29,6 +39,7 @@ class NewsletterGenerator:
         db_config (dict, optional): Database configuration. If not provided, uses DATABASE_URL from environment.
         days_from_now (int): Number of days to look back for articles.
         api_key (str, optional): OpenAI API key. If not provided, uses OPENAI_API_KEY from environment.
+        image_mode (str): How the HTML references its images, one of newsletter_images.IMAGE_MODES.
         """
         # If db_config is not provided, use DATABASE_URL from environment
         if db_config is None:
@@ -60,6 +71,10 @@ class NewsletterGenerator:
             connect_timeout=30
         )
         self.days_from_now = days_from_now
+        if image_mode not in IMAGE_MODES:
+            raise ValueError(f"Unknown image mode {image_mode!r}, expected one of {IMAGE_MODES}")
+        self.image_mode = image_mode
+        self.template = get_template("newsletter/edition.html")
         self.current_date = datetime.now()
         self.start_date = self.current_date - timedelta(days=self.days_from_now)
         
@@ -128,6 +143,16 @@ class NewsletterGenerator:
         """
         return self.base64_images.get(image_key)
 
+    def image_src(self, image_key: str) -> str:
+        """
+        The img src of an image in the configured image mode (see newsletter_images.py).
+        """
+        if self.image_mode == "cid":
+            return f"cid:{image_cid(image_key)}"
+        if self.image_mode == "url":
+            return image_url(image_key)
+        return f"data:image/png;base64,{self.get_image_data(image_key)}"
+
     def fetch_top_articles(self):
         """
         Fetch top 5 articles from 'news' table based on InfluentialFactor
@@ -174,7 +199,9 @@ class NewsletterGenerator:
             print("[DEBUG] Sending request for newsletter introduction to OpenAI...")
             client = openai.OpenAI(api_key=self.api_key)
             
-            intro_response = client.chat.completions.create(
+            llm_cache = open_cache("crypto_llm_cache", label="LLM response")
+            # Re-generating the same edition (same articles) reuses the cached answers
+            intro_text = llm_cache.complete(client, dict(
                 model="gpt-3.5-turbo",
                 messages=[{
                     "role": "user",
@@ -195,16 +222,16 @@ class NewsletterGenerator:
                 }],
                 max_tokens=800,
                 temperature=0.7
-            )
+            ), NEWSLETTER_PROMPT_VERSION)
 
             # Parse JSON from the LLM response 
             try:
-                parsed_content = json.loads(intro_response.choices[0].message.content.strip())
+                parsed_content = json.loads(intro_text.strip())
                 self.introduction = parsed_content.get("introduction", "No introduction found.")
                 self.newsletter_title = parsed_content.get("newsletter_title", "No title found.")
             except json.JSONDecodeError:
                 # If the response isn't valid JSON, fallback to the entire string
-                text_content = intro_response.choices[0].message.content.strip()
+                text_content = intro_text.strip()
                 self.introduction = text_content
                 self.newsletter_title = "Untitled Newsletter"
 
@@ -220,7 +247,7 @@ class NewsletterGenerator:
             top_article = ":".join([very_top_title, very_top_article_text])
 
             print("[DEBUG] Sending request for top news summary to OpenAI...")
-            top_news_response = client.chat.completions.create(
+            top_news_text = llm_cache.complete(client, dict(
                 model="gpt-3.5-turbo",
                 messages=[{
                     "role": "user",
@@ -233,8 +260,9 @@ class NewsletterGenerator:
                 }],
                 max_tokens=600,
                 temperature=0.7
-            )
-            self.very_top_news = top_news_response.choices[0].message.content.strip()
+            ), NEWSLETTER_PROMPT_VERSION)
+            self.very_top_news = top_news_text.strip()
+            llm_cache.close()
             print("[DEBUG] Top news summary:", self.very_top_news)
             
         except Exception as e:
@@ -315,6 +343,94 @@ class NewsletterGenerator:
             print(f"[WARNING] No newsletter data found.")
             return
 
+        newsletter_id=row['newsletter_id']
+        creation=row['creation']
+        final_html = self.render_edition(row)
+
+        # 9) Write final HTML to file
+        with open(output_filename, "w", encoding="utf-8") as f:
+            f.write(final_html)
+
+        print(f"[DEBUG] Successfully wrote simplified, mobile-responsive newsletter to '{output_filename}' for {creation}.")
+
+        print(f"[DEBUG] Newsletter HTML is {len(final_html.encode('utf-8'))} bytes with {self.image_mode} images.")
+
+        # 10) Save the generated HTML back into the DB
+        conn = self.conn
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE crypto_newsletter SET html = %s WHERE newsletter_id = %s",
+            (final_html, newsletter_id),
+        )
+        conn.commit()
+        print("[DEBUG] Updated newsletter record with generated HTML.")
+
+        # 11) One variant per distinct subscriber preference set
+        self.render_segment_variants(row, final_html)
+
+
+    def render_segment_variants(self, row, default_html):
+        """
+        Renders the edition once per distinct preference set of the subscribers (segment_key) instead of
+        once per subscriber: the segment's categories fill the article slots first, the introduction and
+        top news stay the edition's. Renders are memoized by article selection, so segments that end up
+        with the edition's own articles reuse its HTML and are not stored. The other variants replace the
+        edition's rows in crypto_newsletter_variant; Newsletter_send maps each subscriber to one of them.
+        """
+        conn = self.conn
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS crypto_newsletter_variant (
+                newsletter_id INTEGER NOT NULL REFERENCES crypto_newsletter (newsletter_id) ON DELETE CASCADE,
+                segment_key TEXT NOT NULL,
+                selected_news_id TEXT,
+                html TEXT,
+                PRIMARY KEY (newsletter_id, segment_key)
+            );
+        """)
+        cursor.execute("SELECT DISTINCT preferences FROM crypto_subscriber WHERE preferences IS NOT NULL AND preferences <> ''")
+        keys = sorted({segment_key(subscriber['preferences']) for subscriber in cursor.fetchall()} - {""})
+
+        # Candidates: the best articles of the edition's date window (same index as fetch_top_articles)
+        window_start = datetime.fromisoformat(str(row['creation'])) - timedelta(days=self.days_from_now)
+        cursor.execute("""
+            SELECT news_id, main_category
+            FROM crypto_news
+            WHERE influentialfactor IS NOT NULL
+              AND publication_date >= %s
+            ORDER BY influentialfactor DESC
+            LIMIT %s
+        """, (window_start.strftime("%Y-%m-%d"), SEGMENT_CANDIDATES))
+        candidates = cursor.fetchall()
+
+        edition_ids = [int(x) for x in row['selected_news_id'].split(",") if int(x) != row['top_news_id']]
+        renders = {frozenset(edition_ids): default_html}
+        variants = []
+        for key in keys:
+            selected_ids = segment_articles(key, candidates, row['top_news_id'], len(edition_ids))
+            # No candidates in the window (e.g. a re-render of an old edition): the edition as is
+            if not selected_ids or frozenset(selected_ids) == frozenset(edition_ids):
+                continue
+            if frozenset(selected_ids) not in renders:
+                renders[frozenset(selected_ids)] = self.render_edition(row, selected_ids)
+            variants.append((row['newsletter_id'], key, ",".join(str(x) for x in selected_ids), renders[frozenset(selected_ids)]))
+
+        cursor.execute("DELETE FROM crypto_newsletter_variant WHERE newsletter_id = %s", (row['newsletter_id'],))
+        if variants:
+            psycopg2.extras.execute_values(cursor, """
+                INSERT INTO crypto_newsletter_variant (newsletter_id, segment_key, selected_news_id, html) VALUES %s
+            """, variants)
+        conn.commit()
+        print(f"[DEBUG] {len(keys)} preference segments: {len(renders) - 1} extra renders, "
+              f"{len(keys) - len(variants)} segments get the edition as is.")
+
+
+    def render_edition(self, row, selected_ids=None):
+        """
+        Builds the inline-styled, mobile-responsive HTML of a newsletter record. selected_ids replaces
+        the record's article selection (preference segments, see render_segment_variants).
+        """
+        cursor = self.conn.cursor()
         newsletter_id=row['newsletter_id']
         selected_news_id_str = row['selected_news_id']
         newsletter_title=row['newsletter_title'] 
@@ -322,11 +438,13 @@ class NewsletterGenerator:
         top_news_id=row['top_news_id']
         top_news_text=row['top_news']
         edition_number=row['edition_number']
-        creation=row['creation']
 
-        # 2) Convert CSV string to list of ints, remove top news ID
+        # 2) Convert CSV string to list of ints (unless a segment's selection is given), remove top news ID
         
-        selected_ids = [int(x) for x in selected_news_id_str.split(",")]
+        if selected_ids is None:
+            selected_ids = [int(x) for x in selected_news_id_str.split(",")]
+        else:
+            selected_ids = list(selected_ids)
         print(f"[DEBUG] selected_ids before top remove are '{selected_ids}'")
         if top_news_id in selected_ids:
             selected_ids.remove(top_news_id)
@@ -345,13 +463,12 @@ class NewsletterGenerator:
             print(f"[WARNING] No top news article found for generate read estimation.")
             top_read_time = 0
 
-        # 4) Fetch remaining articles
-        placeholders = ",".join("%s" for _ in selected_ids)
-        cursor.execute(f"""
+        # 4) Fetch remaining articles (ANY instead of IN: an empty selection is valid SQL and fetches nothing)
+        cursor.execute("""
             SELECT news_id, title, publication_date, article, summary, link
             FROM crypto_news
-            WHERE news_id IN ({placeholders})
-        """, tuple(selected_ids))
+            WHERE news_id = ANY(%s)
+        """, (selected_ids,))
         articles = cursor.fetchall()
         print(f"[DEBUG] Fetched {len(articles)} additional articles:", [article['title'] for article in articles])
 
@@ -362,479 +479,43 @@ class NewsletterGenerator:
             date_only_str = str(self.current_date).split()[0]
 
 
-        # 7) Build inline-styled blocks
-        # HEAD Area using table layout with issue info (left) and share buttons (right), then the title below
+        # Share links of the edition
         share_url = f"https://www.ainewsletter.homesmartify.lu/crypto/newsletter/{newsletter_id}"
         encoded_share_url = quote(share_url)
         share_text = quote(f"Check out this amazing newsletter about Crypto & Blockchain! Issue #{newsletter_id}")
-        
-        head_area_html = f"""
-        <!-- HEAD Area Table -->
-        <table width="100%" border="0" cellspacing="0" cellpadding="0" 
-            style="background: rgba(255,255,255,0.0); border-radius:12px;">
-        <!-- Top row: Issue info (left) and share buttons (right) -->
-        <tr>
-            <td width="50%" align="left" style="font-family: 'Roboto Condensed', sans-serif; font-size: 13px; color: #555; padding:0 0 20px 0;">
-                Issue No.{newsletter_id} Edition {edition_number}<br>
-                Current Date: {date_only_str}
-            </td>
-            <td width="50%" align="right" style="padding:0 0 20px 0;">
-                <table border="0" cellspacing="0" cellpadding="0" align="right">
-                    <tr>
-                        <!-- Twitter Share Button -->
-                        <td align="center" style="padding:5px;">
-                            <a href="https://twitter.com/intent/tweet?url={encoded_share_url}&text={share_text}" 
-                            target="_blank" style="text-decoration:none; color:#333;">
-                            <img src="data:image/png;base64,{self.get_image_data('twitter')}" alt="Twitter" style="width:20px; height:20px; display:inline-block;">
-                            <span style="font-family:Arial, sans-serif; font-size:12px;">Twitter</span>
-                            </a>
-                        </td>
-                        <!-- Copy Link Button -->
-                        <td align="center" style="padding:5px;">
-                            <a href="{share_url}" target="_blank" style="text-decoration:none; color:#333;">
-                            <img src="data:image/png;base64,{self.get_image_data('link')}" alt="Copy Link" style="width:23px; height:23px; display:inline-block;">
-                            <span style="font-family:Arial, sans-serif; font-size:12px;">Copy Link</span>
-                            </a>
-                        </td>
-                        <!-- WhatsApp Share Button -->
-                        <td align="center" style="padding:5px;">
-                            <a href="https://api.whatsapp.com/send?text={share_text}%20{encoded_share_url}" target="_blank" style="text-decoration:none; color:#333;">
-                            <img src="data:image/png;base64,{self.get_image_data('whatsapp')}" alt="WhatsApp" style="width:20px; height:20px; display:inline-block;">
-                            <span style="font-family:Arial, sans-serif; font-size:12px;">WhatsApp</span>
-                            </a>
-                        </td>
-                    </tr>
-                </table>
-            </td>
-        </tr>
-        <!-- Second row: Newsletter title -->
-        <tr>
-            <td class="newsletter" colspan="2" align="center" 
-                style="font-family: 'Titan+One', sans-serif; letter-spacing: 2px; font-size:38px; color:#007AFF; text-transform:uppercase; padding:20px 0;">
-            CRYPTO & BLOCKCHAIN
-            </td>
-        </tr>
-        </table>
-        """
-
-        # Intro
-        intro_html = f"""
-        <div style="margin-bottom:20px;">
-        <h2 class="newsletter_title" style="
-            display:block;
-            font-family:'Poppins', sans-serif;
-            font-size:22px; 
-            color:#007AFF; 
-            margin:0 auto 20px auto; 
-            text-align:center; 
-            max-width:600px;
-        ">
-            {newsletter_title}
-        </h2>
-        <p class="newsletter_intro" style="
-            font-size:16px;
-            font-family:'Nunito', sans-serif;
-            color:#333; 
-            margin:0 30px 40px 30px; 
-            max-width:700px; 
-            text-align:left;
-        ">
-            {introduction}
-        </p>
-        </div>
-        """
-
-        # Article blocks
-        article_block_template = """
-        <div style="margin:0 20px; padding:10px;">
-        <h3 class="article-title" style="
-            font-size:20px;
-            font-family:'Poppins', sans-serif;
-            color:#34AADC; 
-            margin:10px 35px 10px 35px; 
-            text-align:center;
-        ">
-            {title}
-        </h3>
-        <p class="publication-date" style="
-            font-size:14px;
-            font-family:'Nunito', sans-serif;
-            color:#999;
-            text-align:center;
-            margin-bottom:10px;
-        ">
-            {article_publication_date}
-        </p>
-        <p class="article-summary" style="
-            font-family:'Nunito', sans-serif;
-            font-size:14px; 
-            color:#333333; 
-            margin-bottom:20px; 
-            text-align:left;
-        ">
-            {summary}
-        </p>
-        <div style="text-align:center;">
-            <a href="{link}" target="_blank" style="text-decoration:none;">
-            <button style="
-                padding:6px 12px; 
-                background:#007AFF; 
-                color:#ffffff; 
-                border:none; 
-                border-radius:20px; 
-                cursor:pointer;
-                font-size:12px;
-            ">
-                READ MORE ({read_time} mins)
-            </button>
-            </a>
-        </div>
-        </div>
-        """
-
-        article_blocks = ""
-        for article in articles: 
-            title=article['title']
-            article_publication_date=article['publication_date']
-            link=article['link'] 
-            summary=article['summary']
-            read_time = self.estimate_reading_time(title + article['article'])
-            article_blocks += article_block_template.format(
-                title=title,
-                article_publication_date=article_publication_date,
-                summary=summary,
-                link=link,
-                read_time=read_time
-            )
-        # Top News header
-        top_news_header_html = """
-        <div class="top-news-header">
-            TOP NEWS!
-        </div>
-        """
-
-        # Top news
-        top_news_html = f"""
-        <div style="margin:0 20px 30px 20px; padding:10px;">
-        <h3 class="top-news-title" style="
-            font-family:'Poppins', sans-serif;
-            font-size:20px; 
-            color:#34AADC; 
-            margin:0 35px 12px 35px; 
-            text-align:center;
-        ">
-            {top_title}
-        </h3>
-        <p class="publication-date" style="
-            font-size:14px;
-            font-family:'Nunito', sans-serif;
-            color:#999;
-            text-align:center;
-            margin-bottom:10px;
-        ">
-            {publication_date}
-        </p>
-        <p class="top-news-text" style="
-            font-family:'Nunito', sans-serif; 
-            font-size:14px; 
-            color:#333333; 
-            margin-bottom:20px; 
-            text-align:left;
-        ">
-            {top_news_text}
-        </p>
-        <div style="text-align:center;">
-            <a href="{top_link}" target="_blank" style="text-decoration:none;">
-            <button style="
-                padding:6px 12px; 
-                background:#007AFF; 
-                color:#fff; 
-                border:none; 
-                border-radius:20px; 
-                cursor:pointer;
-                font-size:12px;
-            ">
-                READ MORE ({top_read_time} mins)
-            </button>
-            </a>
-        </div>
-        </div>
-        """
-
-        # Redirect block
-        redirect_html = f"""
-        <div style="text-align:center; margin-top:20px;">
-        <p style="font-size:14px; font-family:'Poppins', sans-serif; color:#333; margin-bottom:10px;">
-            Feel free to visit our website for more news and smart technologies possibilities!
-        </p>
-        <a href="{share_url}" target="_blank" style="text-decoration:none;">
-            <button style="
-                padding:8px 16px; 
-                background:#007AFF; 
-                color:#fff; 
-                border:none; 
-                border-radius:20px; 
-                cursor:pointer; 
-                font-family:'Titan One', monospace; 
-                text-transform:uppercase; 
-                font-size:14px;
-            ">
-                Explore More
-            </button>
-        </a>
-        </div>
-        """
-
-        # Company logo
-        company_logo_html = f"""
-        <div class="logo-container">
-        <img src="data:image/png;base64,{self.get_image_data('company_logo')}" alt="Company Logo" class="company-logo-img" style="display:block; width:140px; max-width:140px; height:auto; margin:0 auto;">
-        </div>
-        """
-
-        # Contact icons
-        contact_html = f"""
-        <div class="contact-container" style="display:flex; align-items:center; justify-content:center; gap:15px; margin:20px 0;">
-            <div class="contact-item" style="display:flex; align-items:center; gap:5px;">
-                <img src="data:image/png;base64,{self.get_image_data('phone')}" alt="Phone" style="width:20px; height:20px; display:inline-block;">
-                <span style="font-size:14px;">{self.contact.get('contact_phone','')}</span>
-                <span style="font-size:14px;">|</span>
-            </div>
-            <div class="contact-item" style="display:flex; align-items:center; gap:5px;">
-                <img src="data:image/png;base64,{self.get_image_data('mail')}" alt="Email" style="width:20px; height:20px; display:inline-block;">
-                <span style="font-size:14px;">{self.contact.get('contact_mail','')}</span>
-                <span style="font-size:14px;">|</span>
-            </div>
-            <div class="contact-item" style="display:flex; align-items:center; gap:5px;">
-                <img src="data:image/png;base64,{self.get_image_data('web')}" alt="Website" style="width:20px; height:20px; display:inline-block;">
-                <span style="font-size:14px;">{self.contact.get('contact_web','')}</span>
-            </div>
-        </div>
-        """
-
-        subscribe_html = f"""
-        <div class="subscribe-container">
-        Update your email preferences or unsubscribe
-        <a href="https://www.ainewsletter.homesmartify.lu/crypto/management/?email={{EMAIL}}" target="_blank" rel="noopener nofollow">here</a>.
-        </div>
-        """
-
-        company_footer_html = """
-        <div class="footer-container">
-        &copy; 2025 HomeSmartify.lu<br>
-        Transforming Technology: Where Smart Technology Meets Caring Comfort.<br>
-        Luxembourg City, Luxembourg 1329
-        </div>
-        """
-
-        # 8) Combine everything into final HTML, adding a meta viewport and responsive CSS
-        final_html = f"""
-        <html lang="en">
-        <head>
-        <meta charset="utf-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Newsletter</title>
-        <style type="text/css">
-            /* Default Style */
-            .top-news-header {{
-                text-align: center;
-                color: #34C759;
-                font-family: 'Titan One', sans-serif;
-                font-size: 28px;
-                letter-spacing: 2px;
-                margin-bottom: 10px;
-            }}
-            .logo-container {{
-                text-align: center;
-                margin-bottom: 10px;
-            }}
-            .company-logo-img {{
-                display: block;
-                width: 140px;
-                max-width: 140px;
-                height: auto;
-                margin: 0 auto;
-            }}
-            .contact-container {{
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                gap: 15px;
-                margin: 20px 0;
-            }}
-            .contact-item {{
-                display: flex;
-                align-items: center;
-                gap: 5px;
-            }}
-            .contact-icon {{
-                width: 20px;
-                height: 20px;
-            }}
-            .contact-text {{
-                font-size: 14px;
-            }}
-            .subscribe-container {{
-                text-align: center;
-                font-size: 14px;
-                font-style: italic;
-                color: #666;
-                margin: 25px 0;
-            }}
-            .footer-container {{
-                text-align: center;
-                font-size: 12px;
-                color: #666;
-                margin-top: 20px;
-                line-height: 1.4;
-            }}
-
-            /* Mobile Styles */
-            @media only screen and (max-width: 600px) {{
-            /* Keep your layout the same; do NOT force the main table to width:100% */
-            /* Only override fonts for head-container and main-container */
-            .top-news-header {{
-                font-size: 36px !important;  
-            }}
-            .company-logo-img {{
-                width: 150px !important;
-                max-width: 150px !important;
-            }}
-            .contact-container {{
-                flex-direction: column;
-                gap: 10px;
-            }}
-            .contact-text {{
-                font-size: 20px !important;
-            }}
-            .contact-icon {{
-                width: 30px;
-                height: 30px;
-            }}
-            .subscribe-container {{
-                font-size: 20px !important;
-            }}
-            .footer-container {{
-                font-size: 18px !important;
-            }}
-            .head-container * {{
-                /* +4px from your original, adjust as needed */
-                font-size: 26px;
-            }}
-            .main-container * {{    
-                font-size: 26px !important; /* Consistent font size for main container */
-            }}
-            .newsletter_title {{
-                font-size: 36px !important;
-                margin:0 30px 20px 30px !important;
-            }}
-            .newsletter_intro {{
-                font-size: 28px !important;
-            }}
-            .article-title {{
-                font-size: 32px !important;
-            }}
-            .article-summary {{ 
-                font-size: 26px !important; /* Example addition for article summary styling */
-            }}
-            .top-news-title {{ 
-                font-size: 32px !important; /* Example addition for top news title styling */
-            }}
-            .top-news-text {{
-                font-size: 26px !important; /* Example addition for top news text styling */
-            }}
-            .newsletter {{ 
-                font-size: 45px !important; /* Example addition for newsletter styling */
-            }}
-            .issue-info-block * {{
-                font-size: 26px !important; 
-            }}
-            /* Enlarge images by 50% (width) within .issue-info-block */
-            .issue-info-block img {{
-                width: 40px !important; 
-                height: auto !important; /* maintain aspect ratio */
-            }}
-        }}
-        </style>
-        </head>
-        <body style="margin:0; padding:0; background:linear-gradient(135deg, #add8e6, #ffffe0); font-family:Arial, sans-serif;">
-
-        <!-- Outer table for full width background -->
-        <table width="100%" border="0" cellspacing="0" cellpadding="0" align="center" style="background: linear-gradient(135deg, #add8e6, #ffffe0);">
-            <tr>
-            <td align="center" valign="top">
-
-                <!-- Nested table to constrain width & center the newsletter -->
-                <table width="600" border="0" cellspacing="0" cellpadding="0" align="center" style="border-spacing:0; border-collapse:collapse;">
-                <tr>
-                    <td align="center" valign="top" style="padding:20px;">
-
-                    <!-- HEAD Container -->
-                    <table class="head-container" width="100%" border="0" cellspacing="0" cellpadding="0" align="center"
-                            style="background: rgba(255,255,255,0.3); border-radius:12px; margin-bottom:20px;">
-                        <tr>
-                        <td style="padding:20px;">
-                            {head_area_html}
-                        </td>
-                        </tr>
-                    </table>
-
-                    <!-- MAIN Container -->
-                    <table class="main-container" width="100%" border="0" cellspacing="0" cellpadding="0" align="center"
-                            style="background: rgba(255,255,255,0.3); border-radius:12px; margin-bottom:20px;">
-                        <tr>
-                        <td style="padding:20px;">
-                            {intro_html}
-                            <hr style="border:none; border-top:2px solid #5AC8FA; margin:20px 0;">
-                            {article_blocks}
-                            <hr style="border:none; border-top:2px solid #5AC8FA; margin:40px 0;">
-                            {top_news_header_html}
-                            {top_news_html}
-                            {redirect_html}
-                        </td>
-                        </tr>
-                    </table>
-
-                    <!-- TAIL Container -->
-                    <table class="tail-container" width="100%" border="0" cellspacing="0" cellpadding="0" align="center"
-                            style="background: rgba(255,255,255,0.3); border-radius:12px;">
-                        <tr>
-                        <td style="padding:20px;">
-                            {company_logo_html}
-                            {contact_html}
-                            {subscribe_html}
-                            {company_footer_html}
-                        </td>
-                        </tr>
-                    </table>
-
-                    </td>
-                </tr>
-                </table>
-
-            </td>
-            </tr>
-        </table>
-
-        </body>
-        </html>
-        """
-
-        # 9) Write final HTML to file
-        with open(output_filename, "w", encoding="utf-8") as f:
-            f.write(final_html)
-
-        print(f"[DEBUG] Successfully wrote simplified, mobile-responsive newsletter to '{output_filename}' for {creation}.")
 
-        # 10) Save the generated HTML back into the DB
-        conn = self.conn
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE crypto_newsletter SET html = %s WHERE newsletter_id = %s",
-            (final_html, newsletter_id),
+        # 6) Values of the article blocks
+        article_context = [
+            {
+                "title": article['title'],
+                "publication_date": article['publication_date'],
+                "summary": article['summary'],
+                "link": article['link'],
+                "read_time": self.estimate_reading_time(article['title'] + article['article']),
+            }
+            for article in articles
+        ]
+        top_context = None
+        if top_row:
+            top_context = {"title": top_title, "publication_date": publication_date, "text": top_news_text,
+                           "link": top_link, "read_time": top_read_time}
+
+        # 7) Render the compiled template (templates/newsletter/edition.html, see newsletter_templates.py)
+        final_html = self.template.render(
+            newsletter_id=newsletter_id,
+            edition_number=edition_number,
+            date=date_only_str,
+            newsletter_title=newsletter_title,
+            introduction=introduction,
+            articles=article_context,
+            top=top_context,
+            image_src=self.image_src,
+            contact=self.contact,
+            share_url=share_url,
+            encoded_share_url=encoded_share_url,
+            share_text=share_text,
         )
-        conn.commit()
-        print("[DEBUG] Updated newsletter record with generated HTML.")
+        return final_html
 
 
     
@@ -0,0 +1,90 @@
+import html
+import lxml.html
+from lxml import etree
+
+
+# Rough token estimate for HTML with the OpenAI tokenizers (tiktoken is not a dependency)
+CHARS_PER_TOKEN = 4
+DEFAULT_CHUNK_TOKENS = 6000
+# Oversized elements nested deeper than this are split as plain text instead
+MAX_SPLIT_DEPTH = 200
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _text(value):
+    return html.escape(value, quote=False) if value and value.strip() else ""
+
+
+def _split_text(text, max_chars):
+    return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+
+def _pieces(element, max_chars, depth=0):
+    """
+    Serialized pieces of an element, each at most max_chars long. An element that fits is one piece;
+    a larger one is opened up and its children become pieces, so cuts fall on element boundaries
+    (the article containers of a listing page) rather than in the middle of an article.
+    """
+    serialized = lxml.html.tostring(element, encoding="unicode", with_tail=False)
+    if len(serialized) <= max_chars:
+        return [serialized]
+    if depth >= MAX_SPLIT_DEPTH or not len(element):
+        return _split_text(serialized, max_chars)
+    pieces = []
+    if _text(element.text):
+        pieces.extend(_split_text(_text(element.text), max_chars))
+    for child in element:
+        if isinstance(child.tag, str):
+            pieces.extend(_pieces(child, max_chars, depth + 1))
+        if _text(child.tail):
+            pieces.extend(_split_text(_text(child.tail), max_chars))
+    return pieces
+
+
+def chunk_html(cleaned_html, max_tokens=DEFAULT_CHUNK_TOKENS):
+    """
+    Split cleaned HTML into chunks of at most max_tokens (estimated), cutting between elements.
+    Consecutive small elements are packed together, so a page that fits the budget stays one chunk.
+    """
+    if not cleaned_html:
+        return []
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(cleaned_html) <= max_chars:
+        return [cleaned_html]
+    try:
+        root = lxml.html.document_fromstring(cleaned_html)
+    except (etree.ParserError, ValueError):
+        return _split_text(cleaned_html, max_chars)
+    body = root.find("body")
+
+    chunks = []
+    current = ""
+    for piece in _pieces(body if body is not None else root, max_chars):
+        if current and len(current) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def merge_articles(article_lists):
+    """
+    Merge the articles extracted from several chunks, de-duplicated by link.
+    When two chunks report the same link, missing fields of the first are filled in from the later one.
+    """
+    merged = {}
+    for articles in article_lists:
+        for article in articles:
+            link = article.get("Link")
+            if link not in merged:
+                merged[link] = dict(article)
+                continue
+            for key, value in article.items():
+                if value and not merged[link].get(key):
+                    merged[link][key] = value
+    return list(merged.values())
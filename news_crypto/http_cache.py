@@ -0,0 +1,82 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+
+
+def content_hash(content):
+    """
+    SHA-256 of a page body (bytes or str).
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+class HTTPCache:
+    """
+    On-disk cache of listing pages keyed by URL. Each entry is a small JSON file holding:
+      - etag / last_modified: validators sent back as If-None-Match / If-Modified-Since
+      - content_hash: hash of the raw body, to spot unchanged pages on servers without validators
+      - cleaned_html: the cleaned HTML, reused when the page did not change
+    put() only stages an entry; commit() writes the staged entries once the page's articles are stored.
+    Until then the previous entry stays current, so a run that fails after fetching a page does not
+    make the next run skip it as unchanged.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._staged = {}
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url):
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def conditional_headers(self, url):
+        """
+        Request headers that let the server answer 304 Not Modified.
+        """
+        entry = self.get(url) or {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url, body_hash, cleaned_html, etag=None, last_modified=None):
+        self._staged[url] = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_hash": body_hash,
+            "cleaned_html": cleaned_html,
+            "fetched_at": datetime.now().isoformat(),
+        }
+
+    def commit(self):
+        """
+        Write the staged entries; returns how many.
+        """
+        staged, self._staged = self._staged, {}
+        for url, entry in staged.items():
+            path = self._path(url)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        return len(staged)
+
+    def invalidate(self, url):
+        self._staged.pop(url, None)
+        try:
+            os.remove(self._path(url))
+        except FileNotFoundError:
+            pass
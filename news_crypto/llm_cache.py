@@ -0,0 +1,267 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from http_cache import content_hash
+
+
+DEFAULT_TTL_DAYS = 30
+DEFAULT_MAX_ENTRIES = 100000
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_cache.sqlite3")
+
+
+def request_key(request, prompt_version):
+    """
+    Content address of a chat.completions.create call: the hash of the prompt version and the full
+    request (model, messages, sampling parameters). The prompt version is bumped by a call site when
+    the meaning of its answers changes without the prompt text changing (e.g. new parsing rules).
+    """
+    return content_hash(json.dumps({"prompt_version": prompt_version, "request": request}, sort_keys=True))
+
+
+class SQLiteCacheStore:
+    """
+    Cache entries in a local SQLite file (WAL mode, so concurrent cron jobs can share it).
+    """
+
+    def __init__(self, path, table="llm_cache"):
+        self.table = table
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_used_idx ON {table} (last_used);")
+
+    def get(self, key, now):
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT content FROM {self.table} WHERE key = ? AND expires_at > ?;", (key, now)
+            ).fetchone()
+            if row:
+                self.conn.execute(f"UPDATE {self.table} SET last_used = ?, hits = hits + 1 WHERE key = ?;", (now, key))
+        return row[0] if row else None
+
+    def put(self, key, model, content, now, expires_at):
+        with self.lock:
+            self.conn.execute(f"""
+                INSERT INTO {self.table} (key, model, content, created_at, last_used, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET content = excluded.content, last_used = excluded.last_used,
+                                                expires_at = excluded.expires_at;
+            """, (key, model, content, now, now, expires_at))
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute(f"DELETE FROM {self.table} WHERE key = ?;", (key,))
+
+    def evict(self, now, max_entries):
+        with self.lock:
+            removed = self.conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?;", (now,)).rowcount
+            removed += self.conn.execute(f"""
+                DELETE FROM {self.table} WHERE key IN (
+                    SELECT key FROM {self.table} ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                );
+            """, (max_entries,)).rowcount
+        return removed
+
+    def close(self):
+        self.conn.close()
+
+
+class PostgresCacheStore:
+    """
+    Cache entries in a Postgres table, shared by every host that runs the pipeline. Uses its own
+    autocommit connection, so cache writes never mix with the caller's transactions.
+    """
+
+    def __init__(self, dsn, table="llm_cache"):
+        import psycopg2
+        self.table = table
+        self.lock = threading.Lock()
+        self.conn = psycopg2.connect(dsn)
+        self.conn.autocommit = True
+        with self.conn.cursor() as c:
+            c.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    content TEXT NOT NULL,
+                    created_at DOUBLE PRECISION NOT NULL,
+                    last_used DOUBLE PRECISION NOT NULL,
+                    expires_at DOUBLE PRECISION NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS {table}_last_used_idx ON {table} (last_used);
+            """)
+
+    def get(self, key, now):
+        with self.lock, self.conn.cursor() as c:
+            c.execute(f"""
+                UPDATE {self.table} SET last_used = %s, hits = hits + 1
+                WHERE key = %s AND expires_at > %s
+                RETURNING content;
+            """, (now, key, now))
+            row = c.fetchone()
+        return row[0] if row else None
+
+    def put(self, key, model, content, now, expires_at):
+        with self.lock, self.conn.cursor() as c:
+            c.execute(f"""
+                INSERT INTO {self.table} (key, model, content, created_at, last_used, expires_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (key) DO UPDATE SET content = EXCLUDED.content, last_used = EXCLUDED.last_used,
+                                                expires_at = EXCLUDED.expires_at;
+            """, (key, model, content, now, now, expires_at))
+
+    def delete(self, key):
+        with self.lock, self.conn.cursor() as c:
+            c.execute(f"DELETE FROM {self.table} WHERE key = %s;", (key,))
+
+    def evict(self, now, max_entries):
+        with self.lock, self.conn.cursor() as c:
+            c.execute(f"DELETE FROM {self.table} WHERE expires_at <= %s;", (now,))
+            removed = c.rowcount
+            c.execute(f"""
+                DELETE FROM {self.table} WHERE key IN (
+                    SELECT key FROM {self.table} ORDER BY last_used DESC OFFSET %s
+                );
+            """, (max_entries,))
+            removed += c.rowcount
+        return removed
+
+    def close(self):
+        self.conn.close()
+
+
+class LLMCache:
+    """
+    Content-addressed cache of LLM responses (see request_key), so that re-sending an identical
+    request, on a rerun or after a crash, is answered locally instead of paid for again.
+      - ttl_days: entries expire this long after they were written
+      - max_entries: on close(), the least recently used entries beyond this count are evicted
+    Hits and misses are counted per instance and reported by close(); every entry also counts its
+    own hits. With store=None the cache is disabled and every lookup is a miss.
+    """
+
+    def __init__(self, store=None, ttl_days=DEFAULT_TTL_DAYS, max_entries=DEFAULT_MAX_ENTRIES, label="LLM"):
+        self.store = store
+        self.ttl_seconds = ttl_days * 86400
+        self.max_entries = max_entries
+        self.label = label
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, request, prompt_version):
+        content = None
+        if self.store is not None:
+            try:
+                content = self.store.get(request_key(request, prompt_version), time.time())
+            except Exception as e:
+                print(f"⚠️ LLM cache lookup failed: {e}")
+        if content is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return content
+
+    def put(self, request, prompt_version, content):
+        if self.store is None or content is None:
+            return
+        now = time.time()
+        try:
+            self.store.put(request_key(request, prompt_version), request.get("model"), content, now, now + self.ttl_seconds)
+        except Exception as e:
+            print(f"⚠️ LLM cache write failed: {e}")
+
+    def discard(self, request, prompt_version):
+        """
+        Drop an entry whose answer turned out to be unusable, so the next run asks again.
+        """
+        if self.store is None:
+            return
+        try:
+            self.store.delete(request_key(request, prompt_version))
+        except Exception as e:
+            print(f"⚠️ LLM cache delete failed: {e}")
+
+    def complete(self, client, request, prompt_version):
+        """
+        Message content for one chat.completions.create request, from the cache when possible.
+        """
+        content = self.get(request, prompt_version)
+        if content is None:
+            response = client.chat.completions.create(**request)
+            content = response.choices[0].message.content
+            self.put(request, prompt_version, content)
+        return content
+
+    def complete_many(self, requests, prompt_version, complete):
+        """
+        Like complete() for a list of requests: only the misses are passed, in one call, to
+        complete(requests) -> [content or Exception], e.g. LLMDispatcher.run. Exceptions are not cached.
+        """
+        results = [self.get(request, prompt_version) for request in requests]
+        missing = [index for index, result in enumerate(results) if result is None]
+        if missing:
+            for index, result in zip(missing, complete([requests[index] for index in missing])):
+                if not isinstance(result, Exception):
+                    self.put(requests[index], prompt_version, result)
+                results[index] = result
+        return results
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def close(self):
+        """
+        Evict expired and least recently used entries, print the hit rate and release the store.
+        """
+        if self.store is None:
+            return
+        evicted = 0
+        try:
+            evicted = self.store.evict(time.time(), self.max_entries)
+        except Exception as e:
+            print(f"⚠️ LLM cache eviction failed: {e}")
+        self.store.close()
+        self.store = None
+        print(f"📊 {self.label} cache: {self.hits} hits, {self.misses} misses "
+              f"({self.hit_rate():.0%} hit rate), {evicted} entries evicted")
+
+
+def open_cache(table, label="LLM"):
+    """
+    LLMCache configured from the environment:
+      - LLM_CACHE_BACKEND: "sqlite" (default, file at LLM_CACHE_PATH), "postgres" (table in DATABASE_URL) or "off"
+      - LLM_CACHE_TTL_DAYS, LLM_CACHE_MAX_ENTRIES
+    A cache that cannot be opened is disabled rather than failing the run.
+    """
+    backend = os.environ.get("LLM_CACHE_BACKEND", "sqlite")
+    store = None
+    try:
+        if backend == "sqlite":
+            store = SQLiteCacheStore(os.environ.get("LLM_CACHE_PATH", CACHE_PATH), table)
+        elif backend == "postgres":
+            store = PostgresCacheStore(os.environ["DATABASE_URL"], table)
+        elif backend != "off":
+            raise ValueError(f"Unknown LLM_CACHE_BACKEND {backend!r} (expected 'sqlite', 'postgres' or 'off')")
+    except Exception as e:
+        print(f"⚠️ LLM cache disabled: {e}")
+    return LLMCache(
+        store,
+        ttl_days=float(os.environ.get("LLM_CACHE_TTL_DAYS", DEFAULT_TTL_DAYS)),
+        max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        label=label,
+    )
@@ -0,0 +1,165 @@
+import asyncio
+import random
+import re
+import time
+import openai
+from html_chunker import estimate_tokens
+
+
+# Errors worth retrying; everything else (bad request, auth, exhausted quota) fails immediately
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset(value):
+    """
+    Seconds until a rate limit resets, from OpenAI's "x-ratelimit-reset-*" format ("20ms", "1s", "6m0s").
+    """
+    if not value:
+        return 0.0
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in DURATION_PART.findall(value))
+
+
+class LLMDispatcher:
+    """
+    Runs many chat completions concurrently on one shared OpenAI client while staying within the
+    account's rate limits:
+      - max_concurrency: the number of requests in flight
+      - requests_per_minute / tokens_per_minute: token buckets that every request draws from before
+        it is sent (prompt estimate + max_tokens, which is what OpenAI counts against the limit)
+    The budgets start from the given values and follow the x-ratelimit-* response headers, so the
+    dispatcher adapts to the real limits of the key. 429s and transient errors are retried with
+    exponential backoff and jitter, and a 429 pauses all queued requests, not just the failed one.
+    """
+
+    def __init__(self, client, max_concurrency=8, requests_per_minute=500, tokens_per_minute=30000,
+                 max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self.retries = 0
+
+    def _refill(self, now):
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def _acquire(self, tokens, budget_lock):
+        # A request larger than the whole budget only waits for a full bucket
+        tokens = min(tokens, self.tokens_per_minute)
+        async with budget_lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._requests >= 1 and self._tokens >= tokens:
+                        self._requests -= 1
+                        self._tokens -= tokens
+                        return
+                    wait = max(
+                        (1 - self._requests) * 60 / self.requests_per_minute,
+                        (tokens - self._tokens) * 60 / self.tokens_per_minute,
+                    )
+                await asyncio.sleep(max(wait, 0.01))
+
+    def _observe(self, headers):
+        """
+        Align the local budgets with the x-ratelimit-* headers of a response.
+        """
+        limit_requests = headers.get("x-ratelimit-limit-requests")
+        limit_tokens = headers.get("x-ratelimit-limit-tokens")
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if limit_requests:
+            self.requests_per_minute = int(limit_requests)
+        if limit_tokens:
+            self.tokens_per_minute = int(limit_tokens)
+        if remaining_requests is not None:
+            self._requests = min(self._requests, float(remaining_requests))
+            if int(remaining_requests) == 0:
+                self._pause(parse_reset(headers.get("x-ratelimit-reset-requests")))
+        if remaining_tokens is not None:
+            self._tokens = min(self._tokens, float(remaining_tokens))
+            if int(remaining_tokens) == 0:
+                self._pause(parse_reset(headers.get("x-ratelimit-reset-tokens")))
+
+    def _backoff(self, attempt, error):
+        """
+        Delay before the next attempt: the server's retry-after if it sent one, otherwise exponential
+        backoff; both with jitter so that concurrent requests do not retry in lockstep.
+        """
+        response = getattr(error, "response", None)
+        headers = response.headers if response is not None else {}
+        if headers.get("retry-after-ms"):
+            delay = float(headers["retry-after-ms"]) / 1000
+        elif headers.get("retry-after"):
+            try:
+                delay = float(headers["retry-after"])
+            except ValueError:
+                delay = self.base_delay * 2 ** attempt
+        else:
+            delay = self.base_delay * 2 ** attempt
+        delay = min(delay, self.max_delay)
+        return delay + random.uniform(0, max(delay / 2, 1.0))
+
+    def _create(self, request):
+        raw = self.client.chat.completions.with_raw_response.create(**request)
+        return raw.headers, raw.parse()
+
+    async def _complete(self, request, limit, budget_lock):
+        tokens = sum(estimate_tokens(message.get("content") or "") for message in request["messages"])
+        tokens += request.get("max_tokens") or 0
+        async with limit:
+            for attempt in range(self.max_retries + 1):
+                await self._acquire(tokens, budget_lock)
+                try:
+                    headers, response = await asyncio.to_thread(self._create, request)
+                    content = response.choices[0].message.content
+                except RETRYABLE_ERRORS as e:
+                    if attempt == self.max_retries or getattr(e, "code", None) == "insufficient_quota":
+                        return e
+                    delay = self._backoff(attempt, e)
+                    if isinstance(e, openai.RateLimitError):
+                        response_headers = e.response.headers if getattr(e, "response", None) is not None else {}
+                        self._observe(response_headers)
+                        self._pause(delay)
+                    self.retries += 1
+                    print(f"⏳ {type(e).__name__}, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                    await asyncio.sleep(delay)
+                    continue
+                except Exception as e:
+                    return e
+                self._observe(headers)
+                # Refusals and content-filtered replies carry no content; fail only this request
+                if content is None:
+                    return ValueError(f"No content in reply (finish_reason {response.choices[0].finish_reason!r})")
+                return content.strip()
+
+    async def complete_all(self, requests):
+        """
+        Run every request (keyword arguments for chat.completions.create) and return, in the same order,
+        the stripped message content or the exception for requests that failed.
+        """
+        limit = asyncio.Semaphore(self.max_concurrency)
+        budget_lock = asyncio.Lock()
+        return await asyncio.gather(*(self._complete(request, limit, budget_lock) for request in requests))
+
+    def run(self, requests):
+        """
+        Synchronous entry point for callers that are not running an event loop.
+        """
+        return asyncio.run(self.complete_all(requests))
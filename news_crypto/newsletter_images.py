@@ -0,0 +1,98 @@
+import functools
+import io
+import os
+import re
+from email.mime.image import MIMEImage
+
+from PIL import Image
+
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+# Images of the newsletter HTML by key (generate_newsletter.py's image keys)
+IMAGE_FILES = {
+    "company_logo": "company_logo.png",
+    "twitter": "twitter.png",
+    "link": "link.png",
+    "whatsapp": "whatsapp.png",
+    "phone": "phone.png",
+    "mail": "mail.png",
+    "web": "web.png",
+}
+# How rendered newsletters reference their images:
+#   - "cid": src="cid:..."; Newsletter_send attaches each referenced image once as a related MIME part
+#   - "url": src pointing at the static files hosted by Newsletter_page (IMAGE_BASE_URL)
+#   - "inline": base64 data URIs in the HTML itself, as before (largest rows and messages)
+IMAGE_MODES = ("cid", "url", "inline")
+DEFAULT_IMAGE_MODE = os.environ.get("NEWSLETTER_IMAGE_MODE", "cid")
+IMAGE_BASE_URL = os.environ.get("NEWSLETTER_IMAGE_BASE_URL", "https://www.ainewsletter.homesmartify.lu/crypto/newsletter/static")
+CID_DOMAIN = "newsletter.homesmartify.lu"
+CID_REFERENCE = re.compile(r'cid:([\w-]+)@' + re.escape(CID_DOMAIN))
+# Width in pixels of the attached images: twice their display width in the newsletter, for high-density
+# screens. The static files are 512 px and more, far larger than an email needs.
+EMAIL_IMAGE_WIDTHS = {
+    "company_logo": 280,
+    "twitter": 40,
+    "link": 46,
+    "whatsapp": 40,
+    "phone": 40,
+    "mail": 40,
+    "web": 40,
+}
+
+
+def image_cid(image_key):
+    return f"{image_key}@{CID_DOMAIN}"
+
+
+def image_url(image_key, base_url=IMAGE_BASE_URL):
+    return f"{base_url.rstrip('/')}/{IMAGE_FILES[image_key]}"
+
+
+def cid_keys(html):
+    """
+    Keys of the images an HTML references by Content-ID, each once, in order of first use.
+    """
+    return list(dict.fromkeys(key for key in CID_REFERENCE.findall(html) if key in IMAGE_FILES))
+
+
+def email_image(image_key):
+    """
+    PNG bytes of an image scaled down to its EMAIL_IMAGE_WIDTHS width and reduced to a 256-colour palette.
+    """
+    with Image.open(os.path.join(STATIC_DIR, IMAGE_FILES[image_key])) as image:
+        image = image.convert("RGBA")
+    width = EMAIL_IMAGE_WIDTHS[image_key]
+    if image.width > width:
+        image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.quantize(256, method=Image.Quantize.FASTOCTREE).save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+@functools.lru_cache(maxsize=None)
+def image_part(image_key):
+    """
+    The inline MIME part of an image, built once per process and shared by every message that attaches it.
+    """
+    part = MIMEImage(email_image(image_key), "png")
+    part.add_header("Content-ID", f"<{image_cid(image_key)}>")
+    part.add_header("Content-Disposition", "inline", filename=IMAGE_FILES[image_key])
+    return part
+
+
+def attach_images(related, html):
+    """
+    Attach the images the HTML references by Content-ID to a multipart/related message; returns how many.
+    """
+    keys = cid_keys(html)
+    for image_key in keys:
+        related.attach(image_part(image_key))
+    return len(keys)
+
+
+def cid_to_url(html, base_url):
+    """
+    Point Content-ID image references at the hosted static files, for showing a stored newsletter in a browser.
+    """
+    return CID_REFERENCE.sub(lambda match: image_url(match.group(1), base_url)
+                             if match.group(1) in IMAGE_FILES else match.group(0), html)
@@ -0,0 +1,30 @@
+import functools
+import os
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+# Compiled templates, so a new process does not parse and compile them again
+BYTECODE_CACHE_DIR = os.environ.get(
+    "NEWSLETTER_TEMPLATE_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".jinja_cache"))
+
+
+@functools.lru_cache(maxsize=None)
+def template_environment():
+    """
+    The Jinja2 environment of the newsletter templates, created once per process. Templates are compiled on
+    first use and kept in memory (auto_reload is off, edits need a new process) and in the bytecode cache.
+    Values are HTML-escaped unless a template marks them safe.
+    """
+    os.makedirs(BYTECODE_CACHE_DIR, exist_ok=True)
+    return Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        autoescape=select_autoescape(["html"]),
+        bytecode_cache=FileSystemBytecodeCache(BYTECODE_CACHE_DIR),
+        auto_reload=False,
+    )
+
+
+def get_template(name):
+    return template_environment().get_template(name)
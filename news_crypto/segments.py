@@ -0,0 +1,68 @@
+import re
+
+
+# The categories subscribers choose from on the management page (stored comma-joined in
+# crypto_subscriber.preferences) and the main_category values categorizationLLM.py assigns
+PREFERENCE_CATEGORIES = [
+    "Market Trends & Investment Analysis",
+    "Regulatory & Policy Developments",
+    "Blockchain Technology & Infrastructure",
+    "Decentralized Ecosystem (DeFi, NFTs, dApps)",
+    "Security & Cybersecurity",
+    "Enterprise Adoption & Institutional Integration",
+    "Community, Culture & Thought Leadership",
+]
+LEADING_NUMBER = re.compile(r"^\s*\d+\.\s*")
+TRAILING_NOTE = re.compile(r"\s*\(.*\)\s*$")
+
+
+def category_name(label):
+    """
+    Comparable form of a category label: "4. Decentralized Ecosystem (DeFi, NFTs, dApps)" -> "decentralized ecosystem".
+    """
+    return TRAILING_NOTE.sub("", LEADING_NUMBER.sub("", label or "")).strip().lower()
+
+
+CATEGORY_NAMES = [category_name(category) for category in PREFERENCE_CATEGORIES]
+
+
+def category_number(main_category):
+    """
+    Number (1-based) of the preference category an article's main_category names, or None.
+    """
+    name = category_name(main_category)
+    if not name:
+        return None
+    for number, known in enumerate(CATEGORY_NAMES, 1):
+        if name == known:
+            return number
+    for number, known in enumerate(CATEGORY_NAMES, 1):
+        if known in name or name in known:
+            return number
+    return None
+
+
+def segment_key(preferences):
+    """
+    Canonical key of a subscriber's preference set: the sorted category numbers, e.g. "1,5". Labels are
+    matched rather than split on commas, since some contain commas themselves. No preference and every
+    category both mean the full edition, key "".
+    """
+    text = (preferences or "").lower()
+    numbers = [number for number, (label, name) in enumerate(zip(PREFERENCE_CATEGORIES, CATEGORY_NAMES), 1)
+               if label.lower() in text or name in text]
+    if len(numbers) == len(PREFERENCE_CATEGORIES):
+        return ""
+    return ",".join(str(number) for number in numbers)
+
+
+def segment_articles(key, candidates, exclude_id, count):
+    """
+    The `count` article ids a segment gets from candidates (rows with news_id and main_category, best
+    first): those in the segment's categories first, then the best of the rest.
+    """
+    preferred = {int(number) for number in key.split(",") if number}
+    candidates = [candidate for candidate in candidates if candidate['news_id'] != exclude_id]
+    ranked = ([candidate for candidate in candidates if category_number(candidate['main_category']) in preferred]
+              + [candidate for candidate in candidates if category_number(candidate['main_category']) not in preferred])
+    return [candidate['news_id'] for candidate in ranked[:count]]